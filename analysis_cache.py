@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from upload_index import sha256_file
+
+
+def normalize_prompt(text: str) -> str:
+    """去掉首尾空白并把连续空白折叠为一个空格"""
+    return ' '.join((text or '').split())
+
+
+def analysis_cache_key(files_paths: Dict, prompt_text: str, model_name: str) -> str:
+    """由输出图、各参考图 (按顺序) 的内容哈希以及规范化后的提示词和模型名生成缓存键"""
+    output = files_paths.get('output_image')
+    inputs = [p for p in (files_paths.get('input_images') or []) if p]
+    parts = {
+        'output': sha256_file(output) if output else '',
+        'inputs': [sha256_file(p) for p in inputs],
+        'prompt': normalize_prompt(prompt_text),
+        'model': normalize_prompt(model_name).lower(),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """持久化的智能分析结果缓存 (SQLite)，总大小超过 max_bytes 时按最近访问时间淘汰"""
+
+    def __init__(self, db_path: str, max_bytes: int):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_last_access ON analysis_results (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM analysis_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE analysis_results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, result: Dict[str, Any]):
+        # 预处理/去重统计只描述当次上传，不进入缓存
+        value = json.dumps({k: v for k, v in result.items() if k not in ('preprocess', 'dedup')}, ensure_ascii=False)
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analysis_results (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute(
+                "SELECT key, size FROM analysis_results ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM analysis_results WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_results").fetchone()
+            lookups = self.hits + self.misses
+            return {'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                    'evictions': self.evictions}
@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from analysis_cache import AnalysisCache, analysis_cache_key
+from config import ANALYSIS_WORKERS, ANALYSIS_MAX_PENDING_PER_USER, ANALYSIS_MAX_QUEUE, ANALYSIS_JOB_RETENTION
+
+# 任务状态
+QUEUED = 'queued'
+UPLOADING = 'uploading'
+ANALYZING = 'analyzing'
+DONE = 'done'
+FAILED = 'failed'
+
+STATUS_LABELS = {QUEUED: '⏳ 排队中', UPLOADING: '⬆️ 上传中', ANALYZING: '🤖 分析中', DONE: '✅ 完成', FAILED: '❌ 失败'}
+
+
+class JobRejected(Exception):
+    """队列已满或该用户待处理的任务过多"""
+
+
+class AnalysisJob:
+    """一次智能分析任务，状态变化时唤醒等待者"""
+
+    def __init__(self, job_id: str, owner: str, files_paths: Dict, analyze_data: Dict[str, Any], label: str = ''):
+        self.id = job_id
+        self.owner = owner
+        self.files_paths = files_paths
+        self.analyze_data = analyze_data
+        self.label = label
+        self.status = QUEUED
+        self.upload_fraction = 0.0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cache_key: Optional[str] = None
+        self.cached = False
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def _touch(self):
+        self.version += 1
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    def update(self, status: Optional[str] = None, **fields):
+        if status is not None:
+            self.status = status
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self._touch()
+
+    async def wait_change(self, version: int, timeout: float = 1.0):
+        """等待 version 之后的下一次状态变化，超时直接返回"""
+        if self.version != version:
+            return
+        event = self._changed
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'label': self.label, 'status': self.status, 'cached': self.cached,
+                'upload_fraction': round(self.upload_fraction, 3), 'error': self.error,
+                'created_at': self.created_at, 'started_at': self.started_at, 'finished_at': self.finished_at}
+
+
+class AnalysisJobQueue:
+    """智能分析任务队列：固定数量的 worker 协程限制对后端 /prompts/analyze 的并发，
+    每个用户 (会话) 同时待处理的任务数有上限，任务状态可随时查询。
+    配置了 cache 时，相同图片 + 提示词 + 模型的任务直接以缓存结果完成，不进入队列。"""
+
+    def __init__(self, client, workers: int = ANALYSIS_WORKERS, max_pending_per_user: int = ANALYSIS_MAX_PENDING_PER_USER,
+                 max_queue: int = ANALYSIS_MAX_QUEUE, retention: float = ANALYSIS_JOB_RETENTION,
+                 cache: Optional[AnalysisCache] = None):
+        self.client = client
+        self.cache = cache
+        self.workers = workers
+        self.max_pending_per_user = max_pending_per_user
+        self.max_queue = max_queue
+        self.retention = retention
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._pending: Deque[AnalysisJob] = deque()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._ids = itertools.count(1)
+
+    def _ensure_workers(self):
+        # worker 在第一次提交时于当前事件循环中启动
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.finished and (j.finished_at or 0) < cutoff]:
+            del self._jobs[job_id]
+
+    async def _cache_lookup(self, files_paths: Dict, analyze_data: Dict[str, Any], force: bool):
+        """返回 (缓存键, 缓存结果)；哈希计算和 SQLite 读取放到线程中执行"""
+        if self.cache is None:
+            return None, None
+        loop = asyncio.get_running_loop()
+        try:
+            key = await loop.run_in_executor(None, analysis_cache_key, files_paths,
+                                             analyze_data.get('prompt_text', ''), analyze_data.get('model_name', ''))
+        except OSError:
+            # 文件无法读取时不使用缓存，错误由上传阶段报告
+            return None, None
+        if force:
+            return key, None
+        return key, await loop.run_in_executor(None, self.cache.get, key)
+
+    async def submit(self, owner: str, files_paths: Dict, analyze_data: Dict[str, Any], label: str = '',
+                     force: bool = False) -> AnalysisJob:
+        """提交分析任务；命中缓存时返回已完成的任务，force=True 时忽略缓存重新分析"""
+        self._ensure_workers()
+        self._purge()
+        cache_key, cached = await self._cache_lookup(files_paths, analyze_data, force)
+        if cached is not None:
+            job = AnalysisJob(f"A{next(self._ids)}", owner, files_paths, analyze_data, label)
+            job.cache_key = cache_key
+            job.update(DONE, result=cached, cached=True, started_at=time.time(), finished_at=time.time())
+            self._jobs[job.id] = job
+            return job
+        if len(self._pending) >= self.max_queue:
+            raise JobRejected(f"分析队列已满 ({self.max_queue})，请稍后再试")
+        owned = sum(1 for j in self._jobs.values() if j.owner == owner and not j.finished)
+        if owned >= self.max_pending_per_user:
+            raise JobRejected(f"您已有 {owned} 个分析任务在处理中，请等待完成后再提交")
+        job = AnalysisJob(f"A{next(self._ids)}", owner, files_paths, analyze_data, label)
+        job.cache_key = cache_key
+        self._jobs[job.id] = job
+        self._pending.append(job)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self._jobs.get((job_id or '').strip())
+
+    def position(self, job: AnalysisJob) -> int:
+        """排在该任务前面的任务数"""
+        try:
+            return self._pending.index(job)
+        except ValueError:
+            return 0
+
+    def jobs_for(self, owner: str) -> List[AnalysisJob]:
+        return [j for j in self._jobs.values() if j.owner == owner]
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {'workers': self.workers, 'queued': len(self._pending), 'by_status': counts}
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: AnalysisJob):
+        self._pending.remove(job)
+        job.update(UPLOADING, started_at=time.time())
+
+        def on_progress(sent: int, total: int):
+            fraction = sent / total if total else 1.0
+            # 请求体发送完毕后，后端开始分析
+            job.update(ANALYZING if sent >= total else UPLOADING, upload_fraction=fraction)
+
+        try:
+            result = await self.client.analyze_prompt(job.files_paths, job.analyze_data, on_progress=on_progress)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        if 'error' in result:
+            job.update(FAILED, error=result['error'], finished_at=time.time())
+            return
+        if self.cache is not None and job.cache_key:
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.set, job.cache_key, result)
+        job.update(DONE, result=result, finished_at=time.time())
+
+    async def watch(self, job: AnalysisJob, timeout: float = 1.0):
+        """异步生成器：任务每次状态变化 (或每 timeout 秒) 产出一次，直到任务结束"""
+        version = -1
+        while True:
+            # 排队中的任务即使自身没有变化，排队位置也会变化，因此每次超时都产出一次
+            if job.version != version or job.status == QUEUED:
+                version = job.version
+                yield job
+                if job.finished:
+                    return
+            await job.wait_change(version, timeout)
+
+    def describe(self, job: AnalysisJob) -> str:
+        """面向用户的状态描述"""
+        label = STATUS_LABELS.get(job.status, job.status)
+        if job.status == QUEUED:
+            return f"{label} (任务 {job.id}，前面还有 {self.position(job)} 个任务)"
+        if job.status == UPLOADING:
+            return f"{label} {job.upload_fraction:.0%} (任务 {job.id})"
+        if job.status == FAILED:
+            return f"{label}: {job.error} (任务 {job.id})"
+        if job.cached:
+            return f"{label} (缓存结果，任务 {job.id})"
+        return f"{label} (任务 {job.id})"
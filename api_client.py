@@ -1,179 +1,755 @@
-import requests
-import json
+from __future__ import annotations
+
+import abc
+import asyncio
 import os
-from typing import Optional, List, Dict, Any, Tuple
-from config import API_PREFIX, API_BASE_URL
+import threading
+import time
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from config import (API_PREFIX, API_BASE_URL, HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE,
+                    HTTP_KEEPALIVE_EXPIRY, REQUEST_TIMEOUT, UPLOAD_TIMEOUT, HEALTH_CHECK_TIMEOUT,
+                    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, UPLOAD_CHUNK_SIZE, UPLOAD_MIN_BYTES_PER_SEC,
+                    CACHE_DIR, UPLOAD_DEDUP_ENABLED, UPLOAD_INDEX_VERIFY_AFTER, REQUEST_RETRIES, RETRY_BACKOFF_BASE,
+                    RETRY_BACKOFF_MAX, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, REQUEST_COALESCING_ENABLED,
+                    MAX_PAGE_SIZE, OFFLINE_MODE_ENABLED, OFFLINE_SNAPSHOT_MAX_ENTRIES, OFFLINE_REPLAY_INTERVAL)
+from circuit_breaker import (ALLOW, CLOSED, PROBE, BreakerRegistry, CircuitBreaker, backoff_delay, breaker_key,
+                             is_backend_failure, is_retryable, may_have_applied)
+from lazy_imports import lazy_import
+from metrics import api_coalesced_total, observe_api_request
+from image_preprocess import ImageValidationError, PreprocessResult, preprocess_upload
+from multipart import MultipartBody, ProgressCallback
+from offline_store import OfflineStore, WriteReplayer
+from records import loads
+from response_cache import ResponseCache, normalize_params
+from shared_cache import get_shared_cache
+from single_flight import AsyncSingleFlight, SingleFlight
+from upload_index import UploadIndex, UploadPlan
+
+logger = logging.getLogger('imggen.api_client')
+
+# requests / httpx 在第一次发请求时才导入
+requests = lazy_import('requests')
+httpx = lazy_import('httpx')
+
+DEFAULT_HEADERS = {
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+}
+
+# 请求已发出后的超时 (按类名判断，不必为此导入 requests 和 httpx)
+SENT_TIMEOUTS = ('ReadTimeout', 'WriteTimeout')
+
+# 会被写操作影响的可缓存读接口
+PROMPT_LIST_ENDPOINTS = ('/prompts/', '/prompts/search/tags')
+TAG_READ_ENDPOINTS = ('/tags/', '/tags/stats')
+PROMPT_DETAIL_PATTERN = r'/prompts/\d+'
+TAG_DETAIL_PATTERN = r'/tags/\d+'
+
+
+def collect_upload_paths(files_paths: Dict) -> List[Tuple[str, str]]:
+    """把 {'input_images': [...], 'output_image': path} 展开为 (表单字段名, 文件路径) 列表"""
+    fields = []
+    # 重要的是，所有输入图片的 form_field_name 必须是同一个: 'input_images'
+    # 同一个文件选了两次时只上传一次
+    if 'input_images' in files_paths and files_paths['input_images']:
+        for path in dict.fromkeys(files_paths['input_images']):
+            if path:
+                fields.append(('input_images', path))
+    if 'output_image' in files_paths and files_paths['output_image']:
+        fields.append(('output_image', files_paths['output_image']))
+    return fields
+
+
+def upload_timeout(total_bytes: int) -> float:
+    """上传超时 = 基础超时 + 按最低上传速度传完请求体所需的时间"""
+    return UPLOAD_TIMEOUT + total_bytes / UPLOAD_MIN_BYTES_PER_SEC
+
+
+def request_error(e: Exception) -> Dict[str, Any]:
+    """把请求异常转换为错误字典；status_code 为后端返回的HTTP状态码，网络错误时为 None
+
+    timeout 表示请求发出后等待响应超时 (requests / httpx 的 ReadTimeout、WriteTimeout)，后端可能已经处理了请求。
+    """
+    response = getattr(e, 'response', None)
+    return {"error": str(e), "success": False, "status_code": getattr(response, 'status_code', None),
+            "timeout": type(e).__name__ in SENT_TIMEOUTS}
+
+
+class PageFetchError(RuntimeError):
+    """iter_prompts 中某一页在重试后仍加载失败"""
+
+    def __init__(self, page: int, result: Dict[str, Any]):
+        super().__init__(f"第 {page} 页加载失败: {result.get('error')}")
+        self.page = page
+        self.result = result
+
+
+def attach_preprocess_report(result: Dict[str, Any], prepared: Optional[PreprocessResult]) -> Dict[str, Any]:
+    """成功的上传响应中附带本次预处理节省的字节数和耗时 (键 'preprocess')"""
+    if prepared is not None and 'error' not in result:
+        result['preprocess'] = prepared.to_dict()
+    return result
+
+
+def form_fields(data: Dict[str, Any]) -> Dict[str, List[str]]:
+    """按 requests 的规则编码表单字段：跳过 None，列表展开为重复字段，其余转为字符串"""
+    fields = {}
+    for key, value in data.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        encoded = [str(v) for v in values if v is not None]
+        if encoded:
+            fields[key] = encoded
+    return fields
+
+
+class BaseAPIClient(abc.ABC):
+    """同步/异步客户端共享的接口定义
+
+    下面的薄封装方法直接返回 self._make_request(...) 的结果：
+    在 APIClient 中是响应字典，在 AsyncAPIClient 中是需要 await 的协程。
+    """
+
+    def __init__(self):
+        self.base_url = API_PREFIX
+        self.uploads_url = f"{API_BASE_URL}/uploads"
+        self.cache = ResponseCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL,
+                                   shared=get_shared_cache())
+        self.upload_index = UploadIndex(os.path.join(CACHE_DIR, 'upload_index.sqlite3'), API_BASE_URL,
+                                        verify_after=UPLOAD_INDEX_VERIFY_AFTER) if UPLOAD_DEDUP_ENABLED else None
+        self.breakers = BreakerRegistry(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.offline = OfflineStore(os.path.join(CACHE_DIR, 'offline.sqlite3'),
+                                    OFFLINE_SNAPSHOT_MAX_ENTRIES) if OFFLINE_MODE_ENABLED else None
+
+    @abc.abstractmethod
+    def _make_request(self, method: str, endpoint: str, cache: bool = False, offline: bool = False, **kwargs):
+        """发送请求；子类实现同步或异步版本"""
+
+    def _breaker(self, endpoint: str) -> Optional[CircuitBreaker]:
+        return self.breakers.get(endpoint) if self.breakers.enabled else None
+
+    def _record(self, breaker: Optional[CircuitBreaker], result: Dict[str, Any]):
+        if breaker is not None:
+            breaker.record(result)
+
+    def _observe(self, method: str, url: str, started: float, response, request_bytes: Optional[int] = None):
+        """记录一次请求尝试的耗时、状态码和字节数；response 为 None 表示网络错误或超时"""
+        endpoint = breaker_key(url[len(self.base_url):])
+        if response is None:
+            status, response_bytes = 'error', 0
+        else:
+            status, response_bytes = response.status_code, len(response.content)
+            if request_bytes is None:
+                request_bytes = int(response.request.headers.get('Content-Length') or 0)
+        observe_api_request(method, endpoint, time.perf_counter() - started, status, request_bytes or 0,
+                            response_bytes)
+
+    def _retry_delay(self, method: str, breaker: Optional[CircuitBreaker], result: Dict[str, Any],
+                     attempt: int) -> Optional[float]:
+        """需要重试时返回等待秒数，否则返回 None；熔断器已打开时不再重试"""
+        if attempt >= REQUEST_RETRIES or not is_retryable(method, result):
+            return None
+        if breaker is not None and breaker.state != CLOSED:
+            return None
+        return backoff_delay(attempt, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
+
+    def breaker_stats(self) -> List[Dict[str, Any]]:
+        """各接口熔断器的状态、连续失败次数和快速失败次数"""
+        return self.breakers.stats()
+
+    def _cache_key(self, method: str, endpoint: str, cache: bool, params: Optional[Dict] = None):
+        """可缓存的 GET 请求返回缓存键，否则返回 None"""
+        if cache and method == 'GET' and self.cache.enabled:
+            return self.cache.make_key(endpoint, params)
+        return None
+
+    def _snapshot_key(self, method: str, endpoint: str, offline: bool, params: Optional[Dict] = None):
+        """offline=True 的读请求返回快照键，否则返回 None"""
+        if offline and method == 'GET' and self.offline is not None:
+            return endpoint, normalize_params(params)
+        return None
+
+    def _queue_first(self, method: str, offline: bool) -> bool:
+        """队列中还有待同步的写操作时，offline=True 的写操作直接排在后面，不能先于它们生效"""
+        return offline and method != 'GET' and self.offline is not None and self.offline.pending_count() > 0
+
+    def _offline_result(self, method: str, endpoint: str, offline: bool, snapshot_key, result: Dict[str, Any],
+                        body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """offline=True 的请求遇到后端故障时：读请求返回快照 (没有快照时返回原错误)，写请求加入待同步队列"""
+        if not offline or self.offline is None or not is_backend_failure(result):
+            return result
+        if method != 'GET':
+            return self.offline.enqueue(method, endpoint, body, result['error'], may_have_applied(result))
+        stale = self.offline.recall(snapshot_key, result['error'])
+        return stale if stale is not None else result
+
+    def replay_write(self, method: str, endpoint: str, body: Optional[Dict[str, Any]]):
+        """提交一个待同步队列中的写操作"""
+        return self._make_request(method, endpoint, **({'json': body} if body is not None else {}))
+
+    def offline_stats(self) -> Dict[str, Any]:
+        """本地快照条目数、返回快照的次数，以及待同步/同步失败的写操作数"""
+        return self.offline.stats() if self.offline else {}
+
+    def _invalidate_after(self, method: str, endpoint: str):
+        """写操作后按影响范围精确失效缓存，请求失败时也失效（写入可能已在后端生效）"""
+        if method == 'GET':
+            return
+        if endpoint in ('/prompts/', '/prompts/upload'):
+            # 新建提示词：列表页变化，tag_names 可能新建标签并改变标签统计
+            self.cache.invalidate(PROMPT_LIST_ENDPOINTS + TAG_READ_ENDPOINTS)
+        elif re.fullmatch(PROMPT_DETAIL_PATTERN, endpoint):
+            # 更新/删除提示词：该提示词详情 + 列表页 + 标签统计
+            self.cache.invalidate((endpoint,) + PROMPT_LIST_ENDPOINTS + TAG_READ_ENDPOINTS)
+        elif endpoint == '/tags/':
+            self.cache.invalidate(TAG_READ_ENDPOINTS)
+        elif re.fullmatch(TAG_DETAIL_PATTERN, endpoint):
+            # 删除标签：所有包含标签信息的提示词数据都可能变化
+            self.cache.invalidate(TAG_READ_ENDPOINTS + PROMPT_LIST_ENDPOINTS, pattern=PROMPT_DETAIL_PATTERN)
+
+    def _flight_key(self, method: str, endpoint: str, params: Optional[Dict] = None):
+        """可合并的读请求返回合并键，否则返回 None
+
+        键中带有缓存的 generation：写操作之后发起的读请求不会合并到写操作之前发出的请求上。
+        """
+        if method != 'GET' or not REQUEST_COALESCING_ENABLED:
+            return None
+        return endpoint, normalize_params(params), self.cache.generation
+
+    def _count_shared(self, method: str, endpoint: str, shared: bool):
+        if shared:
+            api_coalesced_total.inc(method, breaker_key(endpoint))
+
+    def coalesce_stats(self) -> Dict[str, Any]:
+        """读请求合并计数：实际发出的请求数、共享结果的调用数和进行中的请求数"""
+        return self.flights.stats()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """响应缓存的命中/未命中/淘汰计数"""
+        return self.cache.stats()
+
+    def _plan_upload(self, files_paths: Dict) -> Optional[UploadPlan]:
+        """按内容哈希查找已上传过的图片；未启用去重或后端不保存引用的URL时返回 None"""
+        if self.upload_index is None or self.upload_index.references_ignored:
+            return None
+        return self.upload_index.plan(collect_upload_paths(files_paths))
+
+    def _references_dropped(self, plan: UploadPlan, result: Dict[str, Any]) -> Optional[Any]:
+        """创建响应中缺少引用的URL时停用本进程的上传去重，返回需要删除的提示词ID (没有ID时返回 0)"""
+        if not plan.references_dropped(result):
+            return None
+        logger.warning("后端没有保存 input_image_urls / output_image_url，上传去重已停用，改为完整上传")
+        self.upload_index.references_ignored = True
+        self.upload_index.fallbacks += 1
+        return result['data'].get('id') or 0
+
+    def upload_dedup_stats(self) -> Dict[str, Any]:
+        """上传去重的命中率和节省的字节数"""
+        return self.upload_index.stats() if self.upload_index else {}
+
+    # ============ 提示词相关接口 ============
+    # 读接口默认 offline=True：后端不可用时返回本地快照 (响应中 stale 为 True)；
+    # 写接口传入 offline=True 时，后端不可用则加入待同步队列 (响应中 queued 为 True)
+    def create_prompt(self, prompt_data: Dict[str, Any], offline: bool = False):
+        """创建提示词 (无图片)"""
+        return self._make_request('POST', '/prompts/', offline=offline, json=prompt_data)
+
+    def get_prompt(self, prompt_id: int, cache: bool = True):
+        """获取单个提示词；cache=False 时绕过响应缓存和本地快照"""
+        return self._make_request('GET', f'/prompts/{prompt_id}', cache=cache, offline=cache)
+
+    def update_prompt(self, prompt_id: int, prompt_data: Dict[str, Any], offline: bool = False):
+        return self._make_request('PUT', f'/prompts/{prompt_id}', offline=offline, json=prompt_data)
+
+    def delete_prompt(self, prompt_id: int, offline: bool = False):
+        return self._make_request('DELETE', f'/prompts/{prompt_id}', offline=offline)
+
+    def get_prompts(self, page: int = 1, page_size: int = 10, cache: bool = True, **filters):
+        """分页获取提示词；cache=False 时绕过响应缓存和本地快照 (例如本地镜像同步、导出)"""
+        params = {'page': page, 'page_size': page_size}
+        # 布尔值统一为 true/false (requests 默认会转成 True/False)
+        params.update(normalize_params(filters))
+        return self._make_request('GET', '/prompts/', cache=cache, offline=cache, params=params)
+
+    def get_public_prompts(self, page: int = 1, page_size: int = 10):
+        params = {'page': page, 'page_size': page_size}
+        return self._make_request('GET', '/prompts/public', params=params)
+
+    def get_recent_prompts(self, limit: int = 10):
+        params = {'limit': limit}
+        return self._make_request('GET', '/prompts/recent', offline=True, params=params)
+
+    def get_prompt_stats(self):
+        return self._make_request('GET', '/prompts/stats', offline=True)
+
+    def search_prompts_by_tags(self, tags: List[str], page: int = 1, page_size: int = 10):
+        params = {'tags': ','.join(tags), 'page': page, 'page_size': page_size}
+        return self._make_request('GET', '/prompts/search/tags', cache=True, offline=True, params=params)
+
+    def check_duplicate(self, prompt_text: str):
+        params = {'prompt_text': prompt_text}
+        return self._make_request('GET', '/prompts/check-duplicate', params=params)
+
+    # ============ 标签相关接口 ============
+    def create_tag(self, tag_data: Dict[str, Any], offline: bool = False):
+        return self._make_request('POST', '/tags/', offline=offline, json=tag_data)
+
+    def get_tag(self, tag_id: int):
+        return self._make_request('GET', f'/tags/{tag_id}')
 
+    def get_all_tags(self):
+        return self._make_request('GET', '/tags/', cache=True, offline=True)
+
+    def search_tags(self, keyword: str = ''):
+        params = {'keyword': keyword} if keyword else {}
+        return self._make_request('GET', '/tags/search', params=params)
 
-class APIClient:
+    def delete_tag(self, tag_id: int, offline: bool = False):
+        return self._make_request('DELETE', f'/tags/{tag_id}', offline=offline)
+
+    def get_tag_stats(self):
+        return self._make_request('GET', '/tags/stats', cache=True, offline=True)
+
+
+class APIClient(BaseAPIClient):
     """API客户端类，用于与后端API通信"""
 
     def __init__(self):
-        self.base_url = API_PREFIX
-        self.uploads_url = f"{API_BASE_URL}/uploads"
+        super().__init__()
         self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        })
-
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """发送HTTP请求的通用方法"""
-        url = f"{self.base_url}{endpoint}"
+        self.flights = SingleFlight()
+        self.session.headers.update(DEFAULT_HEADERS)
+        # 有界的 keep-alive 连接池，多线程调用时复用连接
+        adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_MAX_KEEPALIVE, pool_maxsize=HTTP_POOL_MAX_CONNECTIONS,
+                              pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def iter_prompts(self, start_page: int = 1, page_size: int = MAX_PAGE_SIZE,
+                     **filters) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """从 start_page 开始逐页遍历提示词，返回 (页码, get_prompts 响应中的 data)
+
+        调用方处理第 N 页时，后台线程已在请求第 N+1 页；内存中最多同时有两页。
+        绕过响应缓存，某页重试后仍失败时抛出 PageFetchError。
+        """
+        fetch = lambda page: self.get_prompts(page, page_size, cache=False, **filters)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='iter-prompts') as pool:
+            page, future = start_page, pool.submit(fetch, start_page)
+            while future is not None:
+                result = future.result()
+                if 'error' in result:
+                    raise PageFetchError(page, result)
+                data = result.get('data') or {}
+                more = bool(data.get('items')) and page < data.get('total_pages', page)
+                future = pool.submit(fetch, page + 1) if more else None
+                yield page, data
+                page += 1
+
+    def _admit(self, breaker: Optional[CircuitBreaker], method: str, endpoint: str) -> Optional[Dict[str, Any]]:
+        """熔断器放行时返回 None，否则返回快速失败的错误字典；熔断到期后先用 health_check 探测后端"""
+        if breaker is None:
+            return None
+        decision = breaker.before_request()
+        if decision == PROBE:
+            decision = breaker.probe_result('error' not in self.health_check())
+        if decision == ALLOW:
+            return None
+        observe_api_request(method, breaker_key(endpoint), 0.0, 'circuit_open')
+        return breaker.rejection()
+
+    def _send(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        started, response = time.perf_counter(), None
         try:
-            response = self.session.request(method, url, timeout=10, **kwargs)
+            response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
             response.raise_for_status()
-            return response.json()
+            return loads(response.content)
         except requests.exceptions.RequestException as e:
-            return {"error": str(e), "success": False}
+            return request_error(e)
         except json.JSONDecodeError:
             return {"error": f"Invalid JSON response from server: {response.text[:200]}", "success": False}
-
-    def _make_multipart_request(self, endpoint: str, files_list: List[Tuple[str, Any]], data: Dict) -> Dict[str, Any]:
-        """处理 multipart/form-data 请求的通用方法"""
+        finally:
+            self._observe(method, url, started, response)
+
+    def _make_request(self, method: str, endpoint: str, cache: bool = False, offline: bool = False,
+                      **kwargs) -> Dict[str, Any]:
+        """发送HTTP请求的通用方法，cache=True 的 GET 请求走响应缓存，并发的相同读请求合并为一次；
+        offline=True 时后端不可用的读请求返回本地快照，写请求加入待同步队列"""
+        cache_key = self._cache_key(method, endpoint, cache, kwargs.get('params'))
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if self._queue_first(method, offline):
+            return self.offline.enqueue(method, endpoint, kwargs.get('json'))
+        snapshot_key = self._snapshot_key(method, endpoint, offline, kwargs.get('params'))
+        flight_key = self._flight_key(method, endpoint, kwargs.get('params'))
+        if flight_key is None:
+            result = self._fetch(method, endpoint, cache_key, snapshot_key, **kwargs)
+        else:
+            result, shared = self.flights.do(
+                flight_key, lambda: self._fetch(method, endpoint, cache_key, snapshot_key, **kwargs))
+            self._count_shared(method, endpoint, shared)
+        return self._offline_result(method, endpoint, offline, snapshot_key, result, kwargs.get('json'))
+
+    def _fetch(self, method: str, endpoint: str, cache_key, snapshot_key=None, **kwargs) -> Dict[str, Any]:
+        """经过熔断器发送请求，幂等请求失败后退避重试，成功的可缓存响应写入缓存和本地快照"""
         url = f"{self.base_url}{endpoint}"
+        generation = self.cache.generation
+        breaker = self._breaker(endpoint)
+        rejected = self._admit(breaker, method, endpoint)
+        if rejected is not None:
+            return rejected
         try:
-            headers = {k: v for k, v in self.session.headers.items() if k.lower() != 'content-type'}
-            response = requests.post(url, files=files_list, data=data, headers=headers, timeout=30)
+            attempt = 0
+            while True:
+                result = self._send(method, url, **kwargs)
+                self._record(breaker, result)
+                delay = self._retry_delay(method, breaker, result, attempt)
+                if delay is None:
+                    break
+                time.sleep(delay)
+                attempt += 1
+            if cache_key is not None and 'error' not in result:
+                self.cache.set(cache_key, result, generation)
+            if snapshot_key is not None and 'error' not in result:
+                self.offline.remember(snapshot_key, result)
+            return result
+        finally:
+            self._invalidate_after(method, endpoint)
+
+    def _make_multipart_request(self, endpoint: str, files_paths: Dict, data: Dict,
+                                on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """通过连接池以流式 multipart/form-data 上传文件，超时随请求体大小增长；POST 不重试"""
+        breaker = self._breaker(endpoint)
+        rejected = self._admit(breaker, 'POST', endpoint)
+        if rejected is not None:
+            return rejected
+        result = self._post_multipart(endpoint, files_paths, data, on_progress)
+        self._record(breaker, result)
+        return result
+
+    def _post_multipart(self, endpoint: str, files_paths: Dict, data: Dict,
+                        on_progress: Optional[ProgressCallback]) -> Dict[str, Any]:
+        url = f"{self.base_url}{endpoint}"
+        started, response, body_bytes = time.perf_counter(), None, 0
+        try:
+            body = MultipartBody(form_fields(data), collect_upload_paths(files_paths), UPLOAD_CHUNK_SIZE, on_progress)
+            body_bytes = len(body)
+            # body 实现了 __len__，requests 会发送 Content-Length 并逐块迭代请求体
+            response = self.session.post(url, data=body, headers={'Content-Type': body.content_type},
+                                         timeout=upload_timeout(len(body)))
             response.raise_for_status()
-            return response.json()
+            return loads(response.content)
         except requests.exceptions.RequestException as e:
-            return {"error": str(e), "success": False}
+            return request_error(e)
         except json.JSONDecodeError:
             return {"error": f"Invalid JSON response from server: {response.text[:200]}", "success": False}
+        except OSError as e:
+            return {"error": f"无法读取上传文件: {e}", "success": False}
+        finally:
+            self._observe('POST', url, started, response, body_bytes)
+            self._invalidate_after('POST', endpoint)
 
-    # ============ 提示词相关接口 ============
-    def upload_and_create_prompt_multi(self, files_paths: Dict, prompt_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        上传多图片并创建提示词
-        FIX: 彻底重构以正确处理文件路径列表并管理文件句柄
-        """
-        opened_files = []
-        files_for_request = []
-        try:
-            # 处理输入图片 (多个)
-            if 'input_images' in files_paths and files_paths['input_images']:
-                for path in files_paths['input_images']:
-                    if path:
-                        f = open(path, 'rb')
-                        opened_files.append(f)
-                        # requests库需要一个元组: ('form_field_name', (filename, file_object))
-                        # 重要的是，所有输入图片的 form_field_name 必须是同一个: 'input_images'
-                        files_for_request.append(('input_images', (os.path.basename(path), f)))
-
-            # 处理输出图片 (单个)
-            if 'output_image' in files_paths and files_paths['output_image']:
-                path = files_paths['output_image']
-                f = open(path, 'rb')
-                opened_files.append(f)
-                files_for_request.append(('output_image', (os.path.basename(path), f)))
-
-            # 如果没有任何文件被准备好上传，则调用常规的、不带图片的创建接口
-            if not files_for_request:
-                return self.create_prompt(prompt_data)
-
-            return self._make_multipart_request('/prompts/upload', files_for_request, prompt_data)
+    def _upload(self, endpoint: str, files_paths: Dict, data: Dict[str, Any], on_progress: Optional[ProgressCallback],
+                preprocess: bool) -> Dict[str, Any]:
+        """上传前先经过图片预处理阶段（校验/缩放/去元数据），上传完成后清理临时文件"""
+        try:
+            prepared = preprocess_upload(files_paths) if preprocess else None
+        except ImageValidationError as e:
+            return {"error": str(e), "success": False}
+        try:
+            result = self._make_multipart_request(endpoint, prepared.files_paths if prepared else files_paths, data,
+                                                  on_progress)
         finally:
-            # 确保所有打开的文件都被关闭，无论成功还是失败
-            for f in opened_files:
-                f.close()
+            if prepared:
+                prepared.cleanup()
+        return attach_preprocess_report(result, prepared)
 
-    def create_prompt(self, prompt_data: Dict[str, Any]) -> Dict[str, Any]:
-        """创建提示词 (无图片)"""
-        return self._make_request('POST', '/prompts/', json=prompt_data)
+    def upload_and_create_prompt_multi(self, files_paths: Dict, prompt_data: Dict[str, Any],
+                                       on_progress: Optional[ProgressCallback] = None,
+                                       preprocess: bool = True, offline: bool = False) -> Dict[str, Any]:
+        """上传多图片并创建提示词，on_progress(已发送字节, 总字节) 报告上传进度
 
-    def analyze_prompt(self, files_paths: Dict, analyze_data: Dict[str, Any]) -> Dict[str, Any]:
+        offline 只作用于不带图片的创建，带图片的创建不进入待同步队列。
+        按URL引用已上传的图片后，创建响应中没有这些URL时删除刚创建的提示词，改为完整上传全部图片。
+        """
+        # 如果没有任何文件被准备好上传，则调用常规的、不带图片的创建接口
+        if not collect_upload_paths(files_paths):
+            return self.create_prompt(prompt_data, offline=offline)
+        try:
+            plan = self._plan_upload(files_paths)
+        except OSError as e:
+            return {"error": f"无法读取上传文件: {e}", "success": False}
+        if plan is None:
+            return self._upload('/prompts/upload', files_paths, prompt_data, on_progress, preprocess)
+        if plan.all_known:
+            # 所有图片都上传过：只发送URL引用，不再传输文件
+            result = self.create_prompt({**prompt_data, **plan.reference_fields})
+        else:
+            result = self._upload('/prompts/upload', plan.upload_files_paths,
+                                  {**prompt_data, **plan.reference_fields}, on_progress, preprocess)
+        created_id = self._references_dropped(plan, result)
+        if created_id is not None:
+            if created_id:
+                self.delete_prompt(created_id)
+            return self._upload('/prompts/upload', files_paths, prompt_data, on_progress, preprocess)
+        return plan.record(result)
+
+    def analyze_prompt(self, files_paths: Dict, analyze_data: Dict[str, Any],
+                       on_progress: Optional[ProgressCallback] = None, preprocess: bool = True) -> Dict[str, Any]:
         """智能分析提示词（AI生成功能）"""
-        opened_files = []
-        files_for_request = []
-        try:
-            if 'input_images' in files_paths and files_paths['input_images']:
-                for path in files_paths['input_images']:
-                    if path:
-                        f = open(path, 'rb')
-                        opened_files.append(f)
-                        files_for_request.append(('input_images', (os.path.basename(path), f)))
-
-            if 'output_image' in files_paths and files_paths['output_image']:
-                path = files_paths['output_image']
-                f = open(path, 'rb')
-                opened_files.append(f)
-                files_for_request.append(('output_image', (os.path.basename(path), f)))
-
-            return self._make_multipart_request('/prompts/analyze', files_for_request, analyze_data)
-        finally:
-            for f in opened_files:
-                f.close()
+        return self._upload('/prompts/analyze', files_paths, analyze_data, on_progress, preprocess)
 
-    # --- 其他方法保持不变 ---
     def health_check(self) -> Dict[str, Any]:
         try:
-            response = requests.get(f"{API_BASE_URL}/health", timeout=5)
+            response = self.session.get(f"{API_BASE_URL}/health", timeout=HEALTH_CHECK_TIMEOUT)
             response.raise_for_status()
-            return response.json()
+            return loads(response.content)
         except:
             return {"error": "API服务器无法连接", "success": False}
 
     def db_status_check(self) -> Dict[str, Any]:
         try:
-            response = requests.get(f"{API_BASE_URL}/db-status", timeout=5)
+            response = self.session.get(f"{API_BASE_URL}/db-status", timeout=HEALTH_CHECK_TIMEOUT)
             response.raise_for_status()
-            return response.json()
+            return loads(response.content)
         except:
             return {"error": "数据库连接失败", "success": False}
 
-    def get_prompt(self, prompt_id: int) -> Dict[str, Any]:
-        return self._make_request('GET', f'/prompts/{prompt_id}')
-
-    def update_prompt(self, prompt_id: int, prompt_data: Dict[str, Any]) -> Dict[str, Any]:
-        return self._make_request('PUT', f'/prompts/{prompt_id}', json=prompt_data)
-
-    def delete_prompt(self, prompt_id: int) -> Dict[str, Any]:
-        return self._make_request('DELETE', f'/prompts/{prompt_id}')
-
-    def get_prompts(self, page: int = 1, page_size: int = 10, **filters) -> Dict[str, Any]:
-        params = {'page': page, 'page_size': page_size}
-        params.update({k: v for k, v in filters.items() if v is not None and v != ''})
-        return self._make_request('GET', '/prompts/', params=params)
-
-    def get_public_prompts(self, page: int = 1, page_size: int = 10) -> Dict[str, Any]:
-        params = {'page': page, 'page_size': page_size}
-        return self._make_request('GET', '/prompts/public', params=params)
-
-    def get_recent_prompts(self, limit: int = 10) -> Dict[str, Any]:
-        params = {'limit': limit}
-        return self._make_request('GET', '/prompts/recent', params=params)
 
-    def get_prompt_stats(self) -> Dict[str, Any]:
-        return self._make_request('GET', '/prompts/stats')
+class AsyncAPIClient(BaseAPIClient):
+    """异步API客户端，方法与 APIClient 相同，调用时需要 await
 
-    def search_prompts_by_tags(self, tags: List[str], page: int = 1, page_size: int = 10) -> Dict[str, Any]:
-        params = {'tags': ','.join(tags), 'page': page, 'page_size': page_size}
-        return self._make_request('GET', '/prompts/search/tags', params=params)
-
-    def check_duplicate(self, prompt_text: str) -> Dict[str, Any]:
-        params = {'prompt_text': prompt_text}
-        return self._make_request('GET', '/prompts/check-duplicate', params=params)
+    底层的 httpx.AsyncClient 在第一次请求时创建，绑定到当时运行的事件循环（即 Gradio 的事件循环）。
+    """
 
-    def create_tag(self, tag_data: Dict[str, Any]) -> Dict[str, Any]:
-        return self._make_request('POST', '/tags/', json=tag_data)
-
-    def get_tag(self, tag_id: int) -> Dict[str, Any]:
-        return self._make_request('GET', f'/tags/{tag_id}')
+    def __init__(self):
+        super().__init__()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.flights = AsyncSingleFlight()
+        self.replayer = WriteReplayer(self.offline, self, OFFLINE_REPLAY_INTERVAL) if self.offline else None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # 不设置默认 Content-Type：httpx 会为 JSON 和 multipart 请求分别生成正确的头
+            self._client = httpx.AsyncClient(
+                headers={'Accept': DEFAULT_HEADERS['Accept']},
+                timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _admit(self, breaker: Optional[CircuitBreaker], method: str, endpoint: str) -> Optional[Dict[str, Any]]:
+        """熔断器放行时返回 None，否则返回快速失败的错误字典；熔断到期后先用 health_check 探测后端"""
+        if breaker is None:
+            return None
+        decision = breaker.before_request()
+        if decision == PROBE:
+            decision = breaker.probe_result('error' not in await self.health_check())
+        if decision == ALLOW:
+            return None
+        observe_api_request(method, breaker_key(endpoint), 0.0, 'circuit_open')
+        return breaker.rejection()
+
+    async def _send(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        started, response = time.perf_counter(), None
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return loads(response.content)
+        except httpx.HTTPError as e:
+            return request_error(e)
+        except json.JSONDecodeError:
+            return {"error": f"Invalid JSON response from server: {response.text[:200]}", "success": False}
+        finally:
+            self._observe(method, url, started, response)
+
+    async def _make_request(self, method: str, endpoint: str, cache: bool = False, offline: bool = False,
+                            **kwargs) -> Dict[str, Any]:
+        """发送HTTP请求的通用方法，cache=True 的 GET 请求走响应缓存，并发的相同读请求合并为一次；
+        offline=True 时后端不可用的读请求返回本地快照 (熔断期间不等待后端，立即返回并在后台重新请求)，
+        写请求加入待同步队列并唤醒后台回放"""
+        cache_key = self._cache_key(method, endpoint, cache, kwargs.get('params'))
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if self._queue_first(method, offline):
+            return self._queued(self.offline.enqueue(method, endpoint, kwargs.get('json')))
+        snapshot_key = self._snapshot_key(method, endpoint, offline, kwargs.get('params'))
+        flight_key = self._flight_key(method, endpoint, kwargs.get('params'))
+        fetch = lambda: self._fetch(method, endpoint, cache_key, snapshot_key, **kwargs)
+        breaker = self._breaker(endpoint)
+        if snapshot_key is not None and breaker is not None and breaker.state != CLOSED:
+            stale = self.offline.recall(snapshot_key, breaker.rejection()['error'])
+            if stale is not None:
+                self._revalidate(flight_key, fetch)
+                return stale
+        if flight_key is None:
+            result = await fetch()
+        else:
+            result, shared = await self.flights.do(flight_key, fetch)
+            self._count_shared(method, endpoint, shared)
+        return self._queued(self._offline_result(method, endpoint, offline, snapshot_key, result, kwargs.get('json')))
+
+    def _revalidate(self, flight_key, fetch):
+        """在后台请求一次后端 (与进行中的相同请求合并)，成功时更新响应缓存和本地快照"""
+        task = asyncio.ensure_future(self.flights.do(flight_key, fetch) if flight_key is not None else fetch())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def _queued(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        if result.get('queued'):
+            self.ensure_replaying()
+        return result
+
+    def ensure_replaying(self):
+        """在当前事件循环中启动待同步写操作的后台回放；未启用降级模式时什么也不做"""
+        if self.replayer is not None:
+            self.replayer.ensure_running()
+
+    async def _fetch(self, method: str, endpoint: str, cache_key, snapshot_key=None, **kwargs) -> Dict[str, Any]:
+        """经过熔断器发送请求，幂等请求失败后退避重试，成功的可缓存响应写入缓存和本地快照"""
+        url = f"{self.base_url}{endpoint}"
+        generation = self.cache.generation
+        breaker = self._breaker(endpoint)
+        rejected = await self._admit(breaker, method, endpoint)
+        if rejected is not None:
+            return rejected
+        try:
+            attempt = 0
+            while True:
+                result = await self._send(method, url, **kwargs)
+                self._record(breaker, result)
+                delay = self._retry_delay(method, breaker, result, attempt)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                attempt += 1
+            if cache_key is not None and 'error' not in result:
+                self.cache.set(cache_key, result, generation)
+            if snapshot_key is not None and 'error' not in result:
+                self.offline.remember(snapshot_key, result)
+            return result
+        finally:
+            self._invalidate_after(method, endpoint)
+
+    async def _make_multipart_request(self, endpoint: str, files_paths: Dict, data: Dict,
+                                      on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """通过连接池以流式 multipart/form-data 上传文件，超时随请求体大小增长；POST 不重试"""
+        breaker = self._breaker(endpoint)
+        rejected = await self._admit(breaker, 'POST', endpoint)
+        if rejected is not None:
+            return rejected
+        result = await self._post_multipart(endpoint, files_paths, data, on_progress)
+        self._record(breaker, result)
+        return result
+
+    async def _post_multipart(self, endpoint: str, files_paths: Dict, data: Dict,
+                              on_progress: Optional[ProgressCallback]) -> Dict[str, Any]:
+        url = f"{self.base_url}{endpoint}"
+        started, response, body_bytes = time.perf_counter(), None, 0
+        try:
+            body = MultipartBody(form_fields(data), collect_upload_paths(files_paths), UPLOAD_CHUNK_SIZE, on_progress)
+            body_bytes = len(body)
+            headers = {'Content-Type': body.content_type, 'Content-Length': str(body_bytes)}
+            response = await self.client.post(url, content=body.aiter_chunks(), headers=headers,
+                                              timeout=upload_timeout(len(body)))
+            response.raise_for_status()
+            return loads(response.content)
+        except httpx.HTTPError as e:
+            return request_error(e)
+        except json.JSONDecodeError:
+            return {"error": f"Invalid JSON response from server: {response.text[:200]}", "success": False}
+        except OSError as e:
+            return {"error": f"无法读取上传文件: {e}", "success": False}
+        finally:
+            self._observe('POST', url, started, response, body_bytes)
+            self._invalidate_after('POST', endpoint)
 
-    def get_all_tags(self) -> Dict[str, Any]:
-        return self._make_request('GET', '/tags/')
+    async def _upload(self, endpoint: str, files_paths: Dict, data: Dict[str, Any],
+                      on_progress: Optional[ProgressCallback], preprocess: bool) -> Dict[str, Any]:
+        """上传前先经过图片预处理阶段（在线程中等待进程池），上传完成后清理临时文件"""
+        loop = asyncio.get_running_loop()
+        try:
+            prepared = await loop.run_in_executor(None, preprocess_upload, files_paths) if preprocess else None
+        except ImageValidationError as e:
+            return {"error": str(e), "success": False}
+        try:
+            result = await self._make_multipart_request(endpoint, prepared.files_paths if prepared else files_paths,
+                                                        data, on_progress)
+        finally:
+            if prepared:
+                prepared.cleanup()
+        return attach_preprocess_report(result, prepared)
+
+    async def upload_and_create_prompt_multi(self, files_paths: Dict, prompt_data: Dict[str, Any],
+                                             on_progress: Optional[ProgressCallback] = None,
+                                             preprocess: bool = True, offline: bool = False) -> Dict[str, Any]:
+        """上传多图片并创建提示词，on_progress(已发送字节, 总字节) 报告上传进度；offline 和引用失败的处理与同步客户端相同"""
+        if not collect_upload_paths(files_paths):
+            return await self.create_prompt(prompt_data, offline=offline)
+        try:
+            # 哈希计算和索引查询会阻塞，放到线程中执行
+            plan = await asyncio.get_running_loop().run_in_executor(None, self._plan_upload, files_paths)
+        except OSError as e:
+            return {"error": f"无法读取上传文件: {e}", "success": False}
+        if plan is None:
+            return await self._upload('/prompts/upload', files_paths, prompt_data, on_progress, preprocess)
+        if plan.all_known:
+            result = await self.create_prompt({**prompt_data, **plan.reference_fields})
+        else:
+            result = await self._upload('/prompts/upload', plan.upload_files_paths,
+                                        {**prompt_data, **plan.reference_fields}, on_progress, preprocess)
+        created_id = self._references_dropped(plan, result)
+        if created_id is not None:
+            if created_id:
+                await self.delete_prompt(created_id)
+            return await self._upload('/prompts/upload', files_paths, prompt_data, on_progress, preprocess)
+        return plan.record(result)
+
+    async def analyze_prompt(self, files_paths: Dict, analyze_data: Dict[str, Any],
+                             on_progress: Optional[ProgressCallback] = None, preprocess: bool = True) -> Dict[str, Any]:
+        """智能分析提示词（AI生成功能）"""
+        return await self._upload('/prompts/analyze', files_paths, analyze_data, on_progress, preprocess)
 
-    def search_tags(self, keyword: str = '') -> Dict[str, Any]:
-        params = {'keyword': keyword} if keyword else {}
-        return self._make_request('GET', '/tags/search', params=params)
+    async def health_check(self) -> Dict[str, Any]:
+        try:
+            response = await self.client.get(f"{API_BASE_URL}/health", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            return loads(response.content)
+        except Exception:
+            return {"error": "API服务器无法连接", "success": False}
 
-    def delete_tag(self, tag_id: int) -> Dict[str, Any]:
-        return self._make_request('DELETE', f'/tags/{tag_id}')
+    async def db_status_check(self) -> Dict[str, Any]:
+        try:
+            response = await self.client.get(f"{API_BASE_URL}/db-status", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            return loads(response.content)
+        except Exception:
+            return {"error": "数据库连接失败", "success": False}
 
-    def get_tag_stats(self) -> Dict[str, Any]:
-        return self._make_request('GET', '/tags/stats')
 
+_CLIENT_FACTORIES = {'api_client': APIClient, 'async_api_client': AsyncAPIClient}
+_clients_lock = threading.Lock()
 
-api_client = APIClient()
 
+def __getattr__(name: str):
+    """全局客户端 api_client / async_api_client 在第一次访问时才创建"""
+    factory = _CLIENT_FACTORIES.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _clients_lock:
+        if name not in globals():
+            globals()[name] = factory()
+    return globals()[name]
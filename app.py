@@ -1,237 +1,658 @@
-import gradio as gr
-import pandas as pd
+from __future__ import annotations
+
 from datetime import datetime
 from typing import List, Tuple, Optional, Dict, Any
 import os
 import json
-
-from api_client import api_client
+import asyncio
+import logging
+import tempfile
+import threading
+
+from lazy_imports import lazy_import
+from api_client import PageFetchError
+from bulk_export import ExportError, export_prompts, zip_export
 from config import *
+from shared_cache import get_shared_cache
+from snapshot import SharedSnapshot
+from analysis_jobs import AnalysisJobQueue, JobRejected, DONE, FAILED
+from analysis_cache import AnalysisCache
+from image_hash import ImageHashIndex
+from page_cache import PageCache
+from prompt_mirror import PromptMirror
+from thumbnails import ThumbnailCache
+from circuit_breaker import STATE_LABELS, OPEN
+from offline_store import stale_note
+from metrics import configure_logging, start_metrics_server, table_reconciles_total, timed_handler
+from table_view import TableView
+from records import PromptRecord, TagRecord, format_timestamp, format_timestamps
+from tag_index import TagIndex, current_fragment, normalize_tag, replace_fragment, split_tag_names
 
-# --- 新增的配置项 ---
-# !! 重要：请根据您Go后端项目的实际位置修改此路径
-BACKEND_PROJECT_PATH = "D:/projects/GolandProjects/imgGeneratePrompts"
+# gradio 和 pandas 导入较慢，分别在 create_app() 和第一次渲染表格时才真正加载
+gr = lazy_import('gradio')
+pd = lazy_import('pandas')
 
+logger = logging.getLogger('imggen.app')
+
+PROMPT_TABLE_COLUMNS = ["ID", "创建时间", "提示词", "模型", "公开", "输出图", "参考图", "标签"]
+TAG_TABLE_COLUMNS = ["ID", "标签名称", "创建时间"]
+
+# 智能生成标签页中除状态外的 7 个结果字段的空值
+EMPTY_ANALYSIS = ("", "", "", "", "", "", "")
+
+# 客户端和以下服务在第一次使用时才创建，导入 app 不会建立连接池、打开 SQLite 或启动线程
+_services: Dict[str, Any] = {}
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+_services_lock = threading.RLock()
+
+
+def _service(name: str, factory):
+    """按名称返回进程内唯一的服务对象，第一次调用时用 factory 创建 (factory 可以依赖其他服务)"""
+    if name not in _services:
+        with _services_lock:
+            if name not in _services:
+                _services[name] = factory()
+    return _services[name]
+
+
+def get_api_client():
+    """Gradio 事件处理函数共用的异步客户端"""
+    import api_client
+    return api_client.async_api_client
+
+
+def get_analysis_queue() -> AnalysisJobQueue:
+    """智能分析任务队列，限制对后端分析接口的并发；相同输入的分析结果持久缓存"""
+    return _service('analysis_queue', lambda: AnalysisJobQueue(
+        get_api_client(),
+        cache=AnalysisCache(os.path.join(CACHE_DIR, 'analysis_cache.sqlite3'), ANALYSIS_CACHE_MAX_BYTES)
+        if ANALYSIS_CACHE_ENABLED else None))
+
+
+def get_prompt_mirror() -> Optional[PromptMirror]:
+    """提示词本地全文检索镜像 (可选)，未启用时为 None"""
+    return _service('prompt_mirror', lambda: PromptMirror(
+        os.path.join(CACHE_DIR, 'prompt_mirror.sqlite3'), generation=lambda: get_api_client().cache.generation,
+        page_size=MAX_PAGE_SIZE, sync_interval=PROMPT_MIRROR_SYNC_INTERVAL) if PROMPT_MIRROR_ENABLED else None)
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """详情页图片通过 HTTP 从后端获取并缩略，前端无需与后端部署在同一台机器上"""
+    return _service('thumbnail_cache', lambda: ThumbnailCache(
+        THUMBNAIL_DIR, get_api_client().uploads_url, size=THUMBNAIL_SIZE,
+        max_bytes=THUMBNAIL_CACHE_MAX_BYTES, revalidate_after=THUMBNAIL_REVALIDATE_AFTER,
+        concurrency=THUMBNAIL_CONCURRENCY))
+
+
+def get_image_index() -> Optional[ImageHashIndex]:
+    """输出图的感知哈希索引，分析或创建前提示库中已有的近似重复图片；未启用时为 None"""
+    return _service('image_index', lambda: ImageHashIndex(
+        os.path.join(CACHE_DIR, 'image_hashes.sqlite3'), get_api_client().uploads_url,
+        max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+        backfill_interval=NEAR_DUPLICATE_BACKFILL_INTERVAL) if NEAR_DUPLICATE_ENABLED else None)
 
-# --- 辅助函数 ---
-def format_timestamp(ts):
-    try:
-        return datetime.fromisoformat(ts.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S')
-    except:
-        return ts
 
+# 所有会话共享的标签索引，用于标签输入建议和保存前的标签规范化 (只占内存，不依赖客户端)
+tag_index = TagIndex(refresh_interval=TAG_INDEX_REFRESH_INTERVAL, max_length=MAX_TAG_LENGTH)
 
+
+# --- 辅助函数 ---
 def safe_get(d, key, default=""):
     return d.get(key, default) if isinstance(d, dict) else default
 
 
-def parse_structure_analysis(item):
-    analysis = item.get('structure_analysis')
-    if isinstance(analysis, str):
-        try:
-            item['structure_analysis'] = json.loads(analysis) if analysis else {}
-        except:
-            item['structure_analysis'] = {}
-    elif not isinstance(analysis, dict):
-        item['structure_analysis'] = {}
-    return item
+def upload_progress(progress, desc):
+    """把上传的字节进度转换为 Gradio 进度条回调"""
+    if progress is None:
+        return None
+    return lambda sent, total: progress(sent / total if total else 1.0, desc=f"{desc} {sent / 1024 / 1024:.1f}/{total / 1024 / 1024:.1f} MB")
+
+
+def preprocess_note(result):
+    """上传响应中的图片预处理和去重统计，附加在状态信息后面"""
+    notes = []
+    report = safe_get(result, 'preprocess', None)
+    if report:
+        saved = f"节省 {report['bytes_saved'] / 1024 / 1024:.2f} MB，" if report['bytes_saved'] > 0 else ""
+        notes.append(f"图片预处理{saved}耗时 {report['seconds']:.2f}s")
+    dedup = safe_get(result, 'dedup', None)
+    if dedup and (dedup['reused_files'] or dedup.get('repeated_files')):
+        skipped = f"，跳过重复参考图 {dedup['repeated_files']} 张" if dedup.get('repeated_files') else ""
+        notes.append(f"复用已上传图片 {dedup['reused_files']} 张{skipped}，"
+                     f"免传 {dedup['bytes_avoided'] / 1024 / 1024:.2f} MB")
+    return f" ({'；'.join(notes)})" if notes else ""
 
 
 # --- 数据加载与API交互 ---
-def check_api_connection():
-    health = api_client.health_check()
-    db_status = api_client.db_status_check()
-    if 'error' in health: return f"❌ API连接失败: {health['error']}"
-    if 'error' in db_status: return f"❌ 数据库连接失败: {db_status['error']}"
-    return "✅ API和数据库连接正常"
-
-
-def load_dashboard_data():
-    stats = api_client.get_prompt_stats()
-    tags = api_client.get_tag_stats()
-    recent = api_client.get_recent_prompts(5)
+def format_breaker_status():
+    """未关闭的熔断器：这些接口的请求会立即失败，直到探测到后端恢复"""
+    lines = []
+    for breaker in get_api_client().breakers.open_breakers():
+        label = STATE_LABELS.get(breaker.state, breaker.state)
+        lines.append(f"⚡ {breaker.name} {label}，约 {breaker.retry_in:.0f}s 后探测恢复" if breaker.state == OPEN
+                     else f"⚡ {breaker.name} {label}")
+    return "\n\n".join(lines)
+
+
+def format_offline_status():
+    """待同步队列：后端不可用期间保存的写操作，恢复后按顺序提交"""
+    stats = get_api_client().offline_stats()
+    lines = []
+    if stats.get('pending_writes'):
+        lines.append(f"⏳ {stats['pending_writes']} 个写操作等待后端恢复后按顺序提交")
+    if stats.get('failed_writes'):
+        lines.append(f"⚠️ {stats['failed_writes']} 个排队的写操作被后端拒绝，未能生效")
+    if stats.get('dropped_writes'):
+        lines.append(f"ℹ️ {stats['dropped_writes']} 个排队的创建在后端已经生效 (之前的请求超时)，未重复提交")
+    return "\n\n".join(lines)
+
+
+def format_connection_status(health, db_status):
+    if 'error' in health: status = f"❌ API连接失败: {health['error']}"
+    elif 'error' in db_status: status = f"❌ 数据库连接失败: {db_status['error']}"
+    else: status = "✅ API和数据库连接正常"
+    return "\n\n".join(part for part in (status, format_breaker_status(), format_offline_status()) if part)
+
+
+def queued_note(result):
+    return f"⏳ {result['message']}，后端恢复后按顺序提交 (待同步 {result['pending']} 个)"
+
+
+async def fetch_dashboard_data():
+    """并发请求仪表板所需的五个接口，渲染为 (统计, 最近提示词, 连接状态)"""
+    client = get_api_client()
+    stats, tags, recent, health, db_status = await asyncio.gather(
+        client.get_prompt_stats(), client.get_tag_stats(), client.get_recent_prompts(5), client.health_check(),
+        client.db_status_check())
     stats_data = safe_get(stats, 'data', {})
     tags_data = safe_get(tags, 'data', {})
     stats_info = f"""## 📊 系统统计\n**提示词:** {safe_get(stats_data, 'total_prompts', 0)} 总数 | {safe_get(stats_data, 'public_prompts', 0)} 公开\n**标签:** {safe_get(tags_data, 'total_tags', 0)} 总数"""
+    stale = next((note for note in map(stale_note, (stats, tags)) if note), "")
+    if stale:
+        stats_info += f"\n\n{stale}"
     recent_info = "## 🕒 最近提示词\n\n"
     if 'error' not in recent and isinstance(safe_get(recent, 'data'), list):
         for p in recent['data']:
             recent_info += f"- **{format_timestamp(p.get('created_at'))}**: {p.get('prompt_text', '')[:50]}...\n"
-    return stats_info, recent_info, check_api_connection()
+        if recent.get('stale'):
+            recent_info += f"\n{stale_note(recent)}\n"
+    return stats_info, recent_info, format_connection_status(health, db_status)
+
+
+def get_dashboard_snapshot() -> SharedSnapshot:
+    """多进程部署时各工作进程通过共享缓存复用同一份快照"""
+    return _service('dashboard_snapshot', lambda: SharedSnapshot(
+        fetch_dashboard_data, ttl=DASHBOARD_CACHE_TTL, store=get_shared_cache(), key='dashboard'))
+
+
+@timed_handler
+async def load_dashboard_data():
+    """页面加载时使用共享快照，所有标签页在 TTL 内只触发一次后端请求；
+    同时启动待同步写操作的回放 (进程重启前排队的写操作在这里继续提交)"""
+    get_api_client().ensure_replaying()
+    return await get_dashboard_snapshot().get()
+
 
+@timed_handler
+async def refresh_dashboard_data():
+    """刷新按钮：强制重新加载快照"""
+    return await get_dashboard_snapshot().get(force=True)
 
-def create_prompt_with_images(input_images, output_image, prompt_text, *fields):
-    """通用创建函数"""
+
+async def find_near_duplicates(path):
+    """计算输出图的感知哈希并查询索引，返回 (哈希, 近似重复的提示词)；未启用或没有图片时为 (None, [])"""
+    image_index = get_image_index()
+    if image_index is None or not path:
+        return None, []
+    if image_index.backfill_interval > 0:
+        # 回填在线程中逐页同步请求，同步客户端在第一次回填时才创建
+        from api_client import api_client
+        image_index.ensure_backfilled(api_client)
+    return await asyncio.to_thread(image_index.find_file, path)
+
+
+def near_duplicate_warning(matches):
+    return f"⚠️ 库中已有近似重复的图片: {'、'.join(get_image_index().link(m) for m in matches)}"
+
+
+def record_output_hashes(result, hashes):
+    """创建成功后把输出图的哈希加入索引"""
+    data = result.get('data') or {}
+    if hashes is not None and data.get('id') is not None and data.get('output_image_url'):
+        get_image_index().add(data['id'], data['output_image_url'], hashes)
+
+
+@timed_handler
+async def create_prompt_with_images(input_images, output_image, prompt_text, *fields, view=None, progress=None,
+                                    allow_duplicate=False):
+    """通用创建函数，progress 为 Gradio 进度条，用于显示上传进度；创建成功后把新提示词插入当前表格
+
+    输出图与库中已有的图片近似重复时不上传，allow_duplicate=True 时仍然保存。
+    """
     if not prompt_text.strip():
-        return "❌ 提示词文本不能为空", None, None
+        return ("❌ 提示词文本不能为空",) + unchanged_table(view)
+    tags = await check_tags(fields[8])
+    if not tags.ok:
+        return (f"❌ {'；'.join(tags.errors)}",) + unchanged_table(view)
     try:
+        hashes, matches = await find_near_duplicates(output_image)
+        if matches and not allow_duplicate:
+            note = "未保存；确认需要保存时勾选「仍然保存近似重复的图片」"
+            return (f"{near_duplicate_warning(matches)}\n\n{note}",) + unchanged_table(view)
         prompt_data = {
             'prompt_text': prompt_text, 'negative_prompt': fields[0], 'model_name': fields[1],
             'is_public': fields[2], 'style_description': fields[3], 'usage_scenario': fields[4],
             'atmosphere_description': fields[5], 'expressive_intent': fields[6],
-            'structure_analysis': fields[7], 'tag_names': fields[8]
+            'structure_analysis': fields[7], 'tag_names': ','.join(tags.names)
         }
         files_to_upload = {
             'input_images': input_images if input_images else [],
             'output_image': output_image
         }
-        result = api_client.upload_and_create_prompt_multi(files_to_upload, prompt_data)
+        mirror = get_prompt_mirror()
+        token = mirror.write_token() if mirror is not None else None
+        result = await get_api_client().upload_and_create_prompt_multi(
+            files_to_upload, prompt_data, on_progress=upload_progress(progress, "上传图片"), offline=True)
         if 'error' in result:
-            return f"❌ 创建失败: {result['error']}", None, None
-        df, info = load_prompts_data()
-        return "✅ 创建成功!", df, info
+            return (f"❌ 创建失败: {result['error']}",) + unchanged_table(view)
+        if result.get('queued'):
+            return (queued_note(result),) + unchanged_table(view)
+        tag_index.record_usage(tags.names)
+        record_output_hashes(result, hashes)
+        if mirror is not None:
+            await mirror.apply_write(token, item=result.get('data') or {})
+        changed = view is not None and view.apply_create(result.get('data') or {})
+        return (f"✅ 创建成功!{preprocess_note(result)}{tags.note()}",) + patched_table(view, changed)
     except Exception as e:
-        return f"❌ 发生意外错误: {str(e)}", None, None
+        return (f"❌ 发生意外错误: {str(e)}",) + unchanged_table(view)
 
 
-def smart_generate_prompt(input_images, output_image, prompt_text, model_name):
-    if not prompt_text.strip() or not output_image:
-        return "❌ 请提供输出图片和基础提示词", "", "", "", "", "", "", ""
-    try:
-        files_paths = {
-            'input_images': input_images if input_images else [],
-            'output_image': output_image
-        }
-        result = api_client.analyze_prompt(files_paths, {'prompt_text': prompt_text, 'model_name': model_name or ''})
-        if 'error' in result:
-            return f"❌ 分析失败: {result['error']}", "", "", "", "", "", "", ""
-        data = result.get('data', {})
-        analysis = data.get('structure_analysis', {})
-        analysis_str = json.dumps(analysis, ensure_ascii=False, indent=2) if analysis else ""
-        return ("✅ 智能生成完成!", data.get('negative_prompt', ''), data.get('style_description', ''),
-                data.get('usage_scenario', ''), data.get('atmosphere_description', ''),
-                data.get('expressive_intent', ''),
-                analysis_str, ', '.join(data.get('tag_names', [])))
-    except Exception as e:
-        return f"❌ 分析失败: {str(e)}", "", "", "", "", "", "", ""
+def session_owner(request):
+    """以 Gradio 会话作为分析任务的提交者"""
+    return getattr(request, 'session_hash', None) or 'anonymous'
 
 
-def load_prompts_data(page: int = 1, keyword: str = "", model_name: str = "", is_public: Optional[bool] = None,
-                      tag_names: str = ""):
-    try:
-        filters = {'keyword': keyword, 'model_name': model_name, 'is_public': is_public, 'tag_names': tag_names}
-        result = api_client.get_prompts(page=page, page_size=DEFAULT_PAGE_SIZE, **filters)
-        if 'error' in result: return pd.DataFrame(), f"❌ 加载失败: {result['error']}"
-        pagination_data = result.get('data', {})
-        items = pagination_data.get('items', [])
-        if not items: return pd.DataFrame(), "当前页无数据"
-        rows = []
-        for item in items:
-            item = parse_structure_analysis(item)
-            tags = ', '.join([tag['name'] for tag in item.get('tags', [])])
-            rows.append({
-                'ID': item.get('id'), '创建时间': format_timestamp(item.get('created_at', '')),
-                '提示词': item.get('prompt_text', '')[:100] + '...', '模型': item.get('model_name', ''),
-                '公开': '是' if item.get('is_public') else '否', '输出图': '✓' if item.get('output_image_url') else '✗',
-                '参考图': f"{len(item.get('input_image_urls', []))}张", '标签': tags
-            })
-        df = pd.DataFrame(rows)
-        page_info = f"第 {pagination_data.get('page', 1)} 页 / 共 {pagination_data.get('total_pages', 1)} 页 (总计 {pagination_data.get('total', 0)} 条)"
-        return df, page_info
-    except Exception as e:
-        return pd.DataFrame(), f"❌ 加载失败: {str(e)}"
+def analysis_outputs(job):
+    """把已结束的分析任务转换为智能生成标签页的 8 个输出"""
+    if job.status == FAILED:
+        return (f"❌ 分析失败: {job.error}",) + EMPTY_ANALYSIS
+    data = job.result.get('data', {})
+    analysis = data.get('structure_analysis', {})
+    analysis_str = json.dumps(analysis, ensure_ascii=False, indent=2) if analysis else ""
+    source = f"缓存结果，任务 {job.id}" if job.cached else f"任务 {job.id}"
+    return (f"✅ 智能生成完成! ({source}){preprocess_note(job.result)}", data.get('negative_prompt', ''),
+            data.get('style_description', ''), data.get('usage_scenario', ''), data.get('atmosphere_description', ''),
+            data.get('expressive_intent', ''), analysis_str, ', '.join(data.get('tag_names', [])))
 
 
-def get_prompt_detail(prompt_id: int):
-    """获取提示词详情，并修复图片路径以便Gradio显示"""
-    print(f"\n--- DEBUG: 调用 get_prompt_detail, ID: {prompt_id} ---")
+@timed_handler
+async def smart_generate_prompt(input_images, output_image, prompt_text, model_name, force=False,
+                                request: gr.Request = None):
+    """提交分析任务并以流式方式返回状态：排队中 -> 上传中 -> 分析中 -> 完成
 
+    相同图片、提示词和模型的结果直接从缓存返回，force=True 时强制重新分析。
+    输出图与库中已有的图片近似重复时照常分析，只在状态中提示 (保存时才需要确认)。
+    """
+    if not prompt_text.strip() or not output_image:
+        yield ("❌ 请提供输出图片和基础提示词",) + EMPTY_ANALYSIS
+        return
+    files_paths = {
+        'input_images': input_images if input_images else [],
+        'output_image': output_image
+    }
+    try:
+        job = await get_analysis_queue().submit(session_owner(request), files_paths,
+                                          {'prompt_text': prompt_text, 'model_name': model_name or ''},
+                                          label=os.path.basename(output_image), force=force)
+    except JobRejected as e:
+        yield (f"❌ {e}",) + EMPTY_ANALYSIS
+        return
+    # 提交时已查过分析结果缓存；近似重复检查不影响是否分析
+    _, matches = await find_near_duplicates(output_image)
+    warning = f"\n\n{near_duplicate_warning(matches)}" if matches else ""
+    async for job in get_analysis_queue().watch(job):
+        if not job.finished:
+            # 进行中只更新状态，不清空已有的结果字段
+            yield (get_analysis_queue().describe(job) + warning,) + tuple(gr.update() for _ in EMPTY_ANALYSIS)
+    outputs = analysis_outputs(job)
+    yield (outputs[0] + warning,) + outputs[1:]
+
+
+def render_batch_status(jobs, rejected, duplicates=()):
+    lines = ["| 任务ID | 图片 | 状态 | 风格 | 标签 |", "|---|---|---|---|---|"]
+    for job in jobs:
+        data = safe_get(job.result, 'data', {}) if job.status == DONE else {}
+        lines.append(f"| {job.id} | {job.label} | {get_analysis_queue().describe(job)} | "
+                     f"{safe_get(data, 'style_description', '')} | {', '.join(safe_get(data, 'tag_names', []) or [])} |")
+    for name, reason in rejected:
+        lines.append(f"| - | {name} | ❌ 未提交: {reason} | | |")
+    done = sum(1 for j in jobs if j.finished)
+    status = f"**批量分析进度: {done}/{len(jobs)}**\n\n" + "\n".join(lines)
+    if duplicates:
+        status += "\n\n" + "\n".join(f"- {name}: {warning}" for name, warning in duplicates)
+    return status
+
+
+@timed_handler
+async def batch_analyze(output_images, input_images, prompt_text, model_name, force=False,
+                        request: gr.Request = None):
+    """一次提交多张输出图，每张图一个分析任务，流式返回整体进度表；完成后可按任务ID载入结果
+
+    与库中已有图片近似重复的输出图照常分析，在进度表下方列出。
+    """
+    if not prompt_text.strip() or not output_images:
+        yield "❌ 请提供输出图片和基础提示词"
+        return
+    owner = session_owner(request)
+    jobs, rejected, duplicates = [], [], []
+    queue = get_analysis_queue()
+    for path in output_images:
+        try:
+            jobs.append(await queue.submit(owner, {'input_images': input_images or [], 'output_image': path},
+                                           {'prompt_text': prompt_text, 'model_name': model_name or ''},
+                                           label=os.path.basename(path), force=force))
+        except JobRejected as e:
+            rejected.append((os.path.basename(path), str(e)))
+            continue
+        _, matches = await find_near_duplicates(path)
+        if matches:
+            duplicates.append((os.path.basename(path), near_duplicate_warning(matches)))
+    while True:
+        yield render_batch_status(jobs, rejected, duplicates)
+        pending = [j for j in jobs if not j.finished]
+        if not pending:
+            return
+        waiters = [asyncio.ensure_future(j.wait_change(j.version)) for j in pending]
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+
+
+@timed_handler
+async def load_analysis_job(job_id, request: gr.Request = None):
+    """按任务ID查询分析任务；已完成的任务结果填入审核表单"""
+    job = get_analysis_queue().get(job_id)
+    if job is None or job.owner != session_owner(request):
+        return (f"❌ 未找到任务: {job_id}",) + EMPTY_ANALYSIS
+    if not job.finished:
+        return (get_analysis_queue().describe(job),) + tuple(gr.update() for _ in EMPTY_ANALYSIS)
+    return analysis_outputs(job)
+
+
+def render_prompts_table(records):
+    """按列构建提示词列表表格；表格不显示 structure_analysis，因此不会解析它"""
+    return pd.DataFrame({
+        'ID': [r.id for r in records], '创建时间': format_timestamps([r.created_at for r in records]),
+        '提示词': [r.prompt_text[:100] + '...' for r in records], '模型': [r.model_name for r in records],
+        '公开': ['是' if r.is_public else '否' for r in records],
+        '输出图': ['✓' if r.output_image_url else '✗' for r in records],
+        '参考图': [f"{len(r.input_image_urls)}张" for r in records],
+        '标签': [', '.join(r.tag_names) for r in records],
+    })
+
+
+async def query_prompts(page: int, filters: Dict[str, Any]):
+    """优先在本地镜像中查询，镜像未启用或未就绪时请求后端"""
+    mirror = get_prompt_mirror()
+    if mirror is not None:
+        result = await mirror.search(get_api_client(), page=page, page_size=DEFAULT_PAGE_SIZE, **filters)
+        if result is not None:
+            return result
+    return await get_api_client().get_prompts(page=page, page_size=DEFAULT_PAGE_SIZE, **filters)
+
+
+def new_page_cache():
+    """每个会话一个翻页缓存；写操作使客户端响应缓存失效时 generation 变化，缓存随之丢弃"""
+    return PageCache(query_prompts,
+                     generation=lambda: get_api_client().cache.generation, max_pages=PAGE_CACHE_MAX_PAGES,
+                     ttl=PAGE_CACHE_TTL, prefetch=PAGE_PREFETCH)
+
+
+def new_table_view():
+    return TableView(render_prompts_table, DEFAULT_PAGE_SIZE, max_reconcile_attempts=TABLE_RECONCILE_MAX_ATTEMPTS)
+
+
+@timed_handler
+async def browse_prompts(page, keyword, model_name, is_public, tag_names, page_cache, view):
+    """翻页：从会话的翻页缓存读取并预取相邻页，返回 (表格, 分页信息, 页码, 翻页缓存, 表格状态)"""
+    if page_cache is None:
+        page_cache = new_page_cache()
+    if view is None:
+        view = new_table_view()
+    filters = {'keyword': keyword, 'model_name': model_name, 'is_public': is_public, 'tag_names': tag_names}
+    page, result = await page_cache.get(int(page or 1), filters)
+    if 'error' in result:
+        return pd.DataFrame(), f"❌ 加载失败: {result['error']}", page, page_cache, view
+    view.show(page, filters, result)
+    return view.table, view.info(), page, page_cache, view
+
+
+def unchanged_table(view):
+    return gr.update(), gr.update(), view, gr.update()
+
+
+def patched_table(view, changed):
+    """写操作后的 (表格, 分页信息, 表格状态, 校正定时器)；表格未变化时不重新发送"""
+    if view is None:
+        return gr.update(), gr.update(), view, gr.update()
+    return (view.table if changed else gr.update()), view.info(), view, gr.Timer(active=True)
+
+
+@timed_handler
+async def reconcile_prompts(page_cache, view):
+    """写操作后在后台重新加载当前页，纠正就地修改与后端不一致的地方；完成后停止定时器"""
+    if view is None or not view.dirty:
+        return gr.update(), gr.update(), gr.Timer(active=False)
+    if not view.due(TABLE_RECONCILE_DELAY):
+        return gr.update(), gr.update(), gr.update()
+    if page_cache is None:
+        page_cache = new_page_cache()
+    page, result = await page_cache.get(view.page, view.filters)
+    drifted = view.reconcile(page, result)
+    table_reconciles_total.inc('drift' if drifted else 'error' if 'error' in result or result.get('stale') else 'clean')
+    return (view.table if drifted else gr.update()), view.info(), gr.Timer(active=view.dirty)
+
+
+@timed_handler
+async def get_prompt_detail(prompt_id: int):
+    """获取提示词详情，参考图以缩略图显示在画廊中"""
     if not prompt_id:
-        print("--- DEBUG: prompt_id 为空, 返回默认值。")
         return "请先输入ID", "", "", "", "", [], False, "", "", "", "", "", ""
 
     try:
-        result = api_client.get_prompt(prompt_id)
+        result = await get_api_client().get_prompt(prompt_id)
         if 'error' in result:
-            print(f"--- DEBUG: API返回错误: {result['error']}")
             return f"❌ 获取失败: {result['error']}", "", "", "", "", [], False, "", "", "", "", "", ""
 
-        data = parse_structure_analysis(result.get('data', {}))
-        tags = ', '.join([t['name'] for t in data.get('tags', [])])
-        analysis_str = json.dumps(data.get('structure_analysis', {}), ensure_ascii=False, indent=2)
-
-        # --- 核心修复：使用正确的后端项目路径 ---
-        base_path = BACKEND_PROJECT_PATH
-        print(f"--- DEBUG: 使用的基础路径 (base_path): '{base_path}'")
-
-        def build_path(relative_url):
-            if not relative_url:
-                return ""
-            # relative_url 是 '/uploads/image.jpg'
-            # lstrip后是 'uploads/image.jpg'
-            # os.path.join(base_path, ...) 会正确拼接
-            # os.path.normpath 会转换为 D:\...\uploads\image.jpg
-            abs_path = os.path.normpath(os.path.join(base_path, relative_url.lstrip('/\\')))
-            print(f"--- DEBUG: 相对URL '{relative_url}' -> 绝对路径 '{abs_path}'")
-            return abs_path
-
-        output_image_absolute_path = build_path(data.get('output_image_url', ''))
-        input_image_absolute_paths = [build_path(url) for url in data.get('input_image_urls', []) if url]
-
-        final_return_values = (
-            f"✅ 已加载ID: {prompt_id}",
+        data = result.get('data', {})
+        record = PromptRecord(data)
+        tags = ', '.join(record.tag_names)
+        analysis_str = json.dumps(record.structure_analysis, ensure_ascii=False, indent=2)
+
+        output_url = data.get('output_image_url', '')
+        input_urls = [url for url in data.get('input_image_urls', []) if url]
+        # 多张参考图并发下载，缩略图命中磁盘缓存时不发请求
+        thumbnails = await get_thumbnail_cache().get_many(input_urls)
+        gallery = [path for path in thumbnails if path]
+        status = f"✅ 已加载ID: {prompt_id}"
+        if len(gallery) < len(input_urls):
+            status += f" (⚠️ {len(input_urls) - len(gallery)} 张参考图无法加载)"
+        if result.get('stale'):
+            status += f"\n\n{stale_note(result)}"
+
+        return (
+            status,
             data.get('prompt_text', ''), data.get('negative_prompt', ''), data.get('model_name', ''),
-            output_image_absolute_path, input_image_absolute_paths,
+            get_thumbnail_cache().absolute_url(output_url) if output_url else "", gallery,
             data.get('is_public', False), data.get('style_description', ''), data.get('usage_scenario', ''),
             data.get('atmosphere_description', ''), data.get('expressive_intent', ''), analysis_str, tags
         )
-        print(f"--- DEBUG: 准备返回给Gradio的数据: {final_return_values}")
-        return final_return_values
-
     except Exception as e:
-        import traceback
-        print("\n--- FATAL ERROR in get_prompt_detail ---");
-        traceback.print_exc();
-        print("--- END ERROR ---")
+        logger.exception("get_prompt_detail 处理失败, ID: %s", prompt_id)
         return f"❌ 前端处理失败: {e}", "", "", "", "", [], False, "", "", "", "", "", ""
 
 
-def update_prompt_detail(prompt_id, *fields):
-    if not prompt_id: return "❌ 请先选择要更新的提示词", None, None
+@timed_handler
+async def update_prompt_detail(view, prompt_id, *fields):
+    if not prompt_id: return ("❌ 请先选择要更新的提示词",) + unchanged_table(view)
+    tags = await check_tags(fields[9])
+    if not tags.ok: return (f"❌ {'；'.join(tags.errors)}",) + unchanged_table(view)
     try:
         update_data = {'prompt_text': fields[0], 'negative_prompt': fields[1], 'model_name': fields[2],
                        'is_public': fields[3], 'style_description': fields[4], 'usage_scenario': fields[5],
                        'atmosphere_description': fields[6], 'expressive_intent': fields[7],
-                       'structure_analysis': fields[8], 'tag_names': [t.strip() for t in fields[9].split(',')]}
-        result = api_client.update_prompt(prompt_id, update_data)
-        if 'error' in result: return f"❌ 更新失败: {result['error']}", None, None
-        df, info = load_prompts_data()
-        return "✅ 更新成功", df, info
+                       'structure_analysis': fields[8], 'tag_names': tags.names}
+        mirror = get_prompt_mirror()
+        token = mirror.write_token() if mirror is not None else None
+        result = await get_api_client().update_prompt(prompt_id, update_data, offline=True)
+        if 'error' in result: return (f"❌ 更新失败: {result['error']}",) + unchanged_table(view)
+        if result.get('queued'): return (queued_note(result),) + unchanged_table(view)
+        data = result.get('data') or {}
+        tag_index.record_usage(tags.new_tags)
+        if mirror is not None:
+            await mirror.apply_write(token, item=data)
+        changed = view is not None and data.get('id') is not None and view.apply_update(data)
+        return (f"✅ 更新成功{tags.note()}",) + patched_table(view, changed)
     except Exception as e:
-        return f"❌ 更新失败: {str(e)}", None, None
+        return (f"❌ 更新失败: {str(e)}",) + unchanged_table(view)
+
+
+@timed_handler
+async def delete_prompt_by_id(prompt_id: int, view=None):
+    if not prompt_id: return ("❌ 请输入要删除的ID",) + unchanged_table(view)
+    mirror = get_prompt_mirror()
+    token = mirror.write_token() if mirror is not None else None
+    result = await get_api_client().delete_prompt(prompt_id, offline=True)
+    if 'error' in result: return (f"❌ 删除失败: {result['error']}",) + unchanged_table(view)
+    if result.get('queued'): return (queued_note(result),) + unchanged_table(view)
+    image_index = get_image_index()
+    if image_index is not None:
+        image_index.remove([int(prompt_id)])
+    if mirror is not None:
+        await mirror.apply_write(token, deleted_id=int(prompt_id))
+    changed = view is not None and view.apply_delete(int(prompt_id))
+    return ("✅ 删除成功",) + patched_table(view, changed)
+
+
+def render_tags_table(records):
+    return pd.DataFrame({'ID': [r.id for r in records], '标签名称': [r.name for r in records],
+                         '创建时间': format_timestamps([r.created_at for r in records])})
+
+
+@timed_handler
+async def load_tags_data():
+    result = await get_api_client().get_all_tags()
+    if 'error' in result: return pd.DataFrame(), f"❌ 加载失败: {result['error']}"
+    df = render_tags_table([TagRecord(t) for t in result.get('data') or []])
+    info = f"共 {len(df)} 个标签"
+    return df, f"{info} ({stale_note(result)})" if result.get('stale') else info
+
+
+def tags_table_frame(tags_df):
+    """标签表格的当前值；Gradio 传入的空表格可能没有列"""
+    if tags_df is None or tags_df.empty or 'ID' not in tags_df.columns:
+        return pd.DataFrame(columns=TAG_TABLE_COLUMNS)
+    return tags_df
+
+
+@timed_handler
+async def create_new_tag(name, tags_df=None):
+    """创建标签后把接口返回的标签追加到当前表格；后端返回已有的同名标签时表格不变"""
+    if not name.strip(): return "❌ 名称不能为空", gr.update(), gr.update()
+    result = await get_api_client().create_tag({'name': normalize_tag(name)}, offline=True)
+    if 'error' in result: return f"❌ 创建失败: {result['error']}", gr.update(), gr.update()
+    if result.get('queued'): return queued_note(result), gr.update(), gr.update()
+    tag = result.get('data') or {}
+    tag_index.add(tag.get('name') or name, tag_id=tag.get('id'))
+    df = tags_table_frame(tags_df)
+    if tag.get('id') is None:
+        df, info = await load_tags_data()
+        return "✅ 创建成功", df, info
+    if not (df['ID'] == tag['id']).any():
+        df = pd.concat([df, render_tags_table([TagRecord(tag)])], ignore_index=True)
+    return "✅ 创建成功", df, f"共 {len(df)} 个标签"
+
+
+@timed_handler
+async def delete_tag_by_id(tag_id, tags_df=None):
+    if not tag_id: return "❌ ID不能为空", gr.update(), gr.update()
+    result = await get_api_client().delete_tag(tag_id, offline=True)
+    if 'error' in result: return f"❌ 删除失败: {result['error']}", gr.update(), gr.update()
+    if result.get('queued'): return queued_note(result), gr.update(), gr.update()
+    tag_index.remove(tag_id=int(tag_id))
+    df = tags_table_frame(tags_df)
+    df = df[df['ID'] != int(tag_id)].reset_index(drop=True)
+    return "✅ 删除成功", df, f"共 {len(df)} 个标签"
+
+
+@timed_handler
+async def export_prompt_library(fmt, with_images, keyword, model_name, is_public, tag_names, progress=None):
+    """按当前筛选条件导出全部提示词 (不限于当前页)；打包图片时与导出文件一起压缩为 zip"""
+    # 导出在线程中逐页同步请求，同步客户端在第一次导出时才创建
+    from api_client import api_client
+    directory = tempfile.mkdtemp(prefix='imggen-export-')
+    path = os.path.join(directory, f"prompts-{datetime.now():%Y%m%d-%H%M%S}.{fmt}")
+    image_dir = os.path.join(directory, 'images') if with_images else None
+    filters = {'keyword': keyword, 'model_name': model_name, 'is_public': is_public, 'tag_names': tag_names}
+    on_progress = None if progress is None else (
+        lambda rows, total, rate: progress(rows / total if total else 1.0, desc=f"已导出 {rows}/{total} 条"))
+    try:
+        report = await asyncio.to_thread(export_prompts, api_client, path, fmt, filters, image_dir,
+                                         on_progress=on_progress)
+        if image_dir:
+            path = await asyncio.to_thread(zip_export, path, image_dir)
+    except (ExportError, PageFetchError, OSError) as e:
+        return f"❌ 导出失败: {e}", None
+    status = f"✅ 导出 {report['rows']} 条，耗时 {report['seconds']:.1f}s ({report['rows_per_sec']:.0f} 条/s)"
+    images = report.get('images')
+    if images:
+        failed = f"，失败 {len(images['failures'])} 张" if images['failures'] else ""
+        status += f"，图片 {images['downloaded']} 张{failed}"
+    return status, path
 
 
-def delete_prompt_by_id(prompt_id: int):
-    if not prompt_id: return "❌ 请输入要删除的ID", None, None
-    result = api_client.delete_prompt(prompt_id)
-    if 'error' in result: return f"❌ 删除失败: {result['error']}", None, None
-    df, info = load_prompts_data()
-    return "✅ 删除成功", df, info
+# --- 标签输入建议 ---
+async def check_tags(text):
+    """保存前规范化标签：统一为已有标签的写法并去重，超长的标签拒绝保存"""
+    await tag_index.ensure_loaded(get_api_client())
+    return tag_index.validate(text or '')
 
 
-def load_tags_data():
-    result = api_client.get_all_tags()
-    if 'error' in result: return pd.DataFrame(), f"❌ 加载失败: {result['error']}"
-    data = result.get('data', [])
-    rows = [{'ID': r.get('id'), '标签名称': r.get('name'), '创建时间': format_timestamp(r.get('created_at'))} for r in
-            data]
-    return pd.DataFrame(rows), f"共 {len(rows)} 个标签"
+def hidden_suggestions():
+    return gr.update(choices=[], value=None, visible=False)
+
+
+@timed_handler
+async def suggest_tags(text):
+    """根据最后一个逗号之后正在输入的内容给出标签建议，已输入的标签不再出现"""
+    fragment = current_fragment(text)
+    if not fragment:
+        return hidden_suggestions()
+    await tag_index.ensure_loaded(get_api_client())
+    names = tag_index.suggest(fragment, TAG_SUGGESTION_LIMIT, exclude=split_tag_names(text)[:-1])
+    return gr.update(choices=names, value=None, visible=bool(names))
 
 
-def create_new_tag(name):
-    if not name.strip(): return "❌ 名称不能为空", None, None
-    result = api_client.create_tag({'name': name.strip()})
-    if 'error' in result: return f"❌ 创建失败: {result['error']}", None, None
-    df, info = load_tags_data()
-    return "✅ 创建成功", df, info
+async def apply_tag_suggestion(text, choice):
+    if not choice:
+        return gr.update(), gr.update()
+    return replace_fragment(text, choice), hidden_suggestions()
 
 
-def delete_tag_by_id(tag_id):
-    if not tag_id: return "❌ ID不能为空", None, None
-    result = api_client.delete_tag(tag_id)
-    if 'error' in result: return f"❌ 删除失败: {result['error']}", None, None
-    df, info = load_tags_data()
-    return "✅ 删除成功", df, info
+def attach_tag_suggestions(textbox):
+    """在标签输入框下方显示建议，点击建议时补全正在输入的标签"""
+    suggestions = gr.Radio(choices=[], show_label=False, container=False, visible=False)
+    textbox.input(suggest_tags, textbox, suggestions, show_progress="hidden", trigger_mode="always_last",
+                  **queue_group('read'))
+    suggestions.input(apply_tag_suggestion, [textbox, suggestions], [textbox, suggestions], show_progress="hidden",
+                      **queue_group('read'))
+    return suggestions
+
+
+def queue_group(name):
+    """事件的队列分组：同组事件共享一个并发上限 (QUEUE_CONCURRENCY)，耗时的分析不会占满列表读取的并发"""
+    limit = QUEUE_CONCURRENCY[name]
+    return {'concurrency_id': name, 'concurrency_limit': limit or None}
 
 
 # --- Gradio UI 界面 ---
@@ -258,8 +679,18 @@ def create_app():
                             with gr.Column(scale=2):
                                 sm_prompt = gr.Textbox(label="基础提示词 *", lines=3)
                                 sm_model = gr.Textbox(label="模型名称 (可选)")
+                                sm_force = gr.Checkbox(label="强制重新分析 (忽略缓存结果)", value=False)
                                 sm_gen_btn = gr.Button("🤖 智能生成", variant="primary")
                                 sm_status = gr.Markdown()
+                        with gr.Accordion("📦 批量分析", open=False):
+                            gr.Markdown("使用上方的基础提示词、模型和参考图，为每张输出图各提交一个分析任务")
+                            batch_output_imgs = gr.File(label="输出结果图 (可多选)", file_count="multiple",
+                                                        file_types=["image"], type="filepath")
+                            batch_btn = gr.Button("📦 批量提交分析")
+                            batch_status = gr.Markdown()
+                            with gr.Row():
+                                job_id_input = gr.Textbox(label="任务ID", placeholder="例如 A12")
+                                job_load_btn = gr.Button("📥 查询/载入任务结果")
                         gr.Markdown("---")
                         gr.Markdown("### 生成结果 (请审核并保存)")
                         sm_neg_prompt = gr.Textbox(label="负面提示词", lines=2)
@@ -269,7 +700,9 @@ def create_app():
                         sm_intent = gr.Textbox(label="表现意图")
                         sm_analysis = gr.Textbox(label="结构分析 (JSON)", lines=2)
                         sm_tags = gr.Textbox(label="标签 (逗号分隔)")
+                        attach_tag_suggestions(sm_tags)
                         sm_public = gr.Checkbox(label="设为公开", value=True)
+                        sm_allow_dup = gr.Checkbox(label="仍然保存近似重复的图片", value=False)
                         sm_save_btn = gr.Button("💾 保存提示词", variant="primary")
                         sm_save_status = gr.Markdown()
 
@@ -286,11 +719,13 @@ def create_app():
                                 man_intent = gr.Textbox(label="表现意图")
                                 man_analysis = gr.Textbox(label="结构分析 (JSON)", placeholder='例如: {"主体": "猫"}')
                                 man_tags = gr.Textbox(label="标签 (逗号分隔)")
+                                attach_tag_suggestions(man_tags)
                             with gr.Column(scale=1):
                                 man_output_img = gr.File(label="上传输出图片 (可选)", file_types=["image"],
                                                          type="filepath")
                                 man_input_imgs = gr.File(label="上传参考图片 (可选)", file_count="multiple",
                                                          file_types=["image"], type="filepath")
+                                man_allow_dup = gr.Checkbox(label="仍然保存近似重复的图片", value=False)
                                 man_save_btn = gr.Button("💾 保存提示词", variant="primary")
                                 man_save_status = gr.Markdown()
 
@@ -302,11 +737,26 @@ def create_app():
                                                         choices=[("全部", None), ("是", True), ("否", False)],
                                                         value=None)
                             tag_filter = gr.Textbox(label="标签")
+                        attach_tag_suggestions(tag_filter)
                         search_btn = gr.Button("🔍 搜索")
-                        prompts_table = gr.Dataframe(
-                            headers=["ID", "创建时间", "提示词", "模型", "公开", "输出图", "参考图", "标签"],
-                            interactive=False, wrap=True)
+                        prompts_table = gr.Dataframe(headers=PROMPT_TABLE_COLUMNS, interactive=False, wrap=True)
+                        with gr.Row():
+                            prev_page_btn = gr.Button("⬅️ 上一页")
+                            page_number = gr.Number(label="页码", value=1, precision=0, minimum=1)
+                            next_page_btn = gr.Button("下一页 ➡️")
                         prompts_info = gr.Markdown()
+                        with gr.Accordion("📤 导出当前筛选结果", open=False):
+                            with gr.Row():
+                                export_format = gr.Radio([("JSONL", "jsonl"), ("Parquet", "parquet")],
+                                                         value="jsonl", label="格式")
+                                export_images = gr.Checkbox(label="同时打包引用的图片 (zip)")
+                                export_btn = gr.Button("📤 导出")
+                            export_status = gr.Markdown()
+                            export_file = gr.File(label="导出文件", interactive=False)
+                        page_cache_state = gr.State(None)
+                        table_view_state = gr.State(None)
+                        # 写操作后启动，到期时在后台校正当前页；校正完成后停止
+                        reconcile_timer = gr.Timer(1.0, active=False)
                         gr.Markdown("---")
                         with gr.Row():
                             prompt_id_input = gr.Number(label="输入ID进行编辑", precision=0)
@@ -319,6 +769,7 @@ def create_app():
                             gr.Textbox(label="氛围"), gr.Textbox(label="意图"),
                             gr.Textbox(label="结构分析 (JSON)", lines=3), gr.Textbox(label="标签 (逗号分隔)")
                         ]
+                        attach_tag_suggestions(edit_fields[9])
                         edit_output_url = gr.Textbox(label="输出图URL", interactive=False)
                         edit_input_gallery = gr.Gallery(label="输入参考图", columns=4, height="auto",
                                                         object_fit="contain")
@@ -331,7 +782,7 @@ def create_app():
                 with gr.Tabs():
                     with gr.Tab("📋 查看"):
                         refresh_tags_btn = gr.Button("🔄 刷新")
-                        tags_table = gr.Dataframe(headers=["ID", "标签名称", "创建时间"], interactive=False)
+                        tags_table = gr.Dataframe(headers=TAG_TABLE_COLUMNS, interactive=False)
                         tags_info = gr.Markdown()
                     with gr.Tab("➕➖ 创建与删除"):
                         with gr.Row():
@@ -350,66 +801,118 @@ def create_app():
         all_sm_fields = [sm_neg_prompt, sm_public, sm_style, sm_usage, sm_atmosphere, sm_intent, sm_analysis, sm_tags]
         all_edit_fields = [prompt_id_input] + edit_fields
 
-        refresh_dashboard_btn.click(load_dashboard_data, outputs=[stats_display, recent_display, connection_status])
+        # 事件处理函数都是协程，lambda 无法被 Gradio 识别为异步函数，这里用 async def 包装
+        # Gradio 只识别位置参数中的 gr.Progress 默认值，因此 progress 放在 *f 之前
+        async def save_smart_prompt(i, o, p, m, view, allow, progress=gr.Progress(), *f):
+            return await create_prompt_with_images(i, o, p, *f[:1], m, *f[1:], view=view, progress=progress,
+                                                   allow_duplicate=allow)
+
+        async def save_manual_prompt(i, o, p, view, allow, progress=gr.Progress(), *f):
+            return await create_prompt_with_images(i, o, p, *f, view=view, progress=progress,
+                                                   allow_duplicate=allow)
+
+        filter_inputs = [keyword_filter, model_filter, public_filter, tag_filter, page_cache_state, table_view_state]
+        page_outputs = [prompts_table, prompts_info, page_number, page_cache_state, table_view_state]
+        # 写操作的输出：状态 + 就地修改后的表格
+        patch_outputs = [prompts_table, prompts_info, table_view_state, reconcile_timer]
+
+        async def search_prompts(k, m, p, t, cache, view):
+            return await browse_prompts(1, k, m, p, t, cache, view)
+
+        async def prev_page(page, k, m, p, t, cache, view):
+            return await browse_prompts((page or 1) - 1, k, m, p, t, cache, view)
+
+        async def next_page(page, k, m, p, t, cache, view):
+            return await browse_prompts((page or 1) + 1, k, m, p, t, cache, view)
+
+        async def export_filtered(fmt, images, k, m, p, t, progress=gr.Progress()):
+            return await export_prompt_library(fmt, images, k, m, p, t, progress=progress)
+
+        refresh_dashboard_btn.click(refresh_dashboard_data, outputs=[stats_display, recent_display, connection_status],
+                                    **queue_group('read'))
 
         # 智能生成流程
         sm_gen_btn.click(
             smart_generate_prompt,
-            [sm_input_imgs, sm_output_img, sm_prompt, sm_model],
-            [sm_status, sm_neg_prompt, sm_style, sm_usage, sm_atmosphere, sm_intent, sm_analysis, sm_tags]
+            [sm_input_imgs, sm_output_img, sm_prompt, sm_model, sm_force],
+            [sm_status, sm_neg_prompt, sm_style, sm_usage, sm_atmosphere, sm_intent, sm_analysis, sm_tags],
+            **queue_group('analyze')
+        )
+        batch_btn.click(batch_analyze, [batch_output_imgs, sm_input_imgs, sm_prompt, sm_model, sm_force], [batch_status],
+                        **queue_group('analyze'))
+        job_load_btn.click(
+            load_analysis_job,
+            [job_id_input],
+            [sm_status, sm_neg_prompt, sm_style, sm_usage, sm_atmosphere, sm_intent, sm_analysis, sm_tags],
+            **queue_group('read')
         )
         sm_save_btn.click(
-            lambda i, o, p, m, *f: create_prompt_with_images(i, o, p, *(f[:1] + [m] + f[1:])),
-            [sm_input_imgs, sm_output_img, sm_prompt, sm_model] + all_sm_fields,
-            [sm_save_status, prompts_table, prompts_info]
+            save_smart_prompt,
+            [sm_input_imgs, sm_output_img, sm_prompt, sm_model, table_view_state, sm_allow_dup] + all_sm_fields,
+            [sm_save_status] + patch_outputs,
+            **queue_group('upload')
         )
 
         # 手动创建流程
         man_save_btn.click(
-            lambda i, o, p, *f: create_prompt_with_images(i, o, p, *f),
-            [man_input_imgs, man_output_img, man_prompt] + all_man_fields,
-            [man_save_status, prompts_table, prompts_info]
+            save_manual_prompt,
+            [man_input_imgs, man_output_img, man_prompt, table_view_state, man_allow_dup] + all_man_fields,
+            [man_save_status] + patch_outputs,
+            **queue_group('upload')
         )
 
         # 查看与编辑流程
-        search_btn.click(
-            lambda k, m, p, t: load_prompts_data(1, k, m, p, t),
-            [keyword_filter, model_filter, public_filter, tag_filter],
-            [prompts_table, prompts_info]
-        )
+        search_btn.click(search_prompts, filter_inputs, page_outputs, **queue_group('read'))
+        prev_page_btn.click(prev_page, [page_number] + filter_inputs, page_outputs, **queue_group('read'))
+        next_page_btn.click(next_page, [page_number] + filter_inputs, page_outputs, **queue_group('read'))
+        page_number.submit(browse_prompts, [page_number] + filter_inputs, page_outputs, **queue_group('read'))
         load_btn.click(
             get_prompt_detail,
             [prompt_id_input],
             [edit_status, edit_fields[0], edit_fields[1], edit_fields[2],
              edit_output_url, edit_input_gallery, edit_fields[3], edit_fields[4],
              edit_fields[5], edit_fields[6], edit_fields[7], edit_fields[8],
-             edit_fields[9]]
+             edit_fields[9]],
+            **queue_group('read')
         )
-        update_btn.click(update_prompt_detail, all_edit_fields, [update_delete_status, prompts_table, prompts_info])
-        delete_btn.click(delete_prompt_by_id, [prompt_id_input], [update_delete_status, prompts_table, prompts_info])
+        update_btn.click(update_prompt_detail, [table_view_state] + all_edit_fields, [update_delete_status] + patch_outputs,
+                         **queue_group('write'))
+        delete_btn.click(delete_prompt_by_id, [prompt_id_input, table_view_state], [update_delete_status] + patch_outputs,
+                         **queue_group('write'))
+        export_btn.click(export_filtered, [export_format, export_images] + filter_inputs[:4],
+                         [export_status, export_file], **queue_group('export'))
+        reconcile_timer.tick(reconcile_prompts, [page_cache_state, table_view_state],
+                             [prompts_table, prompts_info, reconcile_timer], **queue_group('read'))
 
         # 标签管理流程
-        refresh_tags_btn.click(load_tags_data, outputs=[tags_table, tags_info])
-        create_tag_btn.click(create_new_tag, [new_tag_name], [create_tag_status, tags_table, tags_info])
-        delete_tag_btn.click(delete_tag_by_id, [delete_tag_id], [delete_tag_status, tags_table, tags_info])
-
-        app.load(load_dashboard_data, outputs=[stats_display, recent_display, connection_status])
-        app.load(load_prompts_data, outputs=[prompts_table, prompts_info])
-        app.load(load_tags_data, outputs=[tags_table, tags_info])
+        refresh_tags_btn.click(load_tags_data, outputs=[tags_table, tags_info], **queue_group('read'))
+        create_tag_btn.click(create_new_tag, [new_tag_name, tags_table], [create_tag_status, tags_table, tags_info],
+                             **queue_group('write'))
+        delete_tag_btn.click(delete_tag_by_id, [delete_tag_id, tags_table], [delete_tag_status, tags_table, tags_info],
+                             **queue_group('write'))
+
+        app.load(load_dashboard_data, outputs=[stats_display, recent_display, connection_status], **queue_group('read'))
+        app.load(browse_prompts, [page_number] + filter_inputs, page_outputs, **queue_group('read'))
+        app.load(load_tags_data, outputs=[tags_table, tags_info], **queue_group('read'))
+    # 未分组的事件使用默认并发数
+    app.queue(default_concurrency_limit=QUEUE_DEFAULT_CONCURRENCY or None, max_size=QUEUE_MAX_SIZE or None)
     return app
 
 
-if __name__ == "__main__":
+def main(inbrowser=True):
+    configure_logging()
+    # Gradio 占用主端口，指标在单独的端口上提供
+    start_metrics_server(GRADIO_SERVER_NAME, METRICS_PORT)
     app = create_app()
-    # --- 核心修复：使用新的配置变量 ---
-    allowed_path = os.path.normpath(os.path.join(BACKEND_PROJECT_PATH, "uploads"))
-    print(f"INFO: Allowing Gradio to access path: {allowed_path}")
-
     app.launch(
         server_name=GRADIO_SERVER_NAME,
         server_port=GRADIO_SERVER_PORT,
         share=GRADIO_SHARE,
-        inbrowser=True,
-        allowed_paths=[allowed_path]
+        inbrowser=inbrowser,
+        # 允许 Gradio 读取缩略图缓存目录
+        allowed_paths=[THUMBNAIL_DIR]
     )
 
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""前端性能基准测试与压测
+
+在子进程中启动 stub_backend.py 作为后端，直接调用 app.py 中的事件处理函数 (不经过浏览器)：
+
+    python benchmark.py                                   # 逐个测量事件处理函数的延迟和吞吐
+    python benchmark.py --iterations 50 --latency 0.02 --jitter 0.01
+    python benchmark.py --load --sessions 20 --duration 30 # 多会话并发压测
+    python benchmark.py --compare benchmark_results/基线.json --max-regression 0.2
+
+结果以 JSON 保存到 --output (默认 benchmark_results/benchmark-<时间>.json)，包含环境信息、桩服务参数、
+各处理函数的延迟分位数和压测汇总；--compare 与之前的结果对比 p50 / p90，
+超过 --max-regression (比例) 时以退出码 1 结束。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from stub_backend import add_stub_arguments, stub_config_from_args
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 压测中每个会话按权重随机选择的操作
+LOAD_MIX = (('browse_next_page', 40), ('get_prompt_detail', 25), ('search', 15), ('load_dashboard_data', 10),
+            ('load_tags_data', 5), ('update_prompt_detail', 5))
+SEARCH_KEYWORDS = ('cat', 'sunset', 'neon', 'portrait', 'lake', '高清', 'city lights')
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """最近秩法分位数，sorted_values 须已排序"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, wall_seconds: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    count = len(values)
+    return {'count': count, 'errors': errors, 'wall_seconds': round(wall_seconds, 4),
+            'throughput_per_sec': round(count / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+            'mean_ms': round(sum(values) / count * 1000, 3) if count else 0.0,
+            'min_ms': round(values[0] * 1000, 3) if count else 0.0,
+            'p50_ms': round(percentile(values, 0.50) * 1000, 3), 'p90_ms': round(percentile(values, 0.90) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3) if count else 0.0}
+
+
+def is_error(output: Any) -> bool:
+    """事件处理函数通过返回 "❌ ..." 文本表示失败，取输出中的第一个字符串判断"""
+    items = output if isinstance(output, tuple) else (output,)
+    text = next((item for item in items if isinstance(item, str)), '')
+    return text.startswith('❌')
+
+
+async def call_handler(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """调用协程或异步生成器形式的处理函数，生成器返回最后一次产出"""
+    result = fn(*args, **kwargs)
+    if hasattr(result, '__anext__'):
+        last = None
+        async for last in result:
+            pass
+        return last
+    return await result
+
+
+async def timed(fn: Callable[[], Awaitable[Any]]) -> Tuple[float, bool]:
+    started = time.perf_counter()
+    try:
+        output = await fn()
+        failed = is_error(output)
+    except Exception:
+        failed = True
+    return time.perf_counter() - started, failed
+
+
+# ============ 桩服务 ============
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub_process(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """在独立进程中运行桩服务，避免与被测代码争用 GIL；返回 (进程, 基础URL)"""
+    port = free_port()
+    command = [sys.executable, os.path.join(HERE, 'stub_backend.py'), '--port', str(port),
+               '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--analyze-latency', str(args.analyze_latency), '--error-rate', str(args.error_rate),
+               '--prompts', str(args.prompts), '--payload-bytes', str(args.payload_bytes),
+               '--image-size', str(args.image_size), '--seed', str(args.seed)]
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/health", timeout=1).read()
+            return proc, base_url
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("桩服务启动失败")
+
+
+def make_images(directory: str, count: int = 2) -> List[str]:
+    """生成上传测试用的图片文件"""
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"bench_{i}.png")
+        Image.new('RGB', (768, 768), (40 * i, 120, 200)).save(path)
+        paths.append(path)
+    return paths
+
+
+# ============ 基准测试 ============
+def handler_scenarios(app, images: List[str], prompt_count: int) -> Dict[str, Callable[[int], Awaitable[Any]]]:
+    """每个场景是一个 async (第 i 次调用) -> 处理函数输出"""
+    ids = lambda i: i % prompt_count + 1
+    page_cache, view = app.new_page_cache(), app.new_table_view()
+    edit_fields = ('', 'sdxl', True, 'style', '', '', '', '{}', '风景, 写实')
+
+    return {
+        'load_dashboard_data': lambda i: call_handler(app.load_dashboard_data),
+        'refresh_dashboard_data': lambda i: call_handler(app.refresh_dashboard_data),
+        'first_page': lambda i: call_handler(app.browse_prompts, 1, '', '', None, '', None, None),
+        'search': lambda i: call_handler(app.browse_prompts, 1, SEARCH_KEYWORDS[i % len(SEARCH_KEYWORDS)], '', None,
+                                         '', None, None),
+        'browse_prompts': lambda i: call_handler(app.browse_prompts, i % 10 + 1, '', '', None, '', page_cache, view),
+        'get_prompt_detail': lambda i: call_handler(app.get_prompt_detail, ids(i)),
+        'load_tags_data': lambda i: call_handler(app.load_tags_data),
+        'create_new_tag': lambda i: call_handler(app.create_new_tag, f"bench-{time.time_ns()}"),
+        'update_prompt_detail': lambda i: call_handler(app.update_prompt_detail, view, ids(i), f"updated {i}",
+                                                       *edit_fields),
+        'create_prompt_with_images': lambda i: call_handler(
+            app.create_prompt_with_images, images[1:], images[0], f"bench prompt {i}", '', 'sdxl', False, '', '',
+            '', '', '', '风景', view=view),
+        'smart_generate_prompt': lambda i: call_handler(app.smart_generate_prompt, images[1:], images[0],
+                                                        'bench', 'sdxl', True),
+    }
+
+
+async def run_benchmarks(app, scenarios: Dict[str, Callable[[int], Awaitable[Any]]], iterations: int,
+                         analyze_iterations: int, warmup: int) -> Dict[str, Any]:
+    results = {}
+    for name, scenario in scenarios.items():
+        count = analyze_iterations if name == 'smart_generate_prompt' else iterations
+        for i in range(min(warmup, count)):
+            await scenario(-i - 1)
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for i in range(count):
+            seconds, failed = await timed(lambda: scenario(i))
+            latencies.append(seconds)
+            errors += failed
+        results[name] = summarize(latencies, errors, time.perf_counter() - started)
+        print(f"  {name:<28} p50 {results[name]['p50_ms']:9.2f} ms  p90 {results[name]['p90_ms']:9.2f} ms  "
+              f"{results[name]['throughput_per_sec']:8.1f}/s  错误 {errors}", flush=True)
+    return results
+
+
+# ============ 列表页解码与渲染微基准 ============
+def legacy_prompts_table(items: List[Dict[str, Any]]):
+    """改用紧凑记录之前的渲染方式，作为对比基线：逐条解析 structure_analysis、格式化时间、构建 dict 行"""
+    import pandas as pd
+    from records import format_timestamp
+    rows = []
+    for item in items:
+        analysis = item.get('structure_analysis')
+        try:
+            item['structure_analysis'] = json.loads(analysis) if isinstance(analysis, str) and analysis else {}
+        except ValueError:
+            item['structure_analysis'] = {}
+        rows.append({
+            'ID': item.get('id'), '创建时间': format_timestamp(item.get('created_at', '')),
+            '提示词': item.get('prompt_text', '')[:100] + '...', '模型': item.get('model_name', ''),
+            '公开': '是' if item.get('is_public') else '否', '输出图': '✓' if item.get('output_image_url') else '✗',
+            '参考图': f"{len(item.get('input_image_urls', []))}张", '标签': ', '.join(t['name'] for t in item.get('tags', []))
+        })
+    return pd.DataFrame(rows)
+
+
+def run_page_micro(app, iterations: int) -> Dict[str, Any]:
+    """一页 MAX_PAGE_SIZE 条提示词的响应：解码 (json / records.loads) 和渲染表格 (逐行 dict / 按列) 的耗时"""
+    from config import MAX_PAGE_SIZE
+    from records import loads, orjson, prompt_records
+    from stub_backend import StubConfig, StubState
+    items = StubState(StubConfig(prompts=MAX_PAGE_SIZE)).filter_prompts({})
+    body = json.dumps({'code': 200, 'data': {'items': items, 'total': len(items), 'page': 1,
+                                             'page_size': MAX_PAGE_SIZE, 'total_pages': 1}},
+                      ensure_ascii=False).encode('utf-8')
+    stages = {
+        'page_decode_json': (lambda: None, lambda _: json.loads(body)),
+        'page_decode': (lambda: None, lambda _: loads(body)),
+        'page_render_rows': (lambda: json.loads(body)['data']['items'], legacy_prompts_table),
+        'page_render': (lambda: loads(body)['data']['items'],
+                        lambda page: app.render_prompts_table(prompt_records(page))),
+    }
+    results = {}
+    for name, (setup, stage) in stages.items():
+        stage(setup())
+        latencies = []
+        for _ in range(iterations):
+            data = setup()
+            started = time.perf_counter()
+            stage(data)
+            latencies.append(time.perf_counter() - started)
+        results[name] = summarize(latencies, 0, sum(latencies))
+        print(f"  {name:<28} p50 {results[name]['p50_ms']:9.3f} ms  p90 {results[name]['p90_ms']:9.3f} ms", flush=True)
+    print(f"  (每页 {len(items)} 条，{len(body) / 1024:.1f} KB，JSON 解码器: {'orjson' if orjson else 'json'})")
+    return results
+
+
+# ============ 压测 ============
+async def run_load(app, sessions: int, duration: float, prompt_count: int, seed: int) -> Dict[str, Any]:
+    """sessions 个并发会话在 duration 秒内按 LOAD_MIX 随机操作，每个会话有自己的翻页缓存"""
+    names = [name for name, _ in LOAD_MIX]
+    weights = [weight for _, weight in LOAD_MIX]
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def session(index: int):
+        rng = random.Random(seed + index)
+        page_cache, view, page = app.new_page_cache(), app.new_table_view(), 1
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            if name == 'browse_next_page':
+                page = page % 10 + 1
+                op = lambda: call_handler(app.browse_prompts, page, '', '', None, '', page_cache, view)
+            elif name == 'get_prompt_detail':
+                op = lambda: call_handler(app.get_prompt_detail, rng.randint(1, prompt_count))
+            elif name == 'search':
+                op = lambda: call_handler(app.browse_prompts, 1, rng.choice(SEARCH_KEYWORDS), '', None, '', None, None)
+            elif name == 'update_prompt_detail':
+                op = lambda: call_handler(app.update_prompt_detail, view, rng.randint(1, prompt_count),
+                                          f"load {index}", '', 'sdxl', True, '', '', '', '', '{}', '风景')
+            else:
+                op = lambda: call_handler(getattr(app, name))
+            seconds, failed = await timed(op)
+            latencies[name].append(seconds)
+            errors[name] += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    wall = time.perf_counter() - started
+    all_latencies = [s for values in latencies.values() for s in values]
+    return {'sessions': sessions, 'duration': duration,
+            'overall': summarize(all_latencies, sum(errors.values()), wall),
+            'operations': {name: summarize(latencies[name], errors[name], wall) for name in names}}
+
+
+# ============ 结果 ============
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], max_regression: Optional[float]) -> List[str]:
+    """打印与基线相比 p50 / p90 的变化，返回超过 max_regression 的条目"""
+    regressions = []
+    rows = [(f"benchmarks.{name}", baseline.get('benchmarks', {}).get(name), stats)
+            for name, stats in current.get('benchmarks', {}).items()]
+    rows += [(f"micro.{name}", baseline.get('micro', {}).get(name), stats)
+             for name, stats in current.get('micro', {}).items()]
+    if current.get('load') and baseline.get('load'):
+        rows.append(('load.overall', baseline['load']['overall'], current['load']['overall']))
+    print("\n与基线对比 (p50 / p90):")
+    for name, old, new in rows:
+        if not old:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p90_ms'):
+            change = (new[key] - old[key]) / old[key] if old[key] else 0.0
+            changes.append(f"{key[:3]} {old[key]:.2f} -> {new[key]:.2f} ms ({change:+.0%})")
+            if max_regression is not None and change > max_regression:
+                regressions.append(f"{name} {key} 变慢 {change:.0%}")
+        print(f"  {name:<38} {' | '.join(changes)}")
+    return regressions
+
+
+async def run(args: argparse.Namespace, stub_config: Dict[str, Any]) -> Dict[str, Any]:
+    import app
+    # 压测时大量请求超过慢请求阈值，日志会淹没结果输出
+    logging.getLogger('imggen').setLevel(logging.ERROR)
+    images = make_images(os.environ['CACHE_DIR'])
+    report: Dict[str, Any] = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'), 'git_commit': git_commit(),
+        'python': platform.python_version(), 'platform': platform.platform(), 'stub': stub_config,
+        'iterations': args.iterations, 'benchmarks': {}, 'micro': {}, 'load': None}
+    if args.micro_iterations > 0:
+        print("列表页解码与渲染 (微基准):")
+        report['micro'] = run_page_micro(app, args.micro_iterations)
+    if not args.skip_handlers:
+        print("事件处理函数基准测试:")
+        scenarios = handler_scenarios(app, images, args.prompts)
+        report['benchmarks'] = await run_benchmarks(app, scenarios, args.iterations, args.analyze_iterations,
+                                                    args.warmup)
+    if args.load:
+        print(f"\n压测: {args.sessions} 个会话, {args.duration:g} 秒")
+        report['load'] = await run_load(app, args.sessions, args.duration, args.prompts, args.seed)
+        overall = report['load']['overall']
+        print(f"  合计 {overall['count']} 次操作, {overall['throughput_per_sec']}/s, p50 {overall['p50_ms']} ms, "
+              f"p99 {overall['p99_ms']} ms, 错误 {overall['errors']}")
+    client = app.get_api_client()
+    report['client'] = {'cache': client.cache_stats(), 'coalescing': client.coalesce_stats(),
+                        'analysis': app.get_analysis_queue().stats()}
+    await client.aclose()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="对事件处理函数做基准测试和多会话压测 (使用本地桩服务)")
+    parser.add_argument('--iterations', type=int, default=20, help="每个处理函数的测量次数")
+    parser.add_argument('--analyze-iterations', type=int, default=3, help="智能分析的测量次数 (每次包含分析延迟)")
+    parser.add_argument('--warmup', type=int, default=2, help="每个处理函数测量前的预热次数")
+    parser.add_argument('--micro-iterations', type=int, default=200, help="列表页解码/渲染微基准的测量次数 (0 跳过)")
+    parser.add_argument('--skip-handlers', action='store_true', help="只运行压测")
+    parser.add_argument('--load', action='store_true', help="运行多会话并发压测")
+    parser.add_argument('--sessions', type=int, default=10, help="压测的并发会话数")
+    parser.add_argument('--duration', type=float, default=10.0, help="压测持续时间 (秒)")
+    parser.add_argument('--output', help="结果文件 (默认 benchmark_results/benchmark-<时间>.json)")
+    parser.add_argument('--compare', help="与之前保存的结果文件对比")
+    parser.add_argument('--max-regression', type=float, help="p50 / p90 允许变慢的比例上限，例如 0.2")
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    proc, base_url = start_stub_process(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix='imggen-bench-') as cache_dir:
+            # config 在导入时读取环境变量，必须在导入 app 之前设置；缓存目录每次运行都是空的
+            os.environ.update({'API_BASE_URL': base_url, 'CACHE_DIR': cache_dir})
+            report = asyncio.run(run(args, stub_config_from_args(args).to_dict()))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    output = args.output or os.path.join(
+        HERE, 'benchmark_results', f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.max_regression)
+        for message in regressions:
+            print(f"❌ {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
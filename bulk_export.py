@@ -0,0 +1,398 @@
+"""批量导出提示词
+
+用法:
+    python bulk_export.py <输出文件.jsonl | 输出文件.parquet> [--keyword 关键词] [--model-name 模型]
+                          [--tags 风景,写实] [--public | --private] [--images] [--restart]
+
+按页流式读取 (写入当前页时已在请求下一页)，内存占用与提示词总数无关:
+    - JSONL: 每行一条后端返回的完整提示词
+    - Parquet: 列式存储，标签和参考图为列表列，structure_analysis 为 JSON 字符串 (需要安装 pyarrow)
+
+进度保存在 <输出文件>.cursor.json，中断后重新运行相同命令从断点继续，--restart 重新开始。
+--images 同时把引用的输出图和参考图下载到 <输出文件>_images/，保持 /uploads/ 下的相对路径。
+"""
+import argparse
+import json
+import os
+import posixpath
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from api_client import APIClient, PageFetchError
+from config import MAX_PAGE_SIZE, REQUEST_TIMEOUT
+from thumbnails import absolute_upload_url
+
+FORMATS = ('jsonl', 'parquet')
+STRING_COLUMNS = ('prompt_text', 'negative_prompt', 'model_name', 'style_description', 'usage_scenario',
+                  'atmosphere_description', 'expressive_intent', 'structure_analysis', 'output_image_url',
+                  'created_at', 'updated_at')
+LIST_COLUMNS = ('tag_names', 'input_image_urls')
+# Parquet 每满多少行写一个 row group；每个分片文件的行数，分片写完才计入断点
+PARQUET_ROW_GROUP_ROWS = 5000
+PARQUET_PART_ROWS = 50000
+# (已导出行数, 总数, 本次运行的每秒行数)
+ProgressCallback = Callable[[int, int, float], None]
+
+
+class ExportError(Exception):
+    """导出参数或输出文件有问题，不会重试"""
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ModuleNotFoundError:
+        raise ExportError("导出 Parquet 需要安装 pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Parquet 的一行：标签只保留名称，structure_analysis 统一为 JSON 字符串"""
+    row: Dict[str, Any] = {'id': item.get('id'), 'is_public': bool(item.get('is_public'))}
+    for column in STRING_COLUMNS:
+        value = item.get(column)
+        row[column] = value if value is None or isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    row['tag_names'] = [t.get('name') for t in item.get('tags') or []]
+    row['input_image_urls'] = list(item.get('input_image_urls') or [])
+    return row
+
+
+class JsonlSink:
+    """每页写完即可作为断点，断点记录文件偏移，续传时截掉之后不完整的内容"""
+
+    def __init__(self, path: str, state: Optional[Dict[str, Any]]):
+        offset = state['offset'] if state else 0
+        if offset and not os.path.exists(path):
+            raise ExportError(f"{path} 不存在，无法续传 (使用 --restart 重新导出)")
+        self.file = open(path, 'r+b' if offset else 'wb')
+        self.file.seek(offset)
+        self.file.truncate()
+
+    def write(self, items: List[Dict[str, Any]]):
+        self.file.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items).encode('utf-8'))
+
+    def commit(self) -> Optional[Dict[str, Any]]:
+        self.file.flush()
+        return {'offset': self.file.tell()}
+
+    def close(self, complete: bool):
+        self.file.close()
+
+
+class ParquetSink:
+    """先写入 <输出文件>.parts/ 下的分片，分片写满才计入断点；导出完成后按 row group 合并为一个文件"""
+
+    def __init__(self, path: str, state: Optional[Dict[str, Any]]):
+        self.pa, self.pq = require_pyarrow()
+        pa = self.pa
+        self.path = path
+        self.parts_dir = f"{path}.parts"
+        self.parts = state['parts'] if state else 0
+        if not state:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.schema = pa.schema([('id', pa.int64()), ('is_public', pa.bool_())]
+                                + [(c, pa.string()) for c in STRING_COLUMNS]
+                                + [(c, pa.list_(pa.string())) for c in LIST_COLUMNS])
+        self.writer = None
+        self.buffer: List[Dict[str, Any]] = []
+        self.part_rows = 0
+
+    def _part_path(self, index: int) -> str:
+        return os.path.join(self.parts_dir, f"part-{index:05d}.parquet")
+
+    def _flush_buffer(self):
+        if not self.buffer:
+            return
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self._part_path(self.parts), self.schema)
+        self.writer.write_table(self.pa.Table.from_pylist(self.buffer, schema=self.schema))
+        self.part_rows += len(self.buffer)
+        self.buffer = []
+
+    def _close_part(self):
+        self._flush_buffer()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.parts += 1
+            self.part_rows = 0
+
+    def write(self, items: List[Dict[str, Any]]):
+        self.buffer.extend(parquet_row(item) for item in items)
+        if len(self.buffer) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush_buffer()
+
+    def commit(self) -> Optional[Dict[str, Any]]:
+        """当前分片写满时关闭它并返回断点状态；未关闭的分片中的行还不算已保存"""
+        if self.part_rows + len(self.buffer) < PARQUET_PART_ROWS:
+            return None
+        self._close_part()
+        return {'parts': self.parts}
+
+    def close(self, complete: bool):
+        self._close_part()
+        if not complete:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with self.pq.ParquetWriter(tmp_path, self.schema) as writer:
+            for index in range(self.parts):
+                part = self.pq.ParquetFile(self._part_path(index))
+                for group in range(part.num_row_groups):
+                    writer.write_table(part.read_row_group(group))
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+def open_sink(path: str, fmt: str, state: Optional[Dict[str, Any]]):
+    return ParquetSink(path, state) if fmt == 'parquet' else JsonlSink(path, state)
+
+
+class ImageBundler:
+    """下载提示词引用的图片到 directory，保持 /uploads/ 下的相对路径；已存在的文件跳过"""
+
+    def __init__(self, client: APIClient, directory: str, workers: int = 4):
+        self.client = client
+        self.directory = directory
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export-images')
+        self.pending: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.downloaded = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.failures: List[Dict[str, Any]] = []
+
+    def local_path(self, url: str) -> Optional[str]:
+        path = posixpath.normpath(urlparse(url).path).lstrip('/')
+        if path.startswith('uploads/'):
+            path = path[len('uploads/'):]
+        if not path or path.startswith('..'):
+            return None
+        return os.path.join(self.directory, *path.split('/'))
+
+    def _download(self, url: str, dest: str):
+        tmp_path = f"{dest}.part"
+        try:
+            with self.client.session.get(absolute_upload_url(self.client.uploads_url, url), stream=True,
+                                         timeout=REQUEST_TIMEOUT) as response:
+                response.raise_for_status()
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                size = 0
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(64 * 1024):
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, dest)
+            with self._lock:
+                self.downloaded += 1
+                self.bytes += size
+        except Exception as e:
+            with self._lock:
+                self.failures.append({'url': url, 'error': f"{type(e).__name__}: {e}"})
+
+    def add(self, items: Iterable[Dict[str, Any]]):
+        for item in items:
+            for url in [item.get('output_image_url')] + list(item.get('input_image_urls') or []):
+                dest = self.local_path(url) if url else None
+                if dest is None or dest in self.pending:
+                    continue
+                if os.path.exists(dest):
+                    self.skipped += 1
+                    continue
+                self.pending[dest] = self.pool.submit(self._download, url, dest)
+
+    def drain(self):
+        """等待已提交的下载完成；每页结束时调用，写入断点时之前的图片都已在磁盘上"""
+        wait(self.pending.values())
+        self.pending.clear()
+
+    def close(self):
+        self.drain()
+        self.pool.shutdown()
+
+
+class ExportCursor:
+    """断点文件：下一页页码、最后导出的ID、已导出行数、输出文件状态和导出参数"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PromptExporter:
+    """按页导出；后端按创建时间倒序分页，导出期间有新建或删除时页边界会移动，
+    因此记录最后导出的ID，跳过顺序上不在它之后的条目 (ID 随创建时间递增时生效)，续传时从断点的前一页开始读"""
+
+    def __init__(self, client: APIClient, sink, cursor: ExportCursor, params: Dict[str, Any],
+                 bundler: Optional[ImageBundler] = None, page_size: int = MAX_PAGE_SIZE):
+        self.client = client
+        self.sink = sink
+        self.cursor = cursor
+        self.params = params
+        self.bundler = bundler
+        self.page_size = page_size
+        self.rows = 0
+        self.resumed = 0
+        self.total = 0
+        self.pages = 0
+
+    def rate(self, elapsed: float) -> float:
+        return (self.rows - self.resumed) / max(elapsed, 1e-9)
+
+    def _after(self, item: Dict[str, Any], last_id: Any, descending: Optional[bool]) -> bool:
+        item_id = item.get('id')
+        if descending is None or last_id is None or not isinstance(item_id, int):
+            return True
+        return item_id < last_id if descending else item_id > last_id
+
+    def run(self, state: Optional[Dict[str, Any]], on_progress: Optional[ProgressCallback] = None) -> float:
+        started = time.perf_counter()
+        state = state or {}
+        self.rows = self.resumed = state.get('rows', 0)
+        last_id, descending = state.get('last_id'), state.get('descending')
+        start_page = max(1, state.get('page', 1) - 1)
+        for page, data in self.client.iter_prompts(start_page, self.page_size, **self.params['filters']):
+            items = data.get('items') or []
+            ids = [i.get('id') for i in items if isinstance(i.get('id'), int)]
+            if descending is None and len(ids) >= 2:
+                descending = ids[0] > ids[-1]
+            items = [i for i in items if self._after(i, last_id, descending)]
+            self.sink.write(items)
+            if self.bundler is not None:
+                self.bundler.add(items)
+                self.bundler.drain()
+            if items:
+                last_id = items[-1].get('id', last_id)
+            self.rows += len(items)
+            self.pages += 1
+            self.total = data.get('total', self.total)
+            sink_state = self.sink.commit()
+            if sink_state is not None:
+                self.cursor.save({'params': self.params, 'page': page + 1, 'last_id': last_id,
+                                  'descending': descending, 'rows': self.rows, 'sink': sink_state})
+            if on_progress is not None:
+                on_progress(self.rows, self.total, self.rate(time.perf_counter() - started))
+        return time.perf_counter() - started
+
+
+def export_prompts(client: APIClient, path: str, fmt: str, filters: Dict[str, Any], image_dir: Optional[str] = None,
+                   restart: bool = False, page_size: int = MAX_PAGE_SIZE, image_workers: int = 4,
+                   on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """导出到 path 并返回统计；存在参数相同的断点时从断点继续，失败时抛出 ExportError / PageFetchError"""
+    if fmt not in FORMATS:
+        raise ExportError(f"不支持的格式: {fmt}")
+    params = {'format': fmt, 'page_size': page_size, 'images': bool(image_dir),
+              'filters': {k: v for k, v in filters.items() if v is not None and v != ''}}
+    cursor = ExportCursor(f"{path}.cursor.json")
+    state = None if restart else cursor.load()
+    if state is not None and state.get('params') != params:
+        raise ExportError(f"断点文件 {cursor.path} 的导出参数与本次不同，使用 --restart 重新导出")
+    sink = open_sink(path, fmt, state['sink'] if state else None)
+    bundler = ImageBundler(client, image_dir, image_workers) if image_dir else None
+    exporter = PromptExporter(client, sink, cursor, params, bundler, page_size)
+    complete = False
+    try:
+        elapsed = exporter.run(state, on_progress)
+        complete = True
+    finally:
+        if bundler is not None:
+            bundler.close()
+        sink.close(complete)
+    cursor.clear()
+    report = {'path': path, 'format': fmt, 'rows': exporter.rows, 'pages': exporter.pages, 'seconds': elapsed,
+              'rows_per_sec': exporter.rate(elapsed), 'resumed_from': exporter.resumed}
+    if bundler is not None:
+        report['images'] = {'directory': image_dir, 'downloaded': bundler.downloaded, 'skipped': bundler.skipped,
+                            'bytes': bundler.bytes, 'failures': bundler.failures}
+    return report
+
+
+def zip_export(path: str, image_dir: str) -> str:
+    """把导出文件和图片目录打包为一个 zip (图片已压缩，不再压缩)，返回 zip 路径"""
+    zip_path = f"{os.path.splitext(path)[0]}.zip"
+    with zipfile.ZipFile(zip_path, 'w') as bundle:
+        bundle.write(path, os.path.basename(path), compress_type=zipfile.ZIP_DEFLATED)
+        for dirpath, _, filenames in os.walk(image_dir):
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                bundle.write(full, os.path.join('images', os.path.relpath(full, image_dir)))
+    return zip_path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量导出提示词到 JSONL / Parquet")
+    parser.add_argument('output', help="输出文件 (.jsonl 或 .parquet)")
+    parser.add_argument('--format', choices=FORMATS, help="输出格式 (默认按扩展名判断)")
+    parser.add_argument('--keyword', help="关键词筛选")
+    parser.add_argument('--model-name', help="模型名称筛选")
+    parser.add_argument('--tags', help="标签筛选 (逗号分隔)")
+    visibility = parser.add_mutually_exclusive_group()
+    visibility.add_argument('--public', dest='is_public', action='store_const', const=True, help="只导出公开的")
+    visibility.add_argument('--private', dest='is_public', action='store_const', const=False, help="只导出非公开的")
+    parser.add_argument('--page-size', type=int, default=MAX_PAGE_SIZE, help=f"每页条数 (默认 {MAX_PAGE_SIZE})")
+    parser.add_argument('--images', action='store_true', help="同时下载引用的图片")
+    parser.add_argument('--image-dir', help="图片目录 (默认: <输出文件>_images)")
+    parser.add_argument('--image-workers', type=int, default=4, help="并发下载图片数 (默认 4)")
+    parser.add_argument('--restart', action='store_true', help="忽略断点，重新导出")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'jsonl')
+    filters = {'keyword': args.keyword, 'model_name': args.model_name, 'tag_names': args.tags,
+               'is_public': args.is_public}
+    image_dir = (args.image_dir or f"{os.path.splitext(args.output)[0]}_images") if args.images else None
+    last_report = [time.perf_counter()]
+
+    def print_progress(rows: int, total: int, rate: float):
+        now = time.perf_counter()
+        if now - last_report[0] >= 5:
+            last_report[0] = now
+            print(f"  已导出 {rows}/{total} | {rate:.1f} 条/s", flush=True)
+
+    print(f"开始导出: {args.output} ({fmt})")
+    try:
+        report = export_prompts(APIClient(), args.output, fmt, filters, image_dir, args.restart,
+                                max(1, min(args.page_size, MAX_PAGE_SIZE)), max(1, args.image_workers), print_progress)
+    except KeyboardInterrupt:
+        print("\n已中断，重新运行相同命令即可从断点继续")
+        return 130
+    except (ExportError, PageFetchError, OSError) as e:
+        print(f"❌ 导出失败: {e}\n重新运行相同命令即可从断点继续")
+        return 1
+
+    print("\n========== 导出完成 ==========")
+    resumed = f"，其中 {report['resumed_from']} 条来自之前的运行" if report['resumed_from'] else ""
+    print(f"共 {report['rows']} 条{resumed}，{report['pages']} 页，耗时 {report['seconds']:.1f}s，"
+          f"{report['rows_per_sec']:.1f} 条/s")
+    images = report.get('images')
+    if images:
+        print(f"图片: 下载 {images['downloaded']} 张 ({images['bytes'] / 1024 / 1024:.1f} MB)，"
+              f"已存在 {images['skipped']} 张，失败 {len(images['failures'])} 张 -> {images['directory']}")
+        for failure in images['failures'][:20]:
+            print(f"  - {failure['url']}: {failure['error']}")
+    return 1 if images and images['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""批量导入提示词
+
+用法:
+    python bulk_import.py <目录或清单文件> [--workers 8] [--retries 3] [--checkpoint 文件]
+
+数据来源:
+    - 目录: 每张图片为一条提示词，同名的 .json 文件提供完整字段，或同名的 .txt 文件提供提示词文本
+    - CSV / JSONL 清单: 每行一条，字段与创建接口相同；output_image 为输出图路径，
+      input_images 为参考图路径 (CSV 中用 ; 分隔)，路径相对于清单所在目录
+
+中断后使用同一个 checkpoint 文件重新运行，已成功的条目会被跳过。
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
+
+from api_client import APIClient
+from circuit_breaker import may_have_applied
+from config import ALLOWED_FILE_TYPES
+
+PROMPT_FIELDS = ['prompt_text', 'negative_prompt', 'model_name', 'is_public', 'style_description', 'usage_scenario',
+                 'atmosphere_description', 'expressive_intent', 'structure_analysis', 'tag_names']
+
+
+class ImportItem:
+    """一条待导入的提示词及其图片"""
+
+    __slots__ = ('key', 'source', 'prompt_data', 'output_image', 'input_images')
+
+    def __init__(self, source: str, prompt_data: Dict[str, Any], output_image: Optional[str],
+                 input_images: List[str]):
+        self.source = source
+        self.prompt_data = prompt_data
+        self.output_image = output_image
+        self.input_images = input_images
+        # 以内容生成稳定的键，清单行顺序变化后断点续传仍然有效
+        raw = json.dumps([prompt_data, output_image, input_images], sort_keys=True, ensure_ascii=False)
+        self.key = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @property
+    def file_bytes(self) -> int:
+        paths = self.input_images + ([self.output_image] if self.output_image else [])
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+class InvalidItem:
+    """无法解析的清单行/目录条目，计入失败报告后继续导入其余条目"""
+
+    __slots__ = ('source', 'error')
+
+    def __init__(self, source: str, error: str):
+        self.source = source
+        self.error = error
+
+
+def parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', '是')
+
+
+def build_item(source: str, row: Dict[str, Any], base_dir: str, defaults: Dict[str, Any]) -> ImportItem:
+    def resolve(path: str) -> str:
+        return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+    prompt_data = dict(defaults)
+    prompt_data.update({k: row[k] for k in PROMPT_FIELDS if row.get(k) not in (None, '')})
+    if 'is_public' in prompt_data:
+        prompt_data['is_public'] = parse_bool(prompt_data['is_public'])
+    if isinstance(prompt_data.get('tag_names'), list):
+        prompt_data['tag_names'] = ','.join(prompt_data['tag_names'])
+    if isinstance(prompt_data.get('structure_analysis'), dict):
+        prompt_data['structure_analysis'] = json.dumps(prompt_data['structure_analysis'], ensure_ascii=False)
+    if not str(prompt_data.get('prompt_text', '')).strip():
+        raise ValueError("缺少 prompt_text")
+
+    inputs = row.get('input_images') or []
+    if isinstance(inputs, str):
+        inputs = [p for p in inputs.split(';') if p.strip()]
+    output = row.get('output_image') or None
+    return ImportItem(source, prompt_data, resolve(output) if output else None, [resolve(p.strip()) for p in inputs])
+
+
+def safe_build_item(source: str, row: Dict[str, Any], base_dir: str, defaults: Dict[str, Any]):
+    try:
+        return build_item(source, row, base_dir, defaults)
+    except (ValueError, TypeError, AttributeError) as e:
+        return InvalidItem(source, str(e))
+
+
+def iter_directory(root: str, defaults: Dict[str, Any]) -> Iterator[Union[ImportItem, InvalidItem]]:
+    """目录模式：图片 + 同名 .json (完整字段) 或 .txt (提示词文本)"""
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in ALLOWED_FILE_TYPES:
+                continue
+            image_path = os.path.join(dirpath, name)
+            row: Dict[str, Any] = {}
+            json_path, txt_path = os.path.join(dirpath, stem + '.json'), os.path.join(dirpath, stem + '.txt')
+            if os.path.exists(json_path):
+                with open(json_path, encoding='utf-8') as f:
+                    row = json.load(f)
+            elif os.path.exists(txt_path):
+                with open(txt_path, encoding='utf-8') as f:
+                    row = {'prompt_text': f.read().strip()}
+            row.setdefault('output_image', name)
+            yield safe_build_item(image_path, row, dirpath, defaults)
+
+
+def iter_manifest(path: str, defaults: Dict[str, Any]) -> Iterator[Union[ImportItem, InvalidItem]]:
+    """清单模式：.csv 或 .jsonl"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.csv'):
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield safe_build_item(f"{path}:{line_no}", row, base_dir, defaults)
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield InvalidItem(f"{path}:{line_no}", f"JSON 解析失败: {e}")
+                    continue
+                yield safe_build_item(f"{path}:{line_no}", row, base_dir, defaults)
+
+
+class Checkpoint:
+    """追加写入的断点文件，每行记录一个已成功导入条目的键
+
+    上次运行被强制结束时最后一行可能只写了一半，无法解析或缺少 key 的行跳过并给出警告。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._needs_newline = False
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            line = ''
+            # 截断在多字节字符中间的行按无法解析处理
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for line_no, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        key = json.loads(line).get('key')
+                    except (json.JSONDecodeError, AttributeError):
+                        key = None
+                    if not key:
+                        print(f"⚠️ 断点文件 {path} 第 {line_no} 行无法解析，已跳过")
+                        continue
+                    self.done.add(key)
+                self._needs_newline = bool(line) and not line.endswith('\n')
+
+    def mark_done(self, item: ImportItem, prompt_id: Any, duplicate: bool = False):
+        record = {'key': item.key, 'source': item.source, 'prompt_id': prompt_id}
+        if duplicate:
+            record['duplicate'] = True
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+                # 上次运行留下的不完整行单独占一行，不和新记录拼在一起
+                if self._needs_newline:
+                    self._file.write('\n')
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+            self.done.add(item.key)
+
+    def close(self):
+        """刷新并关闭断点文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+def is_transient(result: Dict[str, Any]) -> bool:
+    """网络错误、超时、5xx 和 429 可以重试；4xx 和文件校验错误不重试"""
+    if 'status_code' not in result:
+        return False
+    status = result['status_code']
+    return status is None or status >= 500 or status == 429
+
+
+class BulkImporter:
+    def __init__(self, client: APIClient, checkpoint: Checkpoint, workers: int, retries: int, backoff: float):
+        self.client = client
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.succeeded = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.bytes_sent = 0
+        self.failures: List[Dict[str, Any]] = []
+
+    def _already_created(self, item: ImportItem) -> bool:
+        """上一次尝试结果不明 (超时/5xx) 时，先确认后端是否已经创建，避免重复导入"""
+        result = self.client.check_duplicate(item.prompt_data['prompt_text'])
+        data = result.get('data') if isinstance(result.get('data'), dict) else {}
+        return bool(data.get('exists'))
+
+    def import_one(self, item: ImportItem) -> Dict[str, Any]:
+        files_paths = {'input_images': item.input_images, 'output_image': item.output_image}
+        result: Dict[str, Any] = {}
+        for attempt in range(self.retries + 1):
+            # 连接失败、熔断和 429 时请求没有生效，直接重试
+            if attempt and may_have_applied(result) and self._already_created(item):
+                return {'data': {}, 'duplicate': True}
+            result = self.client.upload_and_create_prompt_multi(files_paths, item.prompt_data)
+            if 'error' not in result or not is_transient(result) or attempt == self.retries:
+                break
+            # 指数退避 + 抖动，避免所有 worker 同时重试
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        return result
+
+    def _handle(self, item: ImportItem):
+        try:
+            result = self.import_one(item)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        with self._lock:
+            if 'error' in result:
+                self.failures.append({'source': item.source, 'key': item.key, 'error': result['error']})
+                return
+            if result.get('duplicate'):
+                self.duplicates += 1
+            else:
+                self.succeeded += 1
+                self.bytes_sent += item.file_bytes
+        data = result.get('data') if isinstance(result.get('data'), dict) else {}
+        self.checkpoint.mark_done(item, data.get('id'), duplicate=bool(result.get('duplicate')))
+
+    def run(self, items: Iterator[Union[ImportItem, InvalidItem]]) -> float:
+        started = time.perf_counter()
+        last_report = started
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            pending = set()
+            for item in items:
+                if isinstance(item, InvalidItem):
+                    self.failures.append({'source': item.source, 'key': None, 'error': item.error})
+                    continue
+                if item.key in self.checkpoint.done:
+                    self.skipped += 1
+                    continue
+                pending.add(pool.submit(self._handle, item))
+                # 限制排队的任务数，清单很大时内存保持有界
+                if len(pending) >= self.workers * 4:
+                    done = next(as_completed(pending))
+                    pending.discard(done)
+                now = time.perf_counter()
+                if now - last_report >= 5:
+                    last_report = now
+                    self.print_progress(now - started)
+            for future in as_completed(pending):
+                future.result()
+        except KeyboardInterrupt:
+            # 取消排队中的条目，等待正在上传的条目结束并写入断点
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            pool.shutdown()
+        return time.perf_counter() - started
+
+    def print_progress(self, elapsed: float):
+        print(f"  已完成 {self.succeeded} | 失败 {len(self.failures)} | 跳过 {self.skipped + self.duplicates} | "
+              f"{self.succeeded / elapsed:.2f} 条/s | {self.bytes_sent / 1024 / 1024 / elapsed:.2f} MB/s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量导入图片和提示词")
+    parser.add_argument('source', help="图片目录，或 .csv / .jsonl 清单文件")
+    parser.add_argument('--workers', type=int, default=4, help="并发上传数 (默认 4)")
+    parser.add_argument('--retries', type=int, default=3, help="临时性错误的最大重试次数 (默认 3)")
+    parser.add_argument('--backoff', type=float, default=1.0, help="首次重试等待秒数，之后指数增长 (默认 1)")
+    parser.add_argument('--checkpoint', help="断点文件路径 (默认: <source>.checkpoint.jsonl)")
+    parser.add_argument('--failures', help="失败明细输出文件 (JSONL)")
+    parser.add_argument('--model-name', help="默认模型名称")
+    parser.add_argument('--tags', help="默认标签 (逗号分隔)")
+    parser.add_argument('--public', action='store_true', help="默认设为公开")
+    args = parser.parse_args(argv)
+
+    defaults: Dict[str, Any] = {'is_public': args.public}
+    if args.model_name:
+        defaults['model_name'] = args.model_name
+    if args.tags:
+        defaults['tag_names'] = args.tags
+
+    source = args.source.rstrip('/\\')
+    items = iter_directory(source, defaults) if os.path.isdir(source) else iter_manifest(source, defaults)
+    checkpoint = Checkpoint(args.checkpoint or f"{source}.checkpoint.jsonl")
+    importer = BulkImporter(APIClient(), checkpoint, max(1, args.workers), max(0, args.retries), args.backoff)
+
+    print(f"开始导入: {source} (并发 {importer.workers}，断点文件 {checkpoint.path}，已完成 {len(checkpoint.done)} 条)")
+    try:
+        elapsed = importer.run(items)
+    except KeyboardInterrupt:
+        print("\n已中断，重新运行相同命令即可从断点继续")
+        return 130
+    except OSError as e:
+        print(f"❌ 无法读取数据源: {e}")
+        return 2
+    finally:
+        checkpoint.close()
+
+    elapsed = max(elapsed, 1e-9)
+    print("\n========== 导入完成 ==========")
+    print(f"成功 {importer.succeeded} 条，失败 {len(importer.failures)} 条，跳过 (断点) {importer.skipped} 条，"
+          f"跳过 (后端已存在) {importer.duplicates} 条，耗时 {elapsed:.1f}s")
+    print(f"吞吐: {importer.succeeded / elapsed:.2f} 条/s，{importer.bytes_sent / 1024 / 1024 / elapsed:.2f} MB/s")
+    if importer.failures:
+        print("\n失败明细:")
+        for failure in importer.failures[:50]:
+            print(f"  - {failure['source']}: {failure['error']}")
+        if len(importer.failures) > 50:
+            print(f"  ... 其余 {len(importer.failures) - 50} 条")
+        if args.failures:
+            with open(args.failures, 'w', encoding='utf-8') as f:
+                for failure in importer.failures:
+                    f.write(json.dumps(failure, ensure_ascii=False) + '\n')
+            print(f"失败明细已写入 {args.failures}")
+    return 1 if importer.failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
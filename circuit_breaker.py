@@ -0,0 +1,150 @@
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# before_request 的判定结果
+ALLOW = 'allow'
+REJECT = 'reject'
+PROBE = 'probe'
+
+STATE_LABELS = {CLOSED: '正常', OPEN: '熔断中', HALF_OPEN: '恢复探测中'}
+
+# 幂等方法失败后可以安全重试
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+RETRYABLE_STATUS = (502, 503, 504)
+
+
+def is_backend_failure(result: Dict[str, Any]) -> bool:
+    """网络错误、超时和 5xx 计为后端故障；4xx 和本地校验错误 (没有 status_code 键) 不计"""
+    if 'status_code' not in result:
+        return False
+    status = result['status_code']
+    return status is None or status >= 500
+
+
+def may_have_applied(result: Dict[str, Any]) -> bool:
+    """失败的请求是否可能已经在后端生效：发送后读/写超时或 5xx；连接失败、熔断和 4xx 时请求没有生效"""
+    if 'status_code' not in result or result.get('circuit_open'):
+        return False
+    status = result['status_code']
+    return bool(result.get('timeout')) if status is None else status >= 500
+
+
+def is_retryable(method: str, result: Dict[str, Any]) -> bool:
+    """幂等请求遇到网络错误、超时或 502/503/504 时重试"""
+    if method not in IDEMPOTENT_METHODS or 'status_code' not in result or result.get('circuit_open'):
+        return False
+    status = result['status_code']
+    return status is None or status in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """第 attempt 次重试前的等待时间：指数退避 + 全抖动，避免所有客户端同时重试"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def breaker_key(endpoint: str) -> str:
+    """把 /prompts/123 这类路径归一为 /prompts/{id}，同一接口共用一个熔断器"""
+    return re.sub(r'/\d+', '/{id}', endpoint)
+
+
+class CircuitBreaker:
+    """单个接口的熔断器
+
+    连续 failure_threshold 次后端故障后打开，期间请求直接失败；
+    reset_timeout 秒后由一个请求先做健康检查，后端恢复则放行该请求作为试探，
+    试探成功关闭熔断器，失败则重新打开。试探开始时重新计时，其余请求在此期间仍快速失败，
+    试探请求被取消而没有结果时，reset_timeout 后允许下一次试探。
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def retry_in(self) -> float:
+        """距离下一次恢复探测的秒数"""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_request(self) -> str:
+        with self._lock:
+            if self.state == CLOSED:
+                return ALLOW
+            if self.retry_in <= 0:
+                self.opened_at = time.monotonic()
+                return PROBE
+            self.rejected += 1
+            return REJECT
+
+    def probe_result(self, healthy: bool) -> str:
+        """健康检查通过时转为半开并放行本次请求，否则继续保持打开"""
+        with self._lock:
+            if healthy:
+                self.state = HALF_OPEN
+                return ALLOW
+            self.opened_at = time.monotonic()
+            self.rejected += 1
+            return REJECT
+
+    def record(self, result: Dict[str, Any]):
+        with self._lock:
+            if not is_backend_failure(result):
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def rejection(self) -> Dict[str, Any]:
+        """熔断期间返回的错误字典，status_code 为 None 与网络错误一致"""
+        return {"error": f"后端服务不可用，接口 {self.name} 已熔断，约 {self.retry_in:.0f}s 后重试",
+                "success": False, "status_code": None, "circuit_open": True}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'endpoint': self.name, 'state': self.state, 'failures': self.failures,
+                'rejected': self.rejected, 'retry_in': round(self.retry_in, 1) if self.state != CLOSED else 0.0}
+
+
+class BreakerRegistry:
+    """按接口懒创建熔断器"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        key = breaker_key(endpoint)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def open_breakers(self) -> List[CircuitBreaker]:
+        with self._lock:
+            return [b for b in self._breakers.values() if b.state != CLOSED]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [b.to_dict() for b in self._breakers.values()]
@@ -6,15 +6,126 @@ API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:8080')
 API_VERSION = 'v1'
 API_PREFIX = f'{API_BASE_URL}/api/{API_VERSION}'
 
+# HTTP连接池配置
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', '50'))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+
+# 请求超时配置 (秒)
+REQUEST_TIMEOUT = 10
+UPLOAD_TIMEOUT = 30
+HEALTH_CHECK_TIMEOUT = 5
+
+# 幂等请求 (GET/PUT/DELETE) 遇到网络错误或 502/503/504 时的重试次数和指数退避 (秒，带随机抖动)
+REQUEST_RETRIES = int(os.getenv('REQUEST_RETRIES', '2'))
+RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', '0.5'))
+RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', '5'))
+# 每个接口的熔断器：连续失败次数达到阈值后快速失败，间隔多少秒后用健康检查探测恢复；阈值为0关闭
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '15'))
+
+# 监控：Prometheus 格式的 /metrics 在单独端口提供 (0 表示不启动)；
+# 超过 SLOW_REQUEST_THRESHOLD 秒的后端请求和事件处理以 WARNING 记录，日志按 SLOW_LOG_SAMPLE_RATE 采样
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '1.0'))
+SLOW_LOG_SAMPLE_RATE = float(os.getenv('SLOW_LOG_SAMPLE_RATE', '1.0'))
+
 # Gradio配置
 GRADIO_SERVER_NAME = os.getenv('GRADIO_SERVER_NAME', '0.0.0.0')
 GRADIO_SERVER_PORT = int(os.getenv('GRADIO_SERVER_PORT', '7860'))
 GRADIO_SHARE = os.getenv('GRADIO_SHARE', 'False').lower() == 'true'
+# 多进程部署 (serve.py)：工作进程数，第 i 个进程监听 GRADIO_SERVER_PORT + i (指标端口同样递增)
+GRADIO_WORKERS = int(os.getenv('GRADIO_WORKERS', '1'))
+# Gradio 队列：未分组事件的并发数、排队上限 (0 不限)，以及各组事件的并发数 (同组事件共享，0 不限)
+QUEUE_DEFAULT_CONCURRENCY = int(os.getenv('QUEUE_DEFAULT_CONCURRENCY', '1'))
+QUEUE_MAX_SIZE = int(os.getenv('QUEUE_MAX_SIZE', '0'))
+QUEUE_CONCURRENCY = {
+    'read': int(os.getenv('QUEUE_READ_CONCURRENCY', '16')),  # 列表、详情、仪表板、标签建议等读操作
+    'write': int(os.getenv('QUEUE_WRITE_CONCURRENCY', '4')),  # 更新/删除提示词、创建/删除标签
+    'upload': int(os.getenv('QUEUE_UPLOAD_CONCURRENCY', '4')),  # 带图片上传的保存
+    'analyze': int(os.getenv('QUEUE_ANALYZE_CONCURRENCY', '8')),  # 智能生成/批量分析 (等待分析任务队列)
+    'export': int(os.getenv('QUEUE_EXPORT_CONCURRENCY', '1')),  # 导出
+}
 
 # 文件上传配置
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_FILE_TYPES = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+# 上传前图片预处理：校验类型和大小 (大小按处理后计算)，可选缩放和重新编码，默认去除元数据
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '0'))  # 最长边像素上限，0 表示不缩放
+IMAGE_REENCODE_FORMAT = os.getenv('IMAGE_REENCODE_FORMAT', '').upper()  # 例如 JPEG / WEBP，空表示保持原格式
+IMAGE_REENCODE_QUALITY = int(os.getenv('IMAGE_REENCODE_QUALITY', '90'))
+IMAGE_STRIP_METADATA = os.getenv('IMAGE_STRIP_METADATA', 'True').lower() == 'true'
+IMAGE_PREPROCESS_WORKERS = int(os.getenv('IMAGE_PREPROCESS_WORKERS', '0'))  # 进程池大小，0 表示CPU核数
+# 上传时每次从磁盘读取的块大小；上传超时按最低上传速度随请求体大小增长
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_MIN_BYTES_PER_SEC = int(os.getenv('UPLOAD_MIN_BYTES_PER_SEC', str(256 * 1024)))
+
+# 详情页缩略图：通过 HTTP 从后端获取原图，生成缩略图保存在 CACHE_DIR/thumbnails 并按总大小淘汰
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '256'))  # 缩略图最长边像素
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))
+THUMBNAIL_REVALIDATE_AFTER = float(os.getenv('THUMBNAIL_REVALIDATE_AFTER', '300'))  # 超过该秒数发送条件请求
+THUMBNAIL_CONCURRENCY = int(os.getenv('THUMBNAIL_CONCURRENCY', '4'))  # 同时下载的图片数
+
+# 仪表板快照缓存时间 (秒)，所有会话共享
+DASHBOARD_CACHE_TTL = float(os.getenv('DASHBOARD_CACHE_TTL', '5'))
+
+# 后端读接口响应缓存 (LRU + TTL)，写操作会精确失效相关条目；任一项设为0可关闭
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '30'))
+# 合并并发的相同读请求 (同一时刻只向后端发一次，其余调用共享结果)
+REQUEST_COALESCING_ENABLED = os.getenv('REQUEST_COALESCING_ENABLED', 'True').lower() == 'true'
+# 多个工作进程 (serve.py) 通过 CACHE_DIR 下的 SQLite 共享响应缓存、仪表板快照和标签列表；
+# 其他进程的写操作最多 SHARED_CACHE_SYNC_INTERVAL 秒后使本进程的缓存失效
+SHARED_CACHE_ENABLED = os.getenv('SHARED_CACHE_ENABLED', 'False').lower() == 'true'
+SHARED_CACHE_SYNC_INTERVAL = float(os.getenv('SHARED_CACHE_SYNC_INTERVAL', '0.2'))
+# 降级模式：后端或数据库不可用时，列表/详情/标签/统计返回 CACHE_DIR 下保存的最近一次响应 (标记为本地快照)，
+# 创建/更新/删除加入持久的待同步队列，后端恢复后按顺序提交；快照最多保留的响应数和回放时探测后端的间隔 (秒)
+OFFLINE_MODE_ENABLED = os.getenv('OFFLINE_MODE_ENABLED', 'True').lower() == 'true'
+OFFLINE_SNAPSHOT_MAX_ENTRIES = int(os.getenv('OFFLINE_SNAPSHOT_MAX_ENTRIES', '2000'))
+OFFLINE_REPLAY_INTERVAL = float(os.getenv('OFFLINE_REPLAY_INTERVAL', '5'))
+
+# 智能分析任务队列：并发分析数 / 每个会话最多待处理任务数 / 队列上限 / 已结束任务保留秒数
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '2'))
+ANALYSIS_MAX_PENDING_PER_USER = int(os.getenv('ANALYSIS_MAX_PENDING_PER_USER', '20'))
+ANALYSIS_MAX_QUEUE = int(os.getenv('ANALYSIS_MAX_QUEUE', '200'))
+ANALYSIS_JOB_RETENTION = float(os.getenv('ANALYSIS_JOB_RETENTION', '3600'))
+
+# 本地持久化数据目录 (上传索引、分析结果缓存等)
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+
+# 智能分析结果缓存：按图片内容哈希 + 提示词 + 模型缓存，总大小超过上限时按最近访问淘汰
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'True').lower() == 'true'
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+
+# 上传去重：按内容哈希复用已上传图片的URL；超过该秒数未校验的条目在使用前确认后端文件仍存在
+# 需要后端在创建接口中保存 input_image_urls / output_image_url，默认关闭
+UPLOAD_DEDUP_ENABLED = os.getenv('UPLOAD_DEDUP_ENABLED', 'False').lower() == 'true'
+UPLOAD_INDEX_VERIFY_AFTER = float(os.getenv('UPLOAD_INDEX_VERIFY_AFTER', '3600'))
+
+# 近似重复图片检测：输出图的感知哈希 (dHash/pHash) 索引，分析或创建前提示库中已有的相似图片
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', 'True').lower() == 'true'
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '10'))  # 64 位哈希中允许不同的位数
+# 后台自动回填间隔 (秒)；回填会下载库中所有尚未索引的输出图，默认关闭，用 python image_hash.py 手动回填
+NEAR_DUPLICATE_BACKFILL_INTERVAL = float(os.getenv('NEAR_DUPLICATE_BACKFILL_INTERVAL', '0'))
 
 # 分页配置
 DEFAULT_PAGE_SIZE = 10
 MAX_PAGE_SIZE = 50
+# 提示词列表翻页缓存 (每个会话)：最多保留的页数、每页有效秒数，以及是否在后台预取相邻页
+PAGE_CACHE_MAX_PAGES = int(os.getenv('PAGE_CACHE_MAX_PAGES', '5'))
+PAGE_CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL', '30'))
+PAGE_PREFETCH = os.getenv('PAGE_PREFETCH', 'True').lower() == 'true'
+# 写操作就地修改表格后，多少秒后重新加载当前页进行校正
+TABLE_RECONCILE_DELAY = float(os.getenv('TABLE_RECONCILE_DELAY', '3'))
+# 校正时重新加载失败后等待时间加倍，连续失败多少次后放弃校正
+TABLE_RECONCILE_MAX_ATTEMPTS = int(os.getenv('TABLE_RECONCILE_MAX_ATTEMPTS', '5'))
+
+# 标签内存索引：输入标签时的建议数量、后台重建间隔 (秒)，以及单个标签的最大长度
+TAG_SUGGESTION_LIMIT = int(os.getenv('TAG_SUGGESTION_LIMIT', '8'))
+TAG_INDEX_REFRESH_INTERVAL = float(os.getenv('TAG_INDEX_REFRESH_INTERVAL', '300'))
+MAX_TAG_LENGTH = int(os.getenv('MAX_TAG_LENGTH', '50'))
+
+# 提示词本地镜像 (SQLite FTS5)：启用后关键词/模型/公开/标签筛选在本地查询，镜像未就绪时回退到后端
+PROMPT_MIRROR_ENABLED = os.getenv('PROMPT_MIRROR_ENABLED', 'False').lower() == 'true'
+PROMPT_MIRROR_SYNC_INTERVAL = float(os.getenv('PROMPT_MIRROR_SYNC_INTERVAL', '60'))  # 后台同步间隔 (秒)
@@ -0,0 +1,355 @@
+"""输出图的感知哈希索引，在分析/创建之前发现库中已有的近似重复图片
+
+用法 (回填已有提示词的输出图):
+    python image_hash.py [--workers 4] [--rebuild]
+
+每张图计算两个 64 位感知哈希 (NumPy):
+    - dHash: 缩小到 9x8 灰度图，比较相邻像素的亮度
+    - pHash: 缩小到 32x32 灰度图做 DCT，取左上 8x8 低频系数与其中位数比较
+缩放、重新编码、轻微调色后的图片哈希只差几位，汉明距离两者都不超过阈值即视为近似重复。
+查询时对全部哈希做向量化的异或和按位计数；索引持久化在 SQLite 中，创建提示词后增量加入，
+回填任务遍历后端所有提示词，补齐缺失的条目并删除后端确认已不存在 (404) 的提示词。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from api_client import APIClient, PageFetchError
+from config import CACHE_DIR, NEAR_DUPLICATE_MAX_DISTANCE, REQUEST_TIMEOUT
+from lazy_imports import lazy_import
+from thumbnails import absolute_upload_url
+
+np = lazy_import('numpy')
+
+HASH_SIZE = 8
+PHASH_SAMPLE_SIZE = 32
+# 灰度标准差低于该值的图片 (纯色、几乎空白) 哈希没有区分度，不参与比对
+FLAT_STDDEV = 2.0
+
+_dct_matrix = None
+
+
+def _dct(size: int):
+    """DCT-II 变换矩阵，pixels 的二维 DCT 为 C @ pixels @ C.T"""
+    global _dct_matrix
+    if _dct_matrix is None or _dct_matrix.shape[0] != size:
+        k = np.arange(size)[:, None]
+        i = np.arange(size)[None, :]
+        matrix = np.sqrt(2.0 / size) * np.cos(np.pi * (2 * i + 1) * k / (2 * size))
+        matrix[0] /= np.sqrt(2.0)
+        _dct_matrix = matrix
+    return _dct_matrix
+
+
+def _bits_to_int(bits) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), 'big')
+
+
+def dhash(gray) -> int:
+    """gray: PIL 灰度图"""
+    from PIL import Image
+
+    pixels = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(pixels) -> int:
+    """pixels: PHASH_SAMPLE_SIZE x PHASH_SAMPLE_SIZE 的灰度数组"""
+    matrix = _dct(PHASH_SAMPLE_SIZE)
+    low = (matrix @ pixels @ matrix.T)[:HASH_SIZE, :HASH_SIZE]
+    # 直流分量只反映整体亮度，不参与中位数
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def image_hashes(source: Union[str, bytes]) -> Optional[Tuple[int, int]]:
+    """返回图片 (文件路径或内容) 的 (dHash, pHash)，纯色图片返回 None；无法解码时抛出 OSError"""
+    from io import BytesIO
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as img:
+        # JPEG 解码时直接按比例缩小，大图只解码所需的分辨率
+        img.draft('L', (PHASH_SAMPLE_SIZE * 4, PHASH_SAMPLE_SIZE * 4))
+        gray = ImageOps.exif_transpose(img).convert('L')
+    pixels = np.asarray(gray.resize((PHASH_SAMPLE_SIZE, PHASH_SAMPLE_SIZE), Image.LANCZOS), dtype=np.float64)
+    if pixels.std() < FLAT_STDDEV:
+        return None
+    return dhash(gray), phash(pixels)
+
+
+_popcount_table = None
+
+
+def popcount64(values):
+    """uint64 数组中每个元素的置位数；NumPy 2.0 起有 bitwise_count，旧版本按字节查表"""
+    global _popcount_table
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    if _popcount_table is None:
+        _popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return _popcount_table[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+class NearDuplicate(NamedTuple):
+    prompt_id: int
+    url: str
+    distance: int
+
+
+class ImageHashIndex:
+    """提示词ID -> 输出图感知哈希的持久化索引
+
+    SQLite 中保存每个提示词的输出图URL和哈希，第一次查询时载入内存。查询时把所有哈希放在两个连续的
+    uint64 数组中，一次异或加按位计数得到全部距离 (10 万条约 0.2ms)；增删之后在下一次查询前重建数组。
+    """
+
+    def __init__(self, db_path: str, uploads_url: str, max_distance: int = 10, backfill_interval: float = 0.0):
+        self.db_path = db_path
+        self.uploads_url = uploads_url
+        self.max_distance = max_distance
+        self.backfill_interval = backfill_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 提示词ID -> (输出图URL, dHash, pHash)
+        self._entries: Optional[Dict[int, Tuple[str, int, int]]] = None
+        # 输出图为纯色的提示词ID -> 输出图URL
+        self._flat: Dict[int, str] = {}
+        # (提示词ID数组, dHash数组, pHash数组)，条目变化后置为 None
+        self._arrays = None
+        self._backfill_task: Optional[asyncio.Future] = None
+        self.lookups = 0
+        self.matches = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # 64 位无符号哈希超出 SQLite INTEGER 的范围，以十六进制文本保存；纯色图片的哈希为 NULL，
+            # 只记录URL，回填时不再重复下载
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_hashes (
+                    prompt_id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    dhash TEXT,
+                    phash TEXT,
+                    created_at REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.commit()
+        return self._conn
+
+    def _load(self) -> Dict[int, Tuple[str, int, int]]:
+        """调用方持有 _lock"""
+        if self._entries is None:
+            rows = self.conn.execute("SELECT prompt_id, url, dhash, phash FROM image_hashes").fetchall()
+            self._entries = {pid: (url, int(d, 16), int(p, 16)) for pid, url, d, p in rows if d is not None}
+            self._flat = {pid: url for pid, url, d, _ in rows if d is None}
+            self._arrays = None
+        return self._entries
+
+    def _matrix(self):
+        """调用方持有 _lock"""
+        if self._arrays is None:
+            entries = self._load()
+            self._arrays = (np.fromiter(entries.keys(), dtype=np.int64, count=len(entries)),
+                            np.fromiter((e[1] for e in entries.values()), dtype=np.uint64, count=len(entries)),
+                            np.fromiter((e[2] for e in entries.values()), dtype=np.uint64, count=len(entries)))
+        return self._arrays
+
+    # ============ 写入 ============
+    def add(self, prompt_id: int, url: str, hashes: Tuple[int, int]):
+        self.add_many([(prompt_id, url, hashes)])
+
+    def add_many(self, items: List[Tuple[int, str, Optional[Tuple[int, int]]]]):
+        """items: (提示词ID, 输出图URL, (dHash, pHash) 或纯色图片的 None)，在一个事务中写入"""
+        if not items:
+            return
+        now = time.time()
+        rows = [(pid, url, f"{hashes[0]:016x}" if hashes else None, f"{hashes[1]:016x}" if hashes else None, now)
+                for pid, url, hashes in items]
+        with self._lock:
+            entries = self._load()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO image_hashes (prompt_id, url, dhash, phash, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows)
+            self.conn.commit()
+            for pid, url, hashes in items:
+                if hashes is None:
+                    entries.pop(pid, None)
+                    self._flat[pid] = url
+                else:
+                    self._flat.pop(pid, None)
+                    entries[pid] = (url, *hashes)
+            self._arrays = None
+
+    def remove(self, prompt_ids: Iterable[int]):
+        prompt_ids = list(prompt_ids)
+        if not prompt_ids:
+            return
+        with self._lock:
+            entries = self._load()
+            self.conn.executemany("DELETE FROM image_hashes WHERE prompt_id = ?", [(i,) for i in prompt_ids])
+            self.conn.commit()
+            for prompt_id in prompt_ids:
+                entries.pop(prompt_id, None)
+                self._flat.pop(prompt_id, None)
+            self._arrays = None
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM image_hashes")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.commit()
+            self._entries = None
+            self._flat = {}
+            self._arrays = None
+
+    # ============ 查询 ============
+    def find(self, hashes: Tuple[int, int], limit: int = 5) -> List[NearDuplicate]:
+        """返回 dHash 和 pHash 的距离都不超过 max_distance 的提示词，按 pHash 距离升序"""
+        d, p = hashes
+        with self._lock:
+            ids, dhashes, phashes = self._matrix()
+            self.lookups += 1
+            p_distance = popcount64(phashes ^ np.uint64(p))
+            hits = np.flatnonzero((p_distance <= self.max_distance)
+                                  & (popcount64(dhashes ^ np.uint64(d)) <= self.max_distance))
+            hits = hits[np.argsort(p_distance[hits], kind='stable')][:limit]
+            found = [NearDuplicate(int(ids[i]), self._entries[int(ids[i])][0], int(p_distance[i])) for i in hits]
+            if found:
+                self.matches += 1
+        return found
+
+    def find_file(self, path: str, limit: int = 5) -> Tuple[Optional[Tuple[int, int]], List[NearDuplicate]]:
+        """计算图片文件的哈希并查询；返回 (哈希, 近似重复列表)，图片无法解码或为纯色时哈希为 None"""
+        try:
+            hashes = image_hashes(path)
+        except OSError:
+            return None, []
+        return hashes, self.find(hashes, limit) if hashes is not None else []
+
+    def link(self, match: NearDuplicate) -> str:
+        """Markdown 链接：提示词ID指向其输出图"""
+        return f"[#{match.prompt_id}]({absolute_upload_url(self.uploads_url, match.url)}) (差异 {match.distance} 位)"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._load()
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'backfilled_at'").fetchone()
+            return {'entries': len(entries), 'flat': len(self._flat), 'lookups': self.lookups,
+                    'matches': self.matches, 'backfilled_at': float(row[0]) if row else None}
+
+    # ============ 回填 ============
+    def _download_hashes(self, client: APIClient, url: str) -> Optional[Tuple[int, int]]:
+        response = client.session.get(absolute_upload_url(self.uploads_url, url), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return image_hashes(response.content)
+
+    def backfill(self, client: APIClient, workers: int = 4,
+                 on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """遍历后端所有提示词 (client 为同步 APIClient)：下载尚未索引或输出图已变化的图片计算哈希，
+        删除后端已不存在的提示词；某页加载失败时抛出 PageFetchError，已写入的条目保留
+
+        按页码遍历期间有提示词被删除时后面的页会前移，个别仍存在的提示词可能没有遍历到，
+        因此遍历中没有出现的提示词逐个向后端确认，返回 404 的才删除。
+        """
+        started = time.perf_counter()
+        with self._lock:
+            known = {pid: entry[0] for pid, entry in self._load().items()}
+            known.update(self._flat)
+        seen = set()
+        report = {'scanned': 0, 'hashed': 0, 'flat': 0, 'failed': 0, 'removed': 0}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-hash') as pool:
+            for _, data in client.iter_prompts():
+                items = data.get('items') or []
+                todo = []
+                for item in items:
+                    prompt_id, url = item.get('id'), item.get('output_image_url')
+                    if prompt_id is None:
+                        continue
+                    seen.add(prompt_id)
+                    if url and known.get(prompt_id) != url:
+                        todo.append((prompt_id, url))
+                futures = [(pid, url, pool.submit(self._download_hashes, client, url)) for pid, url in todo]
+                hashed = []
+                for prompt_id, url, future in futures:
+                    try:
+                        hashes = future.result()
+                    except Exception:
+                        report['failed'] += 1
+                        continue
+                    report['flat' if hashes is None else 'hashed'] += 1
+                    hashed.append((prompt_id, url, hashes))
+                self.add_many(hashed)
+                report['scanned'] += len(items)
+                if on_progress:
+                    on_progress(report['scanned'], data.get('total') or report['scanned'])
+            # 只有完整遍历后才能确定哪些提示词可能已被删除
+            missing = [pid for pid in known if pid not in seen]
+            checks = pool.map(lambda pid: client.get_prompt(pid, cache=False).get('status_code'), missing)
+            gone = [pid for pid, status in zip(missing, checks) if status == 404]
+        self.remove(gone)
+        report['removed'] = len(gone)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled_at', ?)", (str(time.time()),))
+            self.conn.commit()
+            report['entries'] = len(self._entries)
+        report['seconds'] = time.perf_counter() - started
+        return report
+
+    def backfill_due(self) -> bool:
+        if self.backfill_interval <= 0:
+            return False
+        backfilled_at = self.stats()['backfilled_at']
+        return backfilled_at is None or time.time() - backfilled_at >= self.backfill_interval
+
+    def ensure_backfilled(self, client):
+        """距上次回填超过 backfill_interval 时在后台线程中回填，立即返回 (需在事件循环中调用)"""
+        if (self._backfill_task is None or self._backfill_task.done()) and self.backfill_due():
+            self._backfill_task = asyncio.ensure_future(asyncio.to_thread(self.backfill, client))
+            self._backfill_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="为后端所有提示词的输出图建立感知哈希索引")
+    parser.add_argument('--workers', type=int, default=4, help="并发下载图片数 (默认 4)")
+    parser.add_argument('--rebuild', action='store_true', help="清空索引后重新计算所有图片")
+    args = parser.parse_args(argv)
+
+    client = APIClient()
+    index = ImageHashIndex(os.path.join(CACHE_DIR, 'image_hashes.sqlite3'), client.uploads_url,
+                           max_distance=NEAR_DUPLICATE_MAX_DISTANCE)
+    if args.rebuild:
+        index.clear()
+    last_report = [time.perf_counter()]
+
+    def print_progress(scanned: int, total: int):
+        now = time.perf_counter()
+        if now - last_report[0] >= 5:
+            last_report[0] = now
+            print(f"  已扫描 {scanned}/{total}", flush=True)
+
+    print(f"开始回填: {index.db_path}")
+    try:
+        report = index.backfill(client, max(1, args.workers), print_progress)
+    except KeyboardInterrupt:
+        print("\n已中断，已计算的哈希会保留，重新运行即可继续")
+        return 130
+    except PageFetchError as e:
+        print(f"❌ 回填失败: {e}")
+        return 1
+    print(f"✅ 扫描 {report['scanned']} 条，新计算 {report['hashed']} 张，纯色跳过 {report['flat']} 张，"
+          f"失败 {report['failed']} 张，移除 {report['removed']} 条，索引共 {report['entries']} 条，耗时 {report['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
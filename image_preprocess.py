@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (MAX_FILE_SIZE, ALLOWED_FILE_TYPES, IMAGE_MAX_EDGE, IMAGE_REENCODE_FORMAT, IMAGE_REENCODE_QUALITY,
+                    IMAGE_STRIP_METADATA, IMAGE_PREPROCESS_WORKERS)
+
+# PIL 保存格式 -> 文件扩展名
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'BMP': '.bmp'}
+
+
+class ImageValidationError(ValueError):
+    """图片类型或大小不符合上传要求"""
+
+
+class PreprocessResult:
+    """一次上传的预处理结果：替换后的文件路径以及节省的字节数和耗时"""
+
+    def __init__(self, files_paths: Dict, temp_dir: Optional[str], file_count: int, original_bytes: int,
+                 processed_bytes: int, elapsed: float):
+        self.files_paths = files_paths
+        self.temp_dir = temp_dir
+        self.file_count = file_count
+        self.original_bytes = original_bytes
+        self.processed_bytes = processed_bytes
+        self.elapsed = elapsed
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'files': self.file_count, 'original_bytes': self.original_bytes,
+                'processed_bytes': self.processed_bytes, 'bytes_saved': self.bytes_saved,
+                'seconds': round(self.elapsed, 3)}
+
+    def summary(self) -> str:
+        return f"图片预处理节省 {self.bytes_saved / 1024 / 1024:.2f} MB，耗时 {self.elapsed:.2f}s"
+
+    def cleanup(self):
+        """删除预处理生成的临时文件，上传完成后调用"""
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+
+class PreprocessStats:
+    """进程内累计的预处理统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.files = 0
+        self.original_bytes = 0
+        self.processed_bytes = 0
+        self.seconds = 0.0
+
+    def record(self, result: PreprocessResult):
+        with self._lock:
+            self.uploads += 1
+            self.files += result.file_count
+            self.original_bytes += result.original_bytes
+            self.processed_bytes += result.processed_bytes
+            self.seconds += result.elapsed
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'uploads': self.uploads, 'files': self.files, 'original_bytes': self.original_bytes,
+                    'processed_bytes': self.processed_bytes,
+                    'bytes_saved': self.original_bytes - self.processed_bytes, 'seconds': round(self.seconds, 3)}
+
+
+preprocess_stats = PreprocessStats()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 第一次上传时进程内已有事件循环、线程池等线程，fork 出的子进程可能卡在 fork 时被持有的锁上，
+            # 因此用 spawn 启动全新的解释器
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS or None,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def validate_image_file(path: str):
+    """检查扩展名是否在 ALLOWED_FILE_TYPES 中"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ALLOWED_FILE_TYPES:
+        raise ImageValidationError(f"不支持的图片类型 {ext or '(无扩展名)'}: {os.path.basename(path)}，"
+                                   f"允许的类型: {', '.join(ALLOWED_FILE_TYPES)}")
+
+
+def process_image(path: str, out_dir: str, max_edge: int, target_format: str, quality: int,
+                  strip_metadata: bool) -> Tuple[str, int, int]:
+    """处理单张图片，返回 (输出路径, 原始字节数, 输出字节数)；在进程池中执行
+
+    不需要任何变换时直接返回原路径。动图只做校验，不做变换。
+    重新编码后没有变小时也返回原路径，除非需要缩放或原图带有必须去除的 EXIF/XMP 元数据。
+    """
+    from PIL import Image, ImageOps
+
+    original_size = os.path.getsize(path)
+    with Image.open(path) as img:
+        source_format = img.format or 'PNG'
+        if getattr(img, 'is_animated', False):
+            return path, original_size, original_size
+        target = (target_format or source_format).upper()
+        needs_resize = max_edge > 0 and max(img.size) > max_edge
+        if not (needs_resize or strip_metadata or target != source_format):
+            return path, original_size, original_size
+
+        # 先按 EXIF 方向摆正，去掉元数据后方向信息也随之丢失
+        work = ImageOps.exif_transpose(img) if img.getexif().get(0x0112, 1) != 1 else img
+        if needs_resize:
+            work.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if target == 'JPEG' and work.mode not in ('RGB', 'L'):
+            work = work.convert('RGB')
+
+        save_kwargs: Dict[str, Any] = {}
+        if target == 'JPEG' and source_format == 'JPEG' and not needs_resize and work is img:
+            # 只去元数据时沿用原图的量化表，避免二次压缩损失画质
+            save_kwargs.update(quality='keep', subsampling='keep')
+        elif target in ('JPEG', 'WEBP'):
+            save_kwargs.update(quality=quality, optimize=target == 'JPEG')
+        elif target == 'PNG':
+            save_kwargs['optimize'] = True
+        # 不传 exif / icc_profile / pnginfo，重新编码即去除元数据
+        name = os.path.splitext(os.path.basename(path))[0] + FORMAT_EXTENSIONS.get(target, '.' + target.lower())
+        out_path = os.path.join(out_dir, name)
+        work.save(out_path, format=target, **save_kwargs)
+        must_rewrite = needs_resize or (strip_metadata and (bool(img.getexif()) or 'xmp' in img.info
+                                                            or 'XML:com.adobe.xmp' in img.info))
+
+    out_size = os.path.getsize(out_path)
+    if out_size >= original_size and not must_rewrite:
+        os.remove(out_path)
+        return path, original_size, original_size
+    return out_path, original_size, out_size
+
+
+def preprocess_upload(files_paths: Dict) -> PreprocessResult:
+    """上传前的预处理阶段：校验类型、缩放、重新编码并去除元数据，多张图片在进程池中并行处理
+
+    处理后的图片大小超过 MAX_FILE_SIZE 时抛出 ImageValidationError。
+    """
+    started = time.perf_counter()
+    inputs = [p for p in (files_paths.get('input_images') or []) if p]
+    output = files_paths.get('output_image')
+    paths = inputs + ([output] if output else [])
+    for path in paths:
+        validate_image_file(path)
+    if not paths:
+        return PreprocessResult(files_paths, None, 0, 0, 0, 0.0)
+
+    temp_dir = tempfile.mkdtemp(prefix='img_preprocess_')
+    # 每张图片单独一个子目录，避免同名文件互相覆盖
+    jobs = [(path, os.path.join(temp_dir, str(i)), IMAGE_MAX_EDGE, IMAGE_REENCODE_FORMAT, IMAGE_REENCODE_QUALITY,
+             IMAGE_STRIP_METADATA) for i, path in enumerate(paths)]
+    for job in jobs:
+        os.makedirs(job[1])
+    try:
+        if len(jobs) == 1:
+            results: List[Tuple[str, int, int]] = [process_image(*jobs[0])]
+        else:
+            pool = _get_pool()
+            results = list(pool.map(process_image, *zip(*jobs)))
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise ImageValidationError(f"图片无法处理: {e}")
+
+    for (out_path, _, size), source in zip(results, paths):
+        if size > MAX_FILE_SIZE:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise ImageValidationError(f"图片 {os.path.basename(source)} 大小 {size / 1024 / 1024:.1f} MB "
+                                       f"超过上限 {MAX_FILE_SIZE / 1024 / 1024:.0f} MB")
+
+    processed_paths = [r[0] for r in results]
+    new_files_paths = dict(files_paths)
+    new_files_paths['input_images'] = processed_paths[:len(inputs)]
+    if output:
+        new_files_paths['output_image'] = processed_paths[-1]
+    result = PreprocessResult(new_files_paths, temp_dir, len(paths), sum(r[1] for r in results),
+                              sum(r[2] for r in results), time.perf_counter() - started)
+    preprocess_stats.record(result)
+    return result
@@ -0,0 +1,63 @@
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+
+
+class _LazyModule(ModuleType):
+    """与 importlib.util 的延迟模块相同，另外按 Python 3.12 的做法加锁：
+    一个线程正在执行模块代码时，其他线程访问属性会等待加载完成，而不是读到只初始化了一半的模块"""
+
+    def __getattribute__(self, attr):
+        spec = object.__getattribute__(self, '__spec__')
+        state = spec.loader_state
+        with state['lock']:
+            if object.__getattribute__(self, '__class__') is _LazyModule:
+                # 加载模块的线程在模块代码中再次访问 (如导入子模块)，直接读取已有的属性
+                if state['is_loading']:
+                    return object.__getattribute__(self, attr)
+                state['is_loading'] = True
+                attrs = object.__getattribute__(self, '__dict__')
+                # 加载前被修改过的属性在执行模块代码后恢复
+                attrs_then = state['__dict__']
+                attrs_updated = {k: v for k, v in attrs.items() if k not in attrs_then or attrs_then[k] is not v}
+                spec.loader.exec_module(self)
+                if spec.name in sys.modules and sys.modules[spec.name] is not self:
+                    raise ValueError(f"module object for {spec.name!r} substituted in sys.modules during a lazy load")
+                attrs.update(attrs_updated)
+                self.__class__ = ModuleType
+        return getattr(self, attr)
+
+    def __delattr__(self, attr):
+        self.__getattribute__('__class__')
+        delattr(self, attr)
+
+
+class _LazyLoader(importlib.util.LazyLoader):
+    def exec_module(self, module):
+        module.__spec__.loader = self.loader
+        module.__loader__ = self.loader
+        module.__spec__.loader_state = {'__dict__': module.__dict__.copy(), 'lock': threading.RLock(),
+                                        'is_loading': False}
+        module.__class__ = _LazyModule
+
+
+def lazy_import(name: str) -> ModuleType:
+    """返回一个延迟加载的模块：第一次访问其属性时才真正执行导入
+
+    用于 gradio / pandas / httpx / requests 等导入较慢的依赖，缩短进程启动时间。
+    模块已导入时直接返回；找不到模块时与普通 import 一样抛出 ModuleNotFoundError。
+    多个线程同时第一次访问时只有一个线程执行导入，其余线程等待。
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = _LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
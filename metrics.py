@@ -0,0 +1,262 @@
+import bisect
+import functools
+import inspect
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import LOG_LEVEL, SLOW_REQUEST_THRESHOLD, SLOW_LOG_SAMPLE_RATE
+
+# 单位秒；上传和智能分析可能需要数十秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+logger = logging.getLogger('imggen')
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    parts = [f'{n}="{escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    """按标签累加的计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: Any, amount: float = 1.0):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *label_values: Any) -> float:
+        return self._values.get(tuple(str(v) for v in label_values), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {value:g}" for key, value in items]
+
+
+class Histogram:
+    """按标签统计的耗时直方图 (累积桶 + sum + count)，与 Prometheus histogram 格式一致"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数 (非累积，最后一个为 +Inf), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: Any):
+        key = tuple(str(v) for v in label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *label_values: Any) -> int:
+        entry = self._values.get(tuple(str(v) for v in label_values))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = format_labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+api_request_seconds = registry.register(Histogram(
+    'imggen_api_request_duration_seconds', '后端API请求耗时 (每次尝试)', ('method', 'endpoint')))
+api_requests_total = registry.register(Counter(
+    'imggen_api_requests_total', '后端API请求数，status 为HTTP状态码、error (网络错误/超时) 或 circuit_open (熔断快速失败)',
+    ('method', 'endpoint', 'status')))
+api_request_bytes_total = registry.register(Counter(
+    'imggen_api_request_bytes_total', '发送给后端的请求体字节数', ('method', 'endpoint')))
+api_response_bytes_total = registry.register(Counter(
+    'imggen_api_response_bytes_total', '后端返回的响应体字节数', ('method', 'endpoint')))
+api_coalesced_total = registry.register(Counter(
+    'imggen_api_coalesced_requests_total', '与进行中的相同请求合并、未单独发往后端的读请求数', ('method', 'endpoint')))
+table_reconciles_total = registry.register(Counter(
+    'imggen_table_reconciles_total', '写操作后校正提示词表格的次数，result 为 clean (与就地修改一致)、drift 或 error',
+    ('result',)))
+offline_stale_reads_total = registry.register(Counter(
+    'imggen_offline_stale_reads_total', '后端不可用时从本地快照返回的读请求数', ('endpoint',)))
+offline_writes_total = registry.register(Counter(
+    'imggen_offline_writes_total',
+    '待同步写队列的写操作数，result 为 queued (入队)、replayed (回放成功)、failed (后端拒绝) 或 dropped (之前已生效，未重复提交)',
+    ('result',)))
+handler_seconds = registry.register(Histogram(
+    'imggen_handler_duration_seconds', 'Gradio 事件处理函数耗时', ('handler',)))
+handler_errors_total = registry.register(Counter(
+    'imggen_handler_errors_total', 'Gradio 事件处理函数抛出的异常数', ('handler',)))
+
+
+class SlowRequestLog:
+    """结构化 (JSON) 的慢请求日志
+
+    耗时超过 threshold 秒的请求以 WARNING 记录，其余请求以 DEBUG 记录 (日志级别允许时)；
+    两者都按 sample_rate 采样，避免高并发时刷屏。
+    """
+
+    def __init__(self, threshold: float, sample_rate: float, log: logging.Logger = logger):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.log = log
+
+    def record(self, kind: str, name: str, seconds: float, **fields):
+        level = logging.WARNING if seconds >= self.threshold else logging.DEBUG
+        if not self.log.isEnabledFor(level) or random.random() >= self.sample_rate:
+            return
+        event = {'event': 'slow_request' if level == logging.WARNING else 'request', 'kind': kind, 'name': name,
+                 'seconds': round(seconds, 4), **fields}
+        self.log.log(level, json.dumps(event, ensure_ascii=False, default=str))
+
+
+slow_log = SlowRequestLog(SLOW_REQUEST_THRESHOLD, SLOW_LOG_SAMPLE_RATE)
+
+
+def observe_api_request(method: str, endpoint: str, seconds: float, status: Any, request_bytes: int = 0,
+                        response_bytes: int = 0):
+    """记录一次后端请求；endpoint 应为归一化后的路径 (例如 /prompts/{id})"""
+    api_request_seconds.observe(seconds, method, endpoint)
+    api_requests_total.inc(method, endpoint, status)
+    if request_bytes:
+        api_request_bytes_total.inc(method, endpoint, amount=request_bytes)
+    if response_bytes:
+        api_response_bytes_total.inc(method, endpoint, amount=response_bytes)
+    slow_log.record('api', endpoint, seconds, method=method, status=status, request_bytes=request_bytes,
+                    response_bytes=response_bytes)
+
+
+def _record_handler(name: str, started: float, failed: bool):
+    seconds = time.perf_counter() - started
+    handler_seconds.observe(seconds, name)
+    if failed:
+        handler_errors_total.inc(name)
+    slow_log.record('handler', name, seconds, failed=failed)
+
+
+def timed_handler(fn: Callable) -> Callable:
+    """记录 Gradio 事件处理函数的耗时；支持协程和异步生成器 (生成器按全部产出完成计时)
+
+    functools.wraps 保留原函数签名，Gradio 仍能识别 gr.Request / gr.Progress 参数。
+    """
+    name = fn.__name__
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started, failed = time.perf_counter(), False
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _record_handler(name, started, failed)
+        return wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started, failed = time.perf_counter(), False
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _record_handler(name, started, failed)
+    return wrapper
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """在后台线程中提供 /metrics (Prometheus 格式)；port 为 0 时不启动"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """按 LOG_LEVEL 配置 imggen 日志输出到 stderr，每行一条记录"""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
@@ -0,0 +1,107 @@
+import asyncio
+import mimetypes
+import os
+import uuid
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _quote(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartBody:
+    """从磁盘按固定大小分块生成 multipart/form-data 请求体
+
+    请求体总长度在构造时根据文件大小预先算出，因此可以发送 Content-Length 而不是分块编码；
+    文件在迭代到它时才打开、读完即关闭，内存占用只与 chunk_size 有关。
+    """
+
+    def __init__(self, fields: Dict[str, List[str]], files: List[Tuple[str, str]], chunk_size: int = 64 * 1024,
+                 on_progress: Optional[ProgressCallback] = None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        # parts: (头部字节, 文件路径, 内容字节, 内容长度)；普通字段的文件路径为 None，文件的内容字节为 None
+        self._parts: List[Tuple[bytes, Optional[str], Optional[bytes], int]] = []
+        for name, values in fields.items():
+            for value in values:
+                header = (f'--{self.boundary}\r\n'
+                          f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n').encode('utf-8')
+                data = value.encode('utf-8')
+                self._parts.append((header, None, data, len(data)))
+        for name, path in files:
+            filename = os.path.basename(path)
+            mime = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            header = (f'--{self.boundary}\r\n'
+                      f'Content-Disposition: form-data; name="{_quote(name)}"; filename="{_quote(filename)}"\r\n'
+                      f'Content-Type: {mime}\r\n\r\n').encode('utf-8')
+            self._parts.append((header, path, None, os.path.getsize(path)))
+        self._closing = f'--{self.boundary}--\r\n'.encode('utf-8')
+        self.total_bytes = len(self._closing) + sum(len(header) + length + 2 for header, _, _, length in self._parts)
+        self.bytes_sent = 0
+        self._reported = -1
+
+    def __len__(self) -> int:
+        return self.total_bytes
+
+    @property
+    def file_bytes(self) -> int:
+        return sum(length for _, path, _, length in self._parts if path)
+
+    def _advance(self, n: int):
+        self.bytes_sent += n
+        if self.on_progress is None:
+            return
+        # 每前进 1% 才回调一次，避免大文件时刷新过于频繁
+        percent = self.bytes_sent * 100 // self.total_bytes if self.total_bytes else 100
+        if percent != self._reported:
+            self._reported = percent
+            self.on_progress(self.bytes_sent, self.total_bytes)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for header, path, data, _ in self._parts:
+            yield header
+            self._advance(len(header))
+            if path is None:
+                yield data
+                self._advance(len(data))
+            else:
+                with open(path, 'rb') as f:
+                    while True:
+                        chunk = f.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+                        self._advance(len(chunk))
+            yield b'\r\n'
+            self._advance(2)
+        yield self._closing
+        self._advance(len(self._closing))
+
+    async def aiter_chunks(self) -> AsyncIterator[bytes]:
+        """异步版本：文件读取放到线程池中执行，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        for header, path, data, _ in self._parts:
+            yield header
+            self._advance(len(header))
+            if path is None:
+                yield data
+                self._advance(len(data))
+            else:
+                f = await loop.run_in_executor(None, open, path, 'rb')
+                try:
+                    while True:
+                        chunk = await loop.run_in_executor(None, f.read, self.chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+                        self._advance(len(chunk))
+                finally:
+                    f.close()
+            yield b'\r\n'
+            self._advance(2)
+        yield self._closing
+        self._advance(len(self._closing))
@@ -0,0 +1,296 @@
+"""后端不可用时的降级模式：持久化的读快照 + 待同步写操作队列 (SQLite WAL)
+
+- 读快照：offline=True 的读请求 (列表、详情、标签、统计) 成功时保存响应；后端不可用 (网络错误、超时、5xx、熔断) 时
+  返回快照中的旧响应，标记 stale。熔断期间异步客户端立即返回快照，同时在后台重新请求后端
+- 写队列：offline=True 的写请求 (JSON 创建/更新/删除) 在后端不可用时持久保存，返回 queued；
+  队列中还有待同步的写操作时，新的写操作也排在后面，保证按提交顺序生效。
+  WriteReplayer 在后端恢复后按顺序回放，遇到后端故障停止并稍后重试，4xx 等确定失败的写操作记录错误后跳过；
+  之前的尝试可能已经生效 (超时、5xx) 的创建，回放时发现后端已有相同提示词则标记为 dropped，不再提交
+
+带图片上传的创建需要保留临时文件，不进入队列。多个工作进程共用 CACHE_DIR 下的同一个文件，同一时刻只有一个进程回放。
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from circuit_breaker import breaker_key, is_backend_failure, may_have_applied
+from metrics import offline_stale_reads_total, offline_writes_total
+from records import dumps, loads
+
+# 每写入多少次快照检查一次条目数上限
+PURGE_EVERY = 100
+# 回放租约秒数：持有租约的进程退出后，其他进程最多等待这么久接手
+REPLAY_LEASE = 60.0
+
+PENDING = 'pending'
+FAILED = 'failed'
+DROPPED = 'dropped'
+
+
+def format_age(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds} 秒"
+    if seconds < 3600:
+        return f"{seconds // 60} 分钟"
+    if seconds < 86400:
+        return f"{seconds // 3600} 小时"
+    return f"{seconds // 86400} 天"
+
+
+def stale_note(result: Dict[str, Any]) -> str:
+    """stale 响应的提示文字，非 stale 响应返回空字符串"""
+    if not result.get('stale'):
+        return ""
+    return f"⚠️ 后端不可用，显示 {format_age(time.time() - result['stale_since'])}前的本地快照"
+
+
+class OfflineStore:
+    """读快照和写队列，每个进程一个连接"""
+
+    def __init__(self, db_path: str, max_entries: int = 2000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_purge = 0
+        # 快照在单独的线程中按顺序写入，不占用请求路径
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='offline-snapshot')
+        self.stale_reads = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    endpoint TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (endpoint, params)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_stored ON snapshots (stored_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    method TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    body BLOB,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    maybe_applied INTEGER NOT NULL DEFAULT 0
+                )""")
+            if 'maybe_applied' not in {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}:
+                # 早期版本创建的队列文件没有这一列
+                conn.execute("ALTER TABLE outbox ADD COLUMN maybe_applied INTEGER NOT NULL DEFAULT 0")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )""")
+            self._conn = conn
+        return self._conn
+
+    # ============ 读快照 ============
+    def remember(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], value: Dict[str, Any]):
+        """保存读响应 (在调用线程中编码，写入在后台完成)"""
+        endpoint, params = key
+        self._writer.submit(self._store, endpoint, urlencode(params), dumps(value), time.time())
+
+    def _store(self, endpoint: str, params: str, data: bytes, stored_at: float):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO snapshots (endpoint, params, value, stored_at) "
+                              "VALUES (?, ?, ?, ?)", (endpoint, params, data, stored_at))
+            self._writes_since_purge += 1
+            if self._writes_since_purge >= PURGE_EVERY:
+                self._writes_since_purge = 0
+                # 超过上限时删除最早保存的快照
+                self.conn.execute("DELETE FROM snapshots WHERE rowid IN (SELECT rowid FROM snapshots "
+                                  "ORDER BY stored_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def recall(self, key: Tuple[str, Tuple[Tuple[str, str], ...]],
+               error: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """返回标记为 stale 的快照响应 (stale_since 为保存时间 time.time())；没有快照时返回 None"""
+        endpoint, params = key
+        with self._lock:
+            row = self.conn.execute("SELECT value, stored_at FROM snapshots WHERE endpoint = ? AND params = ?",
+                                    (endpoint, urlencode(params))).fetchone()
+            if row is None:
+                return None
+            self.stale_reads += 1
+        offline_stale_reads_total.inc(breaker_key(endpoint))
+        return {**loads(row[0]), 'stale': True, 'stale_since': row[1], 'stale_error': error}
+
+    # ============ 写队列 ============
+    def enqueue(self, method: str, endpoint: str, body: Optional[Dict[str, Any]],
+                error: Optional[str] = None, maybe_applied: bool = False) -> Dict[str, Any]:
+        """保存一个写操作，返回 queued 响应；error 为后端故障信息，None 表示因为队列非空而排队
+
+        maybe_applied 表示失败的那次请求可能已经在后端生效 (超时、5xx)，回放时需要先确认。
+        """
+        data = dumps(body) if body is not None else None
+        with self._lock:
+            seq = self.conn.execute("INSERT INTO outbox (method, endpoint, body, state, created_at, last_error, "
+                                    "maybe_applied) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (method, endpoint, data, PENDING, time.time(), error,
+                                     int(maybe_applied))).lastrowid
+        offline_writes_total.inc('queued')
+        reason = "后端不可用" if error is not None else "前面还有待同步的写操作"
+        return {'success': True, 'queued': True, 'queue_seq': seq, 'pending': self.pending_count(),
+                'message': f"{reason}，写操作已加入待同步队列 (#{seq})"}
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE state = ?", (PENDING,)).fetchone()[0]
+
+    def next_pending(self) -> Optional[Tuple[int, str, str, Optional[Dict[str, Any]], bool]]:
+        """最早的待同步写操作 (序号, 方法, 接口, 请求体, 之前的尝试是否可能已生效)"""
+        with self._lock:
+            row = self.conn.execute("SELECT seq, method, endpoint, body, maybe_applied FROM outbox WHERE state = ? "
+                                    "ORDER BY seq LIMIT 1", (PENDING,)).fetchone()
+        if row is None:
+            return None
+        seq, method, endpoint, body, maybe_applied = row
+        return seq, method, endpoint, loads(body) if body is not None else None, bool(maybe_applied)
+
+    def complete(self, seq: int):
+        with self._lock:
+            self.conn.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+        offline_writes_total.inc('replayed')
+
+    def retry_later(self, seq: int, error: str, maybe_applied: bool = False):
+        with self._lock:
+            self.conn.execute("UPDATE outbox SET attempts = attempts + 1, last_error = ?, "
+                              "maybe_applied = MAX(maybe_applied, ?) WHERE seq = ?", (error, int(maybe_applied), seq))
+
+    def fail(self, seq: int, error: str):
+        """后端拒绝的写操作保留在队列中供查看，不再回放"""
+        with self._lock:
+            self.conn.execute("UPDATE outbox SET state = ?, attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                              (FAILED, error, seq))
+        offline_writes_total.inc('failed')
+
+    def drop(self, seq: int, reason: str):
+        """之前的尝试已经生效的写操作不再提交，保留在队列中供查看"""
+        with self._lock:
+            self.conn.execute("UPDATE outbox SET state = ?, last_error = ? WHERE seq = ?", (DROPPED, reason, seq))
+        offline_writes_total.inc('dropped')
+
+    # ============ 回放租约 ============
+    def acquire_replay(self, owner: str) -> bool:
+        """获取 (或续期) 回放租约；其他进程持有未过期的租约时返回 False"""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES ('replay', ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?", (owner, now + REPLAY_LEASE, now))
+            return cursor.rowcount > 0
+
+    def release_replay(self, owner: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM leases WHERE name = 'replay' AND owner = ?", (owner,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshots = self.conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+            counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+        return {'snapshots': snapshots, 'stale_reads': self.stale_reads, 'pending_writes': counts.get(PENDING, 0),
+                'failed_writes': counts.get(FAILED, 0), 'dropped_writes': counts.get(DROPPED, 0)}
+
+
+class WriteReplayer:
+    """在异步客户端的事件循环中按顺序回放待同步的写操作
+
+    有待同步的写操作时每隔 interval 秒用 health_check 探测后端，恢复后逐条提交。
+    之前的尝试可能已生效 (超时、5xx) 的创建提示词先用 check_duplicate 确认，后端已有时丢弃 (dropped)，
+    其余创建直接提交；删除时后端返回 404 视为已生效。
+    """
+
+    def __init__(self, store: OfflineStore, client, interval: float = 5.0):
+        self.store = store
+        self.client = client
+        self.interval = interval
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.replayed = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+
+    async def _apply(self, method: str, endpoint: str, body: Optional[Dict[str, Any]],
+                     maybe_applied: bool) -> Dict[str, Any]:
+        if maybe_applied and method == 'POST' and endpoint == '/prompts/' and body and body.get('prompt_text'):
+            duplicate = await self.client.check_duplicate(body['prompt_text'])
+            if is_backend_failure(duplicate):
+                return duplicate
+            if (duplicate.get('data') or {}).get('exists'):
+                return {'success': True, 'duplicate': True}
+        result = await self.client.replay_write(method, endpoint, body)
+        if method == 'DELETE' and result.get('status_code') == 404:
+            return {'success': True}
+        return result
+
+    async def replay(self) -> int:
+        """回放到队列为空或遇到后端故障为止，返回本次成功提交的写操作数"""
+        if self.store.pending_count() == 0 or 'error' in await self.client.health_check():
+            return 0
+        replayed = 0
+        try:
+            # 每提交一条续期一次租约
+            while self.store.acquire_replay(self.owner):
+                entry = self.store.next_pending()
+                if entry is None:
+                    break
+                seq, method, endpoint, body, maybe_applied = entry
+                result = await self._apply(method, endpoint, body, maybe_applied)
+                if is_backend_failure(result):
+                    self.last_error = result.get('error')
+                    self.store.retry_later(seq, self.last_error, may_have_applied(result))
+                    break
+                if 'error' in result:
+                    self.store.fail(seq, result['error'])
+                elif result.get('duplicate'):
+                    self.store.drop(seq, "之前超时的请求已在后端生效，未重复提交")
+                    self.dropped += 1
+                else:
+                    self.store.complete(seq)
+                    replayed += 1
+        finally:
+            self.store.release_replay(self.owner)
+        self.replayed += replayed
+        return replayed
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.replay()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def ensure_running(self):
+        """在当前事件循环中启动后台回放 (只启动一次)；已启动时立即唤醒一次"""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._loop())
+        else:
+            self._wake.set()
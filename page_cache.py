@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from response_cache import normalize_params
+
+PageLoader = Callable[[int, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class PageCache:
+    """一组筛选条件下的分页缓存 (每个会话一个)
+
+    翻到第 N 页后在后台预取第 N-1 / N+1 页，翻页时直接从内存返回；
+    最多保留 max_pages 页 (LRU)，每页 ttl 秒后过期。筛选条件变化，或 generation()
+    变化 (客户端响应缓存因写操作失效) 时丢弃全部页面和进行中的预取。
+    后端不可用时返回的本地快照 (stale) 不缓存、也不触发预取，下一次翻页重新请求。
+    """
+
+    def __init__(self, loader: PageLoader, generation: Callable[[], int], max_pages: int = 5, ttl: float = 30.0,
+                 prefetch: bool = True):
+        self.loader = loader
+        self.generation = generation
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.prefetch = prefetch
+        self.total_pages: Optional[int] = None
+        self._key: Optional[Tuple[Tuple[Tuple[str, str], ...], int]] = None
+        self._pages: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+
+    def __deepcopy__(self, memo):
+        # 作为 gr.State 的值时不复制 (进行中的预取任务无法复制)
+        return self
+
+    def _sync_key(self, filters: Dict[str, Any]):
+        key = (normalize_params(filters), self.generation())
+        if key != self._key:
+            self.reset()
+            self._key = key
+
+    def reset(self):
+        # 进行中的加载不取消 (可能有调用者在等待)，完成后因键不匹配而不会写入
+        self._inflight.clear()
+        self._pages.clear()
+        self.total_pages = None
+        self._key = None
+
+    def _cached(self, page: int) -> Optional[Dict[str, Any]]:
+        entry = self._pages.get(page)
+        if entry is None:
+            return None
+        loaded_at, result = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            del self._pages[page]
+            return None
+        self._pages.move_to_end(page)
+        return result
+
+    async def _load(self, page: int, filters: Dict[str, Any], key) -> Dict[str, Any]:
+        try:
+            result = await self.loader(page, filters)
+        finally:
+            if self._key == key:
+                self._inflight.pop(page, None)
+        # 加载期间筛选条件或数据发生变化时不写入
+        if 'error' not in result and not result.get('stale') and self._key == key and key[1] == self.generation():
+            data = result.get('data') or {}
+            self.total_pages = data.get('total_pages', self.total_pages)
+            self._pages[page] = (time.monotonic(), result)
+            self._pages.move_to_end(page)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return result
+
+    def _start(self, page: int, filters: Dict[str, Any]) -> asyncio.Task:
+        task = self._inflight.get(page)
+        if task is None:
+            task = self._inflight[page] = asyncio.ensure_future(self._load(page, filters, self._key))
+        return task
+
+    def _prefetch_neighbours(self, page: int, filters: Dict[str, Any]):
+        for neighbour in (page + 1, page - 1):
+            if neighbour < 1 or (self.total_pages is not None and neighbour > self.total_pages):
+                continue
+            if neighbour in self._inflight or self._cached(neighbour) is not None:
+                continue
+            self.prefetches += 1
+            self._start(neighbour, filters)
+
+    async def get(self, page: int, filters: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """返回 (实际页码, 响应字典)，页码超出已知总页数时取最后一页；
+        未缓存时等待加载 (与进行中的预取共享同一次请求)"""
+        self._sync_key(filters)
+        page = max(1, page)
+        if self.total_pages:
+            page = min(page, self.total_pages)
+        result = self._cached(page)
+        if result is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # shield: 当前请求被取消时，加载仍继续并写入缓存
+            result = await asyncio.shield(self._start(page, filters))
+            if self.total_pages and page > self.total_pages:
+                # 首次请求时还不知道总页数，超出范围则改取最后一页
+                return await self.get(self.total_pages, filters)
+        if self.prefetch and 'error' not in result and not result.get('stale'):
+            self._prefetch_neighbours(page, filters)
+        return page, result
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {'pages': len(self._pages), 'max_pages': self.max_pages, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0, 'prefetches': self.prefetches}
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from records import loads
+
+# 镜像表中参与全文检索的列；trigram 分词器按三字符切分，中文也能做子串匹配
+FTS_COLUMNS = ('prompt_text', 'negative_prompt', 'style_description', 'tags')
+# trigram 至少需要 3 个字符，更短的关键词改用 LIKE
+FTS_MIN_QUERY_CHARS = 3
+
+
+# 写入或更新一行；ON CONFLICT DO UPDATE 触发 prompts_au，FTS 索引随之更新 (INSERT OR REPLACE 不会触发删除触发器)
+UPSERT_SQL = f"""
+    INSERT INTO prompts (id, {', '.join(FTS_COLUMNS)}, model_name, is_public, created_at, updated_at, data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in FTS_COLUMNS)}, model_name = excluded.model_name,
+        is_public = excluded.is_public, created_at = excluded.created_at,
+        updated_at = excluded.updated_at, data = excluded.data"""
+
+
+def escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def fts_phrase(text: str) -> str:
+    """把用户输入转成 FTS5 短语查询，避免其中的引号和运算符被当作查询语法"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def prompt_row(item: Dict[str, Any]) -> Tuple:
+    tags = ','.join(t.get('name', '') for t in item.get('tags') or [] if t.get('name'))
+    return (item['id'], item.get('prompt_text') or '', item.get('negative_prompt') or '',
+            item.get('style_description') or '', tags, item.get('model_name') or '',
+            1 if item.get('is_public') else 0, item.get('created_at') or '', item.get('updated_at') or '',
+            json.dumps(item, ensure_ascii=False))
+
+
+class PromptMirror:
+    """提示词的本地 SQLite 镜像，FTS5 索引覆盖提示词、负面提示词、风格描述和标签
+
+    首次同步分页拉取全部提示词；之后每次同步只重写 updated_at 变化的行，并删除后端已不存在的行
+    (后端列表接口没有按更新时间过滤的参数，因此仍需遍历所有页)。各页并发拉取，期间其他客户端增删提示词会使页面错位，
+    因此只有各页的 total 一致且与拉取到的条数相同时才删除行。
+    只有在本进程完成过同步、且之后没有发生未写入镜像的写操作 (generation 未变) 时才使用镜像查询，
+    否则 search 返回 None，由调用方回退到后端接口，同时在后台触发一次同步。
+    本进程的提示词创建/更新/删除通过 apply_write 直接写入镜像，不需要重新同步。
+    """
+
+    def __init__(self, db_path: str, generation: Callable[[], int], page_size: int = 50,
+                 sync_interval: float = 60.0, concurrency: int = 4):
+        self.db_path = db_path
+        self.generation = generation
+        self.page_size = page_size
+        self.sync_interval = sync_interval
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._synced_generation: Optional[int] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.synced_at: Optional[float] = None
+        self.last_sync_seconds = 0.0
+        self.last_sync_changes = (0, 0)
+        self.last_error: Optional[str] = None
+        self.searches = 0
+        self.fallbacks = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS prompts (
+                    id INTEGER PRIMARY KEY,
+                    prompt_text TEXT NOT NULL,
+                    negative_prompt TEXT NOT NULL,
+                    style_description TEXT NOT NULL,
+                    tags TEXT NOT NULL,
+                    model_name TEXT NOT NULL,
+                    is_public INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_prompts_created ON prompts (created_at DESC, id DESC);
+                CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+                    {', '.join(FTS_COLUMNS)}, content='prompts', content_rowid='id', tokenize='trigram');
+                CREATE TRIGGER IF NOT EXISTS prompts_ai AFTER INSERT ON prompts BEGIN
+                    INSERT INTO prompts_fts (rowid, {', '.join(FTS_COLUMNS)})
+                    VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+                END;
+                CREATE TRIGGER IF NOT EXISTS prompts_ad AFTER DELETE ON prompts BEGIN
+                    INSERT INTO prompts_fts (prompts_fts, rowid, {', '.join(FTS_COLUMNS)})
+                    VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+                END;
+                CREATE TRIGGER IF NOT EXISTS prompts_au AFTER UPDATE ON prompts BEGIN
+                    INSERT INTO prompts_fts (prompts_fts, rowid, {', '.join(FTS_COLUMNS)})
+                    VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+                    INSERT INTO prompts_fts (rowid, {', '.join(FTS_COLUMNS)})
+                    VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+                END;
+            """)
+            self._conn.commit()
+        return self._conn
+
+    @property
+    def ready(self) -> bool:
+        """本进程已完成同步，且同步后没有发生写操作"""
+        return self._synced_generation is not None and self._synced_generation == self.generation()
+
+    # ============ 同步 ============
+    async def _fetch_all(self, client) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """拉取所有页，返回 (提示词列表, 是否是完整一致的快照)；某页失败时返回 None"""
+        first = await client.get_prompts(page=1, page_size=self.page_size, cache=False)
+        if 'error' in first:
+            self.last_error = first['error']
+            return None
+        data = first.get('data') or {}
+        pages = [first]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(page: int):
+            async with semaphore:
+                return await client.get_prompts(page=page, page_size=self.page_size, cache=False)
+
+        pages += await asyncio.gather(*(fetch(p) for p in range(2, (data.get('total_pages') or 1) + 1)))
+        failed = next((p for p in pages if 'error' in p), None)
+        if failed is not None:
+            # 数据不完整时不做删除判断，放弃本次同步
+            self.last_error = failed['error']
+            return None
+        items: Dict[int, Dict[str, Any]] = {}
+        for page in pages:
+            for item in (page.get('data') or {}).get('items') or []:
+                if item.get('id') is not None:
+                    items[item['id']] = item
+        totals = {(page.get('data') or {}).get('total') for page in pages}
+        return list(items.values()), totals == {len(items)}
+
+    def _apply(self, items: List[Dict[str, Any]], complete: bool = True) -> Tuple[int, int]:
+        """写入变化的行，complete 时删除后端已不存在的行，返回 (写入行数, 删除行数)"""
+        with self._lock:
+            existing = dict(self.conn.execute("SELECT id, updated_at FROM prompts").fetchall())
+            changed = [prompt_row(item) for item in items
+                       if item['id'] not in existing or not item.get('updated_at')
+                       or existing[item['id']] != item.get('updated_at')]
+            deleted = [(i,) for i in set(existing) - {item['id'] for item in items}] if complete else []
+            self.conn.executemany(UPSERT_SQL, changed)
+            self.conn.executemany("DELETE FROM prompts WHERE id = ?", deleted)
+            self.conn.commit()
+        return len(changed), len(deleted)
+
+    async def sync(self, client) -> bool:
+        """与后端同步一次；期间发生写操作时本次结果不标记为可用，等待下一次同步"""
+        generation = self.generation()
+        started = time.perf_counter()
+        fetched = await self._fetch_all(client)
+        if fetched is None:
+            return False
+        self.last_sync_changes = await asyncio.get_running_loop().run_in_executor(None, self._apply, *fetched)
+        self.last_sync_seconds = time.perf_counter() - started
+        self.synced_at = time.time()
+        self.last_error = None
+        self._synced_generation = generation
+        return True
+
+    def write_token(self) -> Optional[int]:
+        """写操作之前调用：镜像可用时返回当前 generation，写入镜像后据此保持可用"""
+        return self._synced_generation if self.ready else None
+
+    def _write(self, item: Optional[Dict[str, Any]], deleted_id: Optional[int]):
+        with self._lock:
+            if item is not None:
+                self.conn.execute(UPSERT_SQL, prompt_row(item))
+            if deleted_id is not None:
+                self.conn.execute("DELETE FROM prompts WHERE id = ?", (deleted_id,))
+            self.conn.commit()
+
+    async def apply_write(self, token: Optional[int], item: Optional[Dict[str, Any]] = None,
+                          deleted_id: Optional[int] = None):
+        """本进程的写操作成功后写入镜像：item 为创建/更新响应中的提示词，deleted_id 为删除的提示词ID
+
+        写操作之前镜像可用 (token 为 write_token 的返回值) 时，写入后镜像继续可用，不触发全量同步。
+        """
+        if item is not None and item.get('id') is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._write, item, deleted_id)
+        if token is not None and self._synced_generation == token:
+            self._synced_generation = self.generation()
+
+    async def _sync_loop(self, client):
+        while True:
+            try:
+                await self.sync(client)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def ensure_syncing(self, client):
+        """在当前事件循环中启动后台同步 (只启动一次)；镜像不可用时提前唤醒同步"""
+        if self._sync_task is None:
+            self._wake = asyncio.Event()
+            self._sync_task = asyncio.ensure_future(self._sync_loop(client))
+        elif not self.ready:
+            self._wake.set()
+
+    # ============ 查询 ============
+    def _query(self, keyword: str, model_name: str, is_public: Optional[bool], tag_names: str, page: int,
+               page_size: int) -> Dict[str, Any]:
+        conditions, params = [], []
+        keyword = (keyword or '').strip()
+        if len(keyword) >= FTS_MIN_QUERY_CHARS:
+            conditions.append("id IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)")
+            params.append(fts_phrase(keyword))
+        elif keyword:
+            conditions.append('(' + ' OR '.join(f"{c} LIKE ? ESCAPE '\\'" for c in FTS_COLUMNS) + ')')
+            params += [f"%{escape_like(keyword)}%"] * len(FTS_COLUMNS)
+        if model_name:
+            conditions.append("model_name = ? COLLATE NOCASE")
+            params.append(model_name.strip())
+        if is_public is not None:
+            conditions.append("is_public = ?")
+            params.append(1 if is_public else 0)
+        for tag in [t.strip() for t in (tag_names or '').split(',') if t.strip()]:
+            conditions.append("(',' || tags || ',') LIKE ? ESCAPE '\\'")
+            params.append(f"%,{escape_like(tag)},%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM prompts {where}", params).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT data FROM prompts {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size]).fetchall()
+        return {'success': True, 'source': 'mirror',
+                'data': {'items': [loads(r[0]) for r in rows], 'page': page, 'page_size': page_size,
+                         'total': total, 'total_pages': max(1, -(-total // page_size))}}
+
+    async def search(self, client, page: int = 1, page_size: int = 10, keyword: str = '', model_name: str = '',
+                     is_public: Optional[bool] = None, tag_names: str = '') -> Optional[Dict[str, Any]]:
+        """在镜像中查询，返回与 get_prompts 相同结构的响应；镜像不可用或查询出错时返回 None"""
+        self.ensure_syncing(client)
+        if not self.ready:
+            self.fallbacks += 1
+            return None
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, self._query, keyword, model_name, is_public, tag_names, page, page_size)
+        except sqlite3.Error as e:
+            self.last_error = f"镜像查询失败: {e}"
+            self.fallbacks += 1
+            return None
+        self.searches += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+        written, deleted = self.last_sync_changes
+        return {'entries': entries, 'ready': self.ready, 'synced_at': self.synced_at,
+                'last_sync_seconds': round(self.last_sync_seconds, 3), 'last_sync_written': written,
+                'last_sync_deleted': deleted, 'searches': self.searches, 'fallbacks': self.fallbacks,
+                'last_error': self.last_error}
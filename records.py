@@ -0,0 +1,105 @@
+"""提示词和标签的紧凑记录
+
+后端响应仍以 dict 缓存和在客户端内传递；需要批量渲染的地方 (提示词列表、标签表格) 转成带 __slots__ 的记录，
+structure_analysis 在第一次访问时才解析。JSON 编解码优先使用 orjson (可选依赖，未安装时使用标准库 json)。
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from lazy_imports import lazy_import
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+np = lazy_import('numpy')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """解码JSON；格式错误时抛出 json.JSONDecodeError (orjson 的异常也是它的子类)"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """编码为 UTF-8 JSON 字节串；元组编码为数组"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def format_timestamp(ts):
+    try:
+        return datetime.fromisoformat(ts.replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M:%S')
+    except:
+        return ts
+
+
+def format_timestamps(values: Sequence[Any]) -> List[Any]:
+    """批量格式化时间戳：用 NumPy datetime64 一次解析整列 (只取前 19 个字符，与 format_timestamp 一样保留原时区的时间)，
+    解析不了的值逐个交给 format_timestamp，结果与逐个调用相同"""
+    try:
+        parsed = np.array([v[:19] if isinstance(v, str) else None for v in values], dtype='datetime64[s]')
+    except ValueError:
+        return [format_timestamp(v) for v in values]
+    return [format_timestamp(v) if text == 'NaT' else text.replace('T', ' ')
+            for v, text in zip(values, np.datetime_as_string(parsed))]
+
+
+class TagRecord:
+    __slots__ = ('id', 'name', 'created_at')
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data.get('id')
+        self.name = data.get('name') or ''
+        self.created_at = data.get('created_at')
+
+
+class PromptRecord:
+    """一条提示词；structure_analysis 保留原始值，访问时才解析为 dict 并缓存"""
+
+    __slots__ = ('id', 'prompt_text', 'negative_prompt', 'model_name', 'is_public', 'style_description',
+                 'usage_scenario', 'atmosphere_description', 'expressive_intent', 'output_image_url',
+                 'input_image_urls', 'tags', 'created_at', 'updated_at', '_analysis')
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data.get('id')
+        self.prompt_text = data.get('prompt_text') or ''
+        self.negative_prompt = data.get('negative_prompt') or ''
+        self.model_name = data.get('model_name') or ''
+        self.is_public = bool(data.get('is_public'))
+        self.style_description = data.get('style_description') or ''
+        self.usage_scenario = data.get('usage_scenario') or ''
+        self.atmosphere_description = data.get('atmosphere_description') or ''
+        self.expressive_intent = data.get('expressive_intent') or ''
+        self.output_image_url = data.get('output_image_url') or ''
+        self.input_image_urls: List[str] = data.get('input_image_urls') or []
+        self.tags: Tuple[TagRecord, ...] = tuple(TagRecord(t) for t in data.get('tags') or [])
+        self.created_at = data.get('created_at') or ''
+        self.updated_at = data.get('updated_at') or ''
+        self._analysis = data.get('structure_analysis')
+
+    @property
+    def tag_names(self) -> List[str]:
+        return [t.name for t in self.tags]
+
+    @property
+    def structure_analysis(self) -> Dict[str, Any]:
+        analysis = self._analysis
+        if isinstance(analysis, dict):
+            return analysis
+        parsed: Dict[str, Any] = {}
+        if isinstance(analysis, (str, bytes)) and analysis:
+            try:
+                parsed = loads(analysis)
+            except ValueError:
+                pass
+        self._analysis = parsed if isinstance(parsed, dict) else {}
+        return self._analysis
+
+
+def prompt_records(items: Optional[List[Dict[str, Any]]]) -> List[PromptRecord]:
+    return [PromptRecord(item) for item in items or []]
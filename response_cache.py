@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from shared_cache import SharedCache
+
+CacheKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, str], ...]:
+    """规范化查询参数：去掉空值，统一转成字符串并按键排序，保证等价查询得到同一个键"""
+    if not params:
+        return ()
+    items = []
+    for key, value in params.items():
+        if value is None or value == '':
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        items.append((str(key), str(value)))
+    return tuple(sorted(items))
+
+
+class ResponseCache:
+    """有界的 LRU + TTL 响应缓存，键为 (endpoint, 规范化参数)
+
+    读写都会复制数据，调用方修改返回的字典不会污染缓存。
+    每次失效都会递增 generation，请求发出前记下的 generation 过期时，
+    在失效之前发出、之后才返回的旧响应不会被写回缓存。
+
+    传入 shared (多进程共享缓存) 时作为第二级：本地未命中时查共享缓存，写入时同时写入；
+    本进程的失效记录到共享缓存，其他进程的失效最多 shared.sync_interval 秒后应用到本地并递增 generation。
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 30.0, shared: Optional[SharedCache] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        # 已应用的共享失效事件序号 (第一次同步时取当前最大值)，以及本进程自己记录的事件
+        self._seen_seq: Optional[int] = None
+        self._own_seqs: Set[int] = set()
+        self._synced_at = float('-inf')
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict[str, Any]] = None) -> CacheKey:
+        return endpoint, normalize_params(params)
+
+    @property
+    def generation(self) -> int:
+        with self._lock:
+            self._sync()
+            return self._generation
+
+    def _sync(self, force: bool = False):
+        """应用其他进程记录的失效事件；调用方持有 _lock"""
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.shared.sync_interval:
+            return
+        self._synced_at = now
+        if self._seen_seq is None:
+            # 本地缓存还是空的，之前的事件无需应用
+            self._seen_seq = self.shared.last_seq()
+            return
+        for seq, endpoints, pattern in self.shared.events_since(self._seen_seq):
+            self._seen_seq = seq
+            if seq in self._own_seqs:
+                self._own_seqs.discard(seq)
+                continue
+            self.remote_invalidations += self._drop(endpoints, pattern)
+
+    def _drop(self, endpoints: Iterable[str], pattern: Optional[str]) -> int:
+        """调用方持有 _lock"""
+        endpoints = set(endpoints)
+        matcher: Callable[[str], bool] = re.compile(pattern).fullmatch if pattern else (lambda _: False)
+        self._generation += 1
+        stale = [key for key in self._entries if key[0] in endpoints or matcher(key[0])]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def _store(self, key: CacheKey, value: Any, ttl: float):
+        """调用方持有 _lock"""
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+                self.expirations += 1
+            if self.shared is None:
+                self.misses += 1
+                return None
+            generation = self._generation
+        found = self.shared.get(key)
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            value, remaining = found
+            # 查询共享缓存期间发生失效时只返回，不写入本地
+            if generation == self._generation:
+                self._store(key, value, min(remaining, self.ttl))
+        return copy.deepcopy(value)
+
+    def set(self, key: CacheKey, value: Any, generation: Optional[int] = None):
+        value = copy.deepcopy(value)
+        with self._lock:
+            if generation is not None:
+                # 写入共享缓存前确认请求期间没有任何进程发生写操作
+                self._sync(force=True)
+                if generation != self._generation:
+                    return
+            self._store(key, value, self.ttl)
+            seen_seq = self._seen_seq
+        if self.shared is not None and seen_seq is not None:
+            self.shared.set(key, value, self.ttl, seen_seq)
+
+    def invalidate(self, endpoints: Iterable[str] = (), pattern: Optional[str] = None) -> int:
+        """删除指定 endpoint（任意参数）以及匹配正则 pattern 的 endpoint 的所有条目"""
+        endpoints = list(endpoints)
+        with self._lock:
+            dropped = self._drop(endpoints, pattern)
+            self.invalidations += dropped
+        if self.shared is not None:
+            seq = self.shared.invalidate(endpoints, pattern)
+            with self._lock:
+                if self._seen_seq is not None and seq > self._seen_seq:
+                    self._own_seqs.add(seq)
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                'hits': self.hits, 'shared_hits': self.shared_hits, 'misses': self.misses,
+                'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions, 'expirations': self.expirations,
+                'invalidations': self.invalidations, 'remote_invalidations': self.remote_invalidations,
+            }
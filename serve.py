@@ -0,0 +1,113 @@
+"""多进程部署：在同一台机器上启动多个前端工作进程
+
+用法:
+    python serve.py [--workers 4]
+
+第 i 个工作进程监听 GRADIO_SERVER_PORT + i，Prometheus 指标端口为 METRICS_PORT + i (METRICS_PORT=0 时都不启动)。
+工作进程默认启用共享缓存 (SHARED_CACHE_ENABLED)：响应缓存、仪表板快照和标签列表在进程间复用，
+后端负载不随进程数成倍增加。
+
+Gradio 的队列、会话状态 (翻页缓存、表格) 和智能分析任务都保存在各自进程内，
+前面的反向代理需要按客户端粘滞 (例如 nginx 的 ip_hash)，配置示例见 README。
+工作进程异常退出时自动重启；Ctrl+C / SIGTERM 时停止所有工作进程。
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from config import GRADIO_SERVER_NAME, GRADIO_SERVER_PORT, GRADIO_WORKERS, METRICS_PORT
+
+# 工作进程运行超过该秒数后退出视为偶发故障，重启等待时间从头计算
+STABLE_AFTER = 30.0
+RESTART_BACKOFF_MAX = 30.0
+STOP_TIMEOUT = 10.0
+
+
+def worker_env(index: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env['GRADIO_SERVER_PORT'] = str(GRADIO_SERVER_PORT + index)
+    env['METRICS_PORT'] = str(METRICS_PORT + index if METRICS_PORT else 0)
+    env.setdefault('SHARED_CACHE_ENABLED', 'True')
+    # 近似重复索引的后台回填只在第一个进程中运行，避免每个进程各自下载整个图库
+    if index > 0:
+        env['NEAR_DUPLICATE_BACKFILL_INTERVAL'] = '0'
+    return env
+
+
+class Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.port = GRADIO_SERVER_PORT + index
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.failures = 0
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, '-c', 'import app; app.main(inbrowser=False)'],
+                                        env=worker_env(self.index), cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.started_at = time.monotonic()
+        print(f"工作进程 {self.index} 已启动: pid {self.process.pid}，端口 {self.port}", flush=True)
+
+    def check(self):
+        """已退出的进程按指数退避重启"""
+        if self.process is None or self.process.poll() is None:
+            return
+        now = time.monotonic()
+        if self.restart_at == 0.0:
+            ran = now - self.started_at
+            self.failures = 0 if ran >= STABLE_AFTER else self.failures + 1
+            delay = min(RESTART_BACKOFF_MAX, 2.0 ** self.failures) if self.failures else 0.0
+            self.restart_at = now + delay
+            print(f"⚠️ 工作进程 {self.index} 已退出 (返回码 {self.process.returncode})，{delay:.0f}s 后重启",
+                  flush=True)
+        if now >= self.restart_at:
+            self.restart_at = 0.0
+            self.start()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="启动多个前端工作进程")
+    parser.add_argument('--workers', type=int, default=max(1, GRADIO_WORKERS),
+                        help=f"工作进程数 (默认 GRADIO_WORKERS={GRADIO_WORKERS})")
+    args = parser.parse_args(argv)
+
+    workers = [Worker(i) for i in range(max(1, args.workers))]
+    stopping = []
+    # SIGTERM 与 Ctrl+C 同样处理
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    print(f"启动 {len(workers)} 个工作进程: {GRADIO_SERVER_NAME}:{workers[0].port}-{workers[-1].port}")
+    for worker in workers:
+        worker.start()
+    try:
+        while not stopping:
+            time.sleep(1.0)
+            for worker in workers:
+                worker.check()
+    except KeyboardInterrupt:
+        pass
+
+    print("正在停止工作进程...")
+    for worker in workers:
+        worker.stop()
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for worker in workers:
+        if worker.process is None:
+            continue
+        try:
+            worker.process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""同一台机器上多个前端工作进程共享的磁盘缓存 (SQLite WAL)
+
+- 响应缓存的第二级：一个进程从后端读到的结果，其他进程在有效期内直接复用
+- 失效日志：写操作失效的 endpoint 记录为一条事件，其他进程在读缓存前同步失效自己的内存缓存
+- 快照：仪表板等按键保存的值及其生成时间
+
+多进程部署 (serve.py) 时默认启用；单进程时每次读写只多一次本地 SQLite 查询。
+"""
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from config import CACHE_DIR, SHARED_CACHE_ENABLED, SHARED_CACHE_SYNC_INTERVAL
+from records import dumps, loads
+
+# 失效事件保留秒数；进程内缓存的有效期远短于此，更早的事件不会再影响任何进程
+EVENT_RETENTION = 3600.0
+# 每写入多少次清理一次过期的响应
+PURGE_EVERY = 200
+
+
+class SharedCache:
+    """多个进程通过同一个 SQLite 文件共享的缓存，每个进程一个连接"""
+
+    def __init__(self, db_path: str, sync_interval: float = 0.2):
+        self.db_path = db_path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_purge = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.stale_writes = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            # 自动提交模式，需要原子性的地方显式 BEGIN IMMEDIATE；其他进程写入时最多等待 5 秒
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    endpoint TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (endpoint, params)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS invalidations (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    endpoints TEXT NOT NULL,
+                    pattern TEXT,
+                    created_at REAL NOT NULL
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    loaded_at REAL NOT NULL
+                )""")
+            self._conn = conn
+        return self._conn
+
+    # ============ 响应 ============
+    def get(self, key: Tuple[str, Tuple[Tuple[str, str], ...]]) -> Optional[Tuple[Any, float]]:
+        """返回 (响应, 剩余有效秒数)；不存在或已过期时返回 None"""
+        endpoint, params = key
+        with self._lock:
+            row = self.conn.execute("SELECT value, expires_at FROM responses WHERE endpoint = ? AND params = ?",
+                                    (endpoint, urlencode(params))).fetchone()
+            remaining = row[1] - time.time() if row else 0.0
+            if remaining <= 0:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return loads(row[0]), remaining
+
+    def set(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], value: Any, ttl: float, seen_seq: int) -> bool:
+        """写入响应；seen_seq 之后若有进程记录了失效事件 (请求期间发生了写操作)，不写入并返回 False"""
+        endpoint, params = key
+        data = dumps(value)
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR REPLACE INTO responses (endpoint, params, value, expires_at) "
+                "SELECT ?, ?, ?, ? WHERE (SELECT COALESCE(MAX(seq), 0) FROM invalidations) <= ?",
+                (endpoint, urlencode(params), data, time.time() + ttl, seen_seq))
+            written = cursor.rowcount > 0
+            if written:
+                self.writes += 1
+            else:
+                self.stale_writes += 1
+            self._writes_since_purge += 1
+            if self._writes_since_purge >= PURGE_EVERY:
+                self._writes_since_purge = 0
+                self.conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        return written
+
+    def invalidate(self, endpoints: Iterable[str] = (), pattern: Optional[str] = None) -> int:
+        """删除指定 endpoint 和匹配 pattern 的响应并记录一条失效事件，返回事件序号"""
+        endpoints = sorted(set(endpoints))
+        matcher = re.compile(pattern).fullmatch if pattern else None
+        now = time.time()
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = set(endpoints)
+                if matcher is not None:
+                    stale.update(e for (e,) in conn.execute("SELECT DISTINCT endpoint FROM responses") if matcher(e))
+                conn.executemany("DELETE FROM responses WHERE endpoint = ?", [(e,) for e in stale])
+                seq = conn.execute("INSERT INTO invalidations (endpoints, pattern, created_at) VALUES (?, ?, ?)",
+                                   ('\n'.join(endpoints), pattern, now)).lastrowid
+                # 至少保留最新一条，MAX(seq) 才不会回退
+                conn.execute("DELETE FROM invalidations WHERE created_at < ? AND seq < ?",
+                             (now - EVENT_RETENTION, seq))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return seq
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+
+    def events_since(self, seq: int) -> List[Tuple[int, List[str], Optional[str]]]:
+        """seq 之后记录的失效事件 (序号, endpoint 列表, pattern)，按序号升序"""
+        with self._lock:
+            rows = self.conn.execute("SELECT seq, endpoints, pattern FROM invalidations WHERE seq > ? ORDER BY seq",
+                                     (seq,)).fetchall()
+        return [(s, endpoints.split('\n') if endpoints else [], pattern) for s, endpoints, pattern in rows]
+
+    # ============ 快照 ============
+    def get_snapshot(self, key: str) -> Optional[Tuple[Any, float]]:
+        """返回 (值, 生成时间 time.time())"""
+        with self._lock:
+            row = self.conn.execute("SELECT value, loaded_at FROM snapshots WHERE key = ?", (key,)).fetchone()
+        return (loads(row[0]), row[1]) if row else None
+
+    def set_snapshot(self, key: str, value: Any, loaded_at: Optional[float] = None):
+        data = dumps(value)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO snapshots (key, value, loaded_at) VALUES (?, ?, ?)",
+                              (key, data, loaded_at if loaded_at is not None else time.time()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses WHERE expires_at >= ?",
+                                        (time.time(),)).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {'entries': entries, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                    'writes': self.writes, 'stale_writes': self.stale_writes}
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """SHARED_CACHE_ENABLED 时返回本进程唯一的共享缓存，否则返回 None"""
+    global _shared_cache
+    if not SHARED_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SharedCache(os.path.join(CACHE_DIR, 'shared_cache.sqlite3'), SHARED_CACHE_SYNC_INTERVAL)
+    return _shared_cache
@@ -0,0 +1,115 @@
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.followers = 0
+
+
+class _Flight:
+    __slots__ = ('task', 'followers')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.followers = 0
+
+
+class FlightStats:
+    """合并计数：executed 为实际执行次数，coalesced 为搭便车 (共享他人结果) 的次数"""
+
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+
+    def stats(self, in_flight: int) -> Dict[str, Any]:
+        total = self.executed + self.coalesced
+        return {'in_flight': in_flight, 'executed': self.executed, 'coalesced': self.coalesced,
+                'coalesce_rate': round(self.coalesced / total, 4) if total else 0.0}
+
+
+class SingleFlight(FlightStats):
+    """线程版的请求合并：相同 key 的并发调用只执行一次 fn，其余调用等待并共享结果
+
+    结果被共享时每个调用者 (包括执行 fn 的调用者) 都拿到各自的深拷贝，修改返回值不会影响其他调用者；
+    没有其他调用者时直接返回结果，不复制。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """返回 (结果, 是否共享了其他调用的结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+                call.followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                shared = call.followers > 0
+            call.done.set()
+        return (copy.deepcopy(call.result) if shared else call.result), False
+
+    def stats(self) -> Dict[str, Any]:
+        return super().stats(len(self._calls))
+
+
+class AsyncSingleFlight(FlightStats):
+    """协程版的请求合并；共享的请求放在独立的 Task 中执行，某个调用者被取消不会影响其他调用者
+
+    复制规则与 SingleFlight 相同。Task 完成时先从 _tasks 中移除，之后不会再有新的调用者加入。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._tasks: Dict[Hashable, _Flight] = {}
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        flight = self._tasks.get(key)
+        if flight is not None and flight.task is task:
+            del self._tasks[key]
+        # 所有调用者都已取消时，这里取走异常避免 "never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """返回 (结果, 是否共享了其他调用的结果)"""
+        flight = self._tasks.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            flight.followers += 1
+            return copy.deepcopy(await asyncio.shield(flight.task)), True
+        self.executed += 1
+        task = asyncio.ensure_future(fn())
+        flight = self._tasks[key] = _Flight(task)
+        task.add_done_callback(lambda t: self._finished(key, t))
+        result = await asyncio.shield(task)
+        return (copy.deepcopy(result) if flight.followers else result), False
+
+    def stats(self) -> Dict[str, Any]:
+        return super().stats(len(self._tasks))
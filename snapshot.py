@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from shared_cache import SharedCache
+
+
+class SharedSnapshot:
+    """所有会话共享的短时快照
+
+    - 快照未超过 ttl 秒：直接返回
+    - 超过 ttl 但未超过 max_stale 秒：立即返回旧快照，同时在后台刷新一次
+    - 没有快照或过旧：等待加载；并发调用者共享同一次加载，不会重复请求后端
+
+    传入 store (多进程共享缓存) 时，本进程的快照过期后先采用其他进程保存的更新的快照，
+    加载完成后保存到 store。值经过 JSON 编码，元组读回时为列表。
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Any]], ttl: float, max_stale: Optional[float] = None,
+                 store: Optional[SharedCache] = None, key: str = ''):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale if max_stale is not None else ttl * 10
+        self.store = store
+        self.key = key
+        self._value: Any = None
+        self._loaded_at = 0.0
+        self._invalidated_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self._loaded_at if self._value is not None else float('inf')
+
+    async def _load(self) -> Any:
+        value = await self.loader()
+        self._value = value
+        self._loaded_at = time.monotonic()
+        if self.store is not None:
+            self.store.set_snapshot(self.key, value)
+        return value
+
+    def _adopt_shared(self):
+        """采用其他进程保存的、比本进程更新的快照"""
+        found = self.store.get_snapshot(self.key)
+        if found is None:
+            return
+        value, loaded_at = found
+        if loaded_at <= self._invalidated_at:
+            return
+        loaded_at = time.monotonic() - max(0.0, time.time() - loaded_at)
+        if loaded_at > self._loaded_at:
+            self._value, self._loaded_at = value, loaded_at
+
+    def _refresh(self) -> asyncio.Task:
+        """启动一次刷新；已有刷新在进行中时复用它"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._load())
+            # 后台刷新失败时保留旧快照，这里只需取走异常避免 "never retrieved" 警告
+            self._task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._task
+
+    async def get(self, force: bool = False) -> Any:
+        if not force and self.store is not None and self.age >= self.ttl:
+            self._adopt_shared()
+        age = self.age
+        if not force and age < self.ttl:
+            return self._value
+        if not force and age < self.max_stale:
+            self._refresh()
+            return self._value
+        # shield: 某个会话取消等待时不影响其他共享这次加载的会话
+        return await asyncio.shield(self._refresh())
+
+    def invalidate(self):
+        """让下一次 get() 等待重新加载"""
+        self._loaded_at = float('-inf')
+        self._invalidated_at = time.time()
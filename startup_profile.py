@@ -0,0 +1,125 @@
+"""启动耗时分析
+
+在子进程中以 `python -X importtime` 导入 app 并调用 create_app()，按顶层模块汇总两个阶段的导入耗时：
+
+    python startup_profile.py                 # 打印耗时最多的模块
+    python startup_profile.py --top 20 --json # 输出 JSON，便于在 CI 中保存和比较
+    python startup_profile.py --max-import 0.5 --max-total 8
+
+超过 --max-import / --max-total (秒) 时以退出码 1 结束，用于发现启动耗时的回退。
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+PHASE_MARKER = '@@startup_profile:create_app'
+
+# 在子进程中执行：记录两个阶段的总耗时，阶段分隔标记写到 stderr，与 importtime 输出保持顺序
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+print({PHASE_MARKER!r}, file=sys.stderr, flush=True)
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'create_app': created - imported}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)')
+
+
+def parse_importtime(lines: List[str]) -> Dict[str, Dict[str, float]]:
+    """把 importtime 输出按阶段汇总为 {阶段: {顶层模块: 秒}}
+
+    只统计最外层的导入，避免重复计算；app 本身展开为它直接导入的模块，另计 app 自身代码的耗时。
+    importtime 先输出子模块再输出父模块，因此先暂存第二层的条目，遇到父模块 app 时再计入。
+    """
+    phases: Dict[str, Dict[str, float]] = {'import': {}, 'create_app': {}}
+    phase = 'import'
+    children: List[tuple] = []
+
+    def add(name: str, seconds: float):
+        top = name.split('.')[0]
+        phases[phase][top] = phases[phase].get(top, 0.0) + seconds
+
+    for line in lines:
+        if line.strip() == PHASE_MARKER:
+            phase = 'create_app'
+            continue
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us = int(match.group(1)), int(match.group(2))
+        indent, name = len(match.group(3)), match.group(4)
+        if indent == 3:
+            children.append((name, cumulative_us / 1e6))
+        elif indent == 1:
+            if name == 'app':
+                for child, seconds in children:
+                    add(child, seconds)
+                add('app (自身)', self_us / 1e6)
+            else:
+                add(name, cumulative_us / 1e6)
+            children = []
+    return phases
+
+
+def profile_startup() -> Dict[str, Any]:
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=here,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"启动失败 (退出码 {proc.returncode}):\n{proc.stderr[-2000:]}")
+    totals = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(proc.stderr.splitlines())
+    return {'import_seconds': round(totals['import'], 4), 'create_app_seconds': round(totals['create_app'], 4),
+            'total_seconds': round(totals['import'] + totals['create_app'], 4),
+            'modules': {phase: dict(sorted(((k, round(v, 4)) for k, v in found.items()),
+                                           key=lambda kv: -kv[1]))
+                        for phase, found in modules.items()}}
+
+
+def print_report(report: Dict[str, Any], top: int):
+    print(f"导入 app: {report['import_seconds']:.3f}s | create_app(): {report['create_app_seconds']:.3f}s | "
+          f"合计: {report['total_seconds']:.3f}s")
+    for phase, label in (('import', '导入 app'), ('create_app', 'create_app()')):
+        print(f"\n{label} 阶段导入耗时最多的模块:")
+        for name, seconds in list(report['modules'][phase].items())[:top]:
+            print(f"  {name:<28} {seconds * 1000:9.1f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='测量导入 app 和 create_app() 的耗时，按模块分解')
+    parser.add_argument('--top', type=int, default=10, help='每个阶段显示的模块数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出完整结果')
+    parser.add_argument('--max-import', type=float, help='导入 app 的耗时上限 (秒)')
+    parser.add_argument('--max-total', type=float, help='导入 + create_app() 的耗时上限 (秒)')
+    args = parser.parse_args(argv)
+
+    try:
+        report = profile_startup()
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report, args.top)
+
+    over = []
+    if args.max_import is not None and report['import_seconds'] > args.max_import:
+        over.append(f"导入 app 耗时 {report['import_seconds']:.3f}s 超过上限 {args.max_import}s")
+    if args.max_total is not None and report['total_seconds'] > args.max_total:
+        over.append(f"启动总耗时 {report['total_seconds']:.3f}s 超过上限 {args.max_total}s")
+    for message in over:
+        print(f"❌ {message}", file=sys.stderr)
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+"""模拟 Go 后端的本地桩服务，用于基准测试和压测
+
+实现 api_client 用到的全部接口 (/api/v1/prompts/*、/api/v1/tags/*、/health、/db-status、/uploads/*)，
+数据保存在内存中。可配置延迟、响应体大小和错误率：
+
+    python stub_backend.py --port 18080 --latency 0.02 --jitter 0.01 --error-rate 0.01
+    python stub_backend.py --prompts 500 --payload-bytes 4096 --analyze-latency 2
+
+--error-rate 按比例返回 503 (/health 和 /db-status 除外，便于熔断器探测恢复)。
+"""
+import argparse
+import email.parser
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+API_ROOT = '/api/v1'
+MODELS = ('sdxl', 'sd15', 'flux', 'midjourney')
+TAG_NAMES = ('风景', '人像', '动漫', '写实', '赛博朋克', '水彩', '建筑', '夜景', 'cat', 'dog')
+WORDS = ('a', 'cat', 'sitting', 'on', 'the', 'window', 'sunset', 'city', 'neon', 'lights', 'portrait', 'soft',
+         'lighting', 'watercolor', 'mountain', 'lake', 'cinematic', 'detailed', '高清', '夕阳')
+
+
+class StubConfig:
+    """桩服务的行为参数；latency / jitter / analyze_latency 单位为秒"""
+
+    __slots__ = ('latency', 'jitter', 'analyze_latency', 'error_rate', 'prompts', 'payload_bytes',
+                 'image_size', 'seed')
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, analyze_latency: float = 0.5,
+                 error_rate: float = 0.0, prompts: int = 100, payload_bytes: int = 0, image_size: int = 1024,
+                 seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.analyze_latency = analyze_latency
+        self.error_rate = error_rate
+        self.prompts = prompts
+        self.payload_bytes = payload_bytes
+        self.image_size = image_size
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def timestamp(offset_seconds: int = 0) -> str:
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=offset_seconds)
+    return base.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class StubState:
+    """内存中的提示词、标签和图片"""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.tags: Dict[int, Dict[str, Any]] = {}
+        self.prompts: Dict[int, Dict[str, Any]] = {}
+        self.images: Dict[str, bytes] = {}
+        self.next_image = 0
+        self.requests = 0
+        self.errors_injected = 0
+        for name in TAG_NAMES:
+            self.tag_by_name(name)
+        for _ in range(config.prompts):
+            self.add_prompt(self.random_prompt())
+
+    # ============ 数据 ============
+    def tag_by_name(self, name: str) -> Dict[str, Any]:
+        for tag in self.tags.values():
+            if tag['name'] == name:
+                return tag
+        tag_id = max(self.tags, default=0) + 1
+        tag = self.tags[tag_id] = {'id': tag_id, 'name': name, 'created_at': timestamp(tag_id)}
+        return tag
+
+    def random_prompt(self) -> Dict[str, Any]:
+        rng = self.rng
+        return {
+            'prompt_text': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))),
+            'negative_prompt': 'blurry, low quality', 'model_name': rng.choice(MODELS),
+            'is_public': rng.random() < 0.5,
+            'style_description': 'x' * self.config.payload_bytes,
+            'usage_scenario': '', 'atmosphere_description': '', 'expressive_intent': '',
+            'structure_analysis': json.dumps({'subject': rng.choice(WORDS), 'composition': 'center'}),
+            'tag_names': rng.sample(TAG_NAMES, rng.randint(1, 3)),
+            'output_image_url': self.new_image_url(), 'input_image_urls': [self.new_image_url()],
+        }
+
+    def new_image_url(self, content: Optional[bytes] = None) -> str:
+        """content 为上传的文件内容时原样保存，/uploads 返回上传的图片"""
+        self.next_image += 1
+        if content is not None:
+            self.images[f"stub_{self.next_image}.jpg"] = content
+        return f"/uploads/stub_{self.next_image}.jpg"
+
+    def add_prompt(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_id = max(self.prompts, default=0) + 1
+        now = timestamp(prompt_id * 60)
+        prompt = {'id': prompt_id, 'created_at': now, 'updated_at': now}
+        self.apply_fields(prompt, fields)
+        self.prompts[prompt_id] = prompt
+        return prompt
+
+    def apply_fields(self, prompt: Dict[str, Any], fields: Dict[str, Any]):
+        tag_names = fields.pop('tag_names', None)
+        if isinstance(tag_names, str):
+            tag_names = [t.strip() for t in tag_names.split(',')]
+        prompt.update({k: v for k, v in fields.items() if k != 'id'})
+        if tag_names is not None:
+            prompt['tags'] = [self.tag_by_name(t) for t in tag_names if t]
+        prompt.setdefault('tags', [])
+        prompt.setdefault('input_image_urls', [])
+        prompt.setdefault('output_image_url', '')
+
+    def filter_prompts(self, q: Dict[str, str]) -> List[Dict[str, Any]]:
+        items = sorted(self.prompts.values(), key=lambda p: (p['created_at'], p['id']), reverse=True)
+        keyword = q.get('keyword', '').lower()
+        if keyword:
+            items = [p for p in items if keyword in p.get('prompt_text', '').lower()
+                     or keyword in p.get('style_description', '').lower()]
+        if q.get('model_name'):
+            items = [p for p in items if p.get('model_name', '').lower() == q['model_name'].lower()]
+        if q.get('is_public') in ('true', 'false'):
+            items = [p for p in items if bool(p.get('is_public')) == (q['is_public'] == 'true')]
+        for tag in [t.strip() for t in (q.get('tag_names') or q.get('tags') or '').split(',') if t.strip()]:
+            items = [p for p in items if tag in {t['name'] for t in p['tags']}]
+        return items
+
+    def image(self, name: str) -> bytes:
+        """按名称生成确定性的 JPEG，同名图片内容不变 (ETag 稳定)"""
+        data = self.images.get(name)
+        if data is None:
+            from PIL import Image
+            seed = int(hashlib.sha1(name.encode('utf-8')).hexdigest()[:6], 16)
+            size = self.config.image_size
+            img = Image.new('RGB', (size, size), ((seed >> 16) & 255, (seed >> 8) & 255, seed & 255))
+            out = BytesIO()
+            img.save(out, format='JPEG', quality=90)
+            data = self.images[name] = out.getvalue()
+        return data
+
+
+def paginate(items: List[Dict[str, Any]], q: Dict[str, str]) -> Dict[str, Any]:
+    page = max(1, int(q.get('page') or 1))
+    page_size = max(1, int(q.get('page_size') or 10))
+    return {'items': items[(page - 1) * page_size:page * page_size], 'page': page, 'page_size': page_size,
+            'total': len(items), 'total_pages': max(1, -(-len(items) // page_size))}
+
+
+def parse_multipart(content_type: str, body: bytes) -> Tuple[Dict[str, List[str]], Dict[str, List[bytes]]]:
+    """返回 (表单字段 -> 值列表, 文件字段 -> 文件内容列表)；重复的字段 (如 input_image_urls) 保留全部值"""
+    message = email.parser.BytesParser().parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body)
+    fields, files = {}, {}
+    for part in message.get_payload() if message.is_multipart() else []:
+        name = part.get_param('name', header='content-disposition')
+        if part.get_filename() is not None:
+            files.setdefault(name, []).append(part.get_payload(decode=True))
+        else:
+            fields.setdefault(name, []).append(part.get_payload(decode=True).decode('utf-8'))
+    return fields, files
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写入，开启 Nagle 时会与客户端的延迟 ACK 叠加出约 40ms 的延迟
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj: Any, status: int = 200):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def handle_method(self):
+        state, config = self.state, self.state.config
+        body = self.read_body()
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path
+        with state.lock:
+            state.requests += 1
+            inject_error = path not in ('/health', '/db-status') and state.rng.random() < config.error_rate
+        delay = config.latency + (random.uniform(-config.jitter, config.jitter) if config.jitter else 0.0)
+        if path == f"{API_ROOT}/prompts/analyze":
+            delay += config.analyze_latency
+        if delay > 0:
+            time.sleep(delay)
+        if inject_error:
+            with state.lock:
+                state.errors_injected += 1
+            return self.send_json({'error': 'injected failure', 'success': False}, 503)
+        if path in ('/health', '/db-status'):
+            return self.send_json({'status': 'ok', 'success': True})
+        if path.startswith('/uploads/'):
+            return self.serve_image(path[len('/uploads/'):])
+        if not path.startswith(API_ROOT):
+            return self.send_json({'error': 'not found', 'success': False}, 404)
+        with state.lock:
+            status, payload = self.route(self.command, path[len(API_ROOT):], q, body)
+        self.send_json(payload, status)
+
+    def serve_image(self, name: str):
+        with self.state.lock:
+            data = self.state.image(name)
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def route(self, method: str, path: str, q: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, Any]]:
+        state = self.state
+        ok = lambda data: (200, {'success': True, 'data': data})
+        not_found = (404, {'error': 'record not found', 'success': False})
+
+        if path == '/prompts/' and method == 'GET':
+            return ok(paginate(state.filter_prompts(q), q))
+        if path == '/prompts/' and method == 'POST':
+            return ok(state.add_prompt(json.loads(body or b'{}')))
+        if path == '/prompts/public':
+            return ok(paginate(state.filter_prompts({'is_public': 'true'}), q))
+        if path == '/prompts/recent':
+            return ok(state.filter_prompts({})[:int(q.get('limit') or 10)])
+        if path == '/prompts/stats':
+            return ok({'total_prompts': len(state.prompts),
+                       'public_prompts': sum(1 for p in state.prompts.values() if p.get('is_public'))})
+        if path == '/prompts/search/tags':
+            return ok(paginate(state.filter_prompts({'tags': q.get('tags', '')}), q))
+        if path == '/prompts/check-duplicate':
+            text = q.get('prompt_text', '')
+            match = next((p for p in state.prompts.values() if p.get('prompt_text') == text), None)
+            return ok({'exists': match is not None, 'prompt_id': match['id'] if match else None})
+        if path in ('/prompts/upload', '/prompts/analyze') and method == 'POST':
+            form, files = parse_multipart(self.headers.get('Content-Type', ''), body)
+            if path.endswith('analyze'):
+                return ok({'negative_prompt': 'blurry, low quality', 'style_description': 'stub style',
+                           'usage_scenario': 'benchmark', 'atmosphere_description': 'calm',
+                           'expressive_intent': 'test', 'structure_analysis': {'subject': 'stub'},
+                           'tag_names': ['风景', '写实']})
+            # 去重时客户端用 input_image_urls / output_image_url 引用已上传的文件
+            fields = {k: v[0] for k, v in form.items()}
+            fields['input_image_urls'] = form.get('input_image_urls', []) + \
+                [state.new_image_url(content) for content in files.get('input_images', [])]
+            fields['output_image_url'] = fields.get('output_image_url') or (
+                state.new_image_url(files['output_image'][0]) if files.get('output_image') else '')
+            fields['is_public'] = fields.get('is_public', '').lower() == 'true'
+            return ok(state.add_prompt(fields))
+        match = re.fullmatch(r'/prompts/(\d+)', path)
+        if match:
+            prompt = state.prompts.get(int(match[1]))
+            if prompt is None:
+                return not_found
+            if method == 'GET':
+                return ok(prompt)
+            if method == 'PUT':
+                state.apply_fields(prompt, json.loads(body or b'{}'))
+                prompt['updated_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                return ok(prompt)
+            if method == 'DELETE':
+                del state.prompts[prompt['id']]
+                return 200, {'success': True, 'message': 'deleted'}
+
+        if path == '/tags/' and method == 'GET':
+            return ok(list(state.tags.values()))
+        if path == '/tags/' and method == 'POST':
+            return ok(state.tag_by_name(json.loads(body or b'{}').get('name', '')))
+        if path == '/tags/search':
+            keyword = q.get('keyword', '').lower()
+            return ok([t for t in state.tags.values() if keyword in t['name'].lower()])
+        if path == '/tags/stats':
+            counts: Dict[str, int] = {}
+            for prompt in state.prompts.values():
+                for tag in prompt['tags']:
+                    counts[tag['name']] = counts.get(tag['name'], 0) + 1
+            popular = sorted(counts.items(), key=lambda kv: -kv[1])[:20]
+            return ok({'total_tags': len(state.tags),
+                       'popular_tags': [{'name': name, 'count': count} for name, count in popular]})
+        match = re.fullmatch(r'/tags/(\d+)', path)
+        if match:
+            tag = state.tags.get(int(match[1]))
+            if tag is None:
+                return not_found
+            if method == 'DELETE':
+                del state.tags[tag['id']]
+                return 200, {'success': True, 'message': 'deleted'}
+            return ok(tag)
+        return 404, {'error': f"route not found: {method} {path}", 'success': False}
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = handle_method
+
+
+def start_stub_backend(host: str = '127.0.0.1', port: int = 0,
+                       config: Optional[StubConfig] = None) -> ThreadingHTTPServer:
+    """在后台线程中启动桩服务 (port 为 0 时随机分配)，返回的 server.server_address 为实际地址"""
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(config or StubConfig())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-backend', daemon=True).start()
+    return server
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的基础延迟 (秒)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="延迟的随机浮动范围 (±秒)")
+    parser.add_argument('--analyze-latency', type=float, default=0.5, help="智能分析接口的额外延迟 (秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 503 的请求比例 (0~1)")
+    parser.add_argument('--prompts', type=int, default=100, help="预置的提示词数量")
+    parser.add_argument('--payload-bytes', type=int, default=0, help="每条提示词额外填充的字节数")
+    parser.add_argument('--image-size', type=int, default=1024, help="/uploads 返回图片的边长 (像素)")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+
+
+def stub_config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(latency=args.latency, jitter=args.jitter, analyze_latency=args.analyze_latency,
+                      error_rate=args.error_rate, prompts=args.prompts, payload_bytes=args.payload_bytes,
+                      image_size=args.image_size, seed=args.seed)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="模拟后端API的本地桩服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+    server = start_stub_backend(args.host, args.port, stub_config_from_args(args))
+    print(f"桩服务已启动: http://{server.server_address[0]}:{server.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lazy_imports import lazy_import
+from offline_store import format_age
+from records import PromptRecord, prompt_records
+
+pd = lazy_import('pandas')
+
+# 把一页提示词记录按列渲染为表格
+TableRenderer = Callable[[List[PromptRecord]], 'pd.DataFrame']
+
+
+class TableView:
+    """一个会话当前显示的提示词表格：页码、筛选条件、表格和总数
+
+    写操作成功后用接口返回的提示词就地修改表格 (apply_create / apply_update / apply_delete)，
+    不再重新请求列表，页码和筛选条件保持不变。本地推断不了的变化 (例如删除后下一页的第一条前移、
+    关键词筛选是否命中) 由 reconcile 在稍后重新加载当前页时纠正，此时表格才会整体重建。
+    重新加载失败时按指数退避延后下一次校正，连续失败 max_reconcile_attempts 次后放弃。
+    """
+
+    def __init__(self, render: TableRenderer, page_size: int, max_reconcile_attempts: int = 5):
+        self.render = render
+        self.page_size = page_size
+        self.max_reconcile_attempts = max_reconcile_attempts
+        self.page = 1
+        self.filters: Dict[str, Any] = {}
+        self.table = pd.DataFrame()
+        self.total = 0
+        self.total_pages = 1
+        self.source: Optional[str] = None
+        # 后端不可用时显示的本地快照的保存时间 (time.time())
+        self.stale_since: Optional[float] = None
+        # 当前表格中每条提示词的 updated_at，用于判断重新加载的数据是否与本地修改一致
+        self._versions: Dict[Any, str] = {}
+        self.dirty_at: Optional[float] = None
+        self.reconcile_failures = 0
+        self.patches = 0
+        self.reconciles = 0
+        self.drifts = 0
+
+    def __deepcopy__(self, memo):
+        # 作为 gr.State 的值时不复制
+        return self
+
+    @property
+    def dirty(self) -> bool:
+        return self.dirty_at is not None
+
+    def show(self, page: int, filters: Dict[str, Any], result: Dict[str, Any]):
+        """用 get_prompts 的响应重建表格"""
+        data = result.get('data') or {}
+        records = prompt_records(data.get('items'))
+        self.page = page
+        self.filters = dict(filters)
+        self.total = data.get('total', len(records))
+        self.total_pages = data.get('total_pages', 1)
+        self.source = result.get('source')
+        self.stale_since = result.get('stale_since')
+        self.table = self.render(records)
+        self._versions = {r.id: r.updated_at for r in records}
+        self.dirty_at = None
+
+    def info(self) -> str:
+        if self.table.empty:
+            return "当前页无数据"
+        info = f"第 {self.page} 页 / 共 {self.total_pages} 页 (总计 {self.total} 条)"
+        if self.source == 'mirror':
+            info += " · 本地索引"
+        if self.stale_since is not None:
+            info += f" · ⚠️ 后端不可用，{format_age(time.time() - self.stale_since)}前的本地快照"
+        if self.dirty:
+            info += " · 同步中"
+        return info
+
+    # ============ 写操作后的就地修改 ============
+    def _row_index(self, prompt_id: Any) -> Optional[Any]:
+        if self.table.empty or prompt_id is None:
+            return None
+        matches = self.table.index[self.table['ID'] == prompt_id]
+        return matches[0] if len(matches) else None
+
+    def _matches_filters(self, record: PromptRecord) -> bool:
+        """只判断可以在本地确定的筛选条件；关键词匹配规则由后端决定，交给 reconcile"""
+        model_name = (self.filters.get('model_name') or '').strip()
+        if model_name and record.model_name.lower() != model_name.lower():
+            return False
+        is_public = self.filters.get('is_public')
+        if is_public is not None and record.is_public != is_public:
+            return False
+        tags = set(record.tag_names)
+        wanted = [t.strip() for t in (self.filters.get('tag_names') or '').split(',') if t.strip()]
+        return all(t in tags for t in wanted)
+
+    def _mark_dirty(self):
+        self.patches += 1
+        self.dirty_at = time.monotonic()
+        self.reconcile_failures = 0
+
+    def apply_create(self, item: Dict[str, Any]) -> bool:
+        """新建的提示词排在最前：当前在第 1 页、没有关键词且符合筛选条件时插入首行；返回表格是否变化"""
+        self._mark_dirty()
+        record = PromptRecord(item)
+        if self.page != 1 or (self.filters.get('keyword') or '').strip() or not self._matches_filters(record):
+            return False
+        self.table = pd.concat([self.render([record]), self.table], ignore_index=True).head(self.page_size)
+        self._versions[record.id] = record.updated_at
+        self.total += 1
+        self.total_pages = max(1, -(-self.total // self.page_size))
+        return True
+
+    def apply_update(self, item: Dict[str, Any]) -> bool:
+        """替换当前页中同一ID的行；修改后不再符合筛选条件时移除该行"""
+        self._mark_dirty()
+        record = PromptRecord(item)
+        index = self._row_index(record.id)
+        if index is None:
+            return False
+        if not self._matches_filters(record):
+            return self.apply_delete(record.id)
+        row = self.render([record])
+        self.table.loc[index, list(row.columns)] = row.iloc[0].tolist()
+        self._versions[record.id] = record.updated_at
+        return True
+
+    def apply_delete(self, prompt_id: Any) -> bool:
+        self._mark_dirty()
+        index = self._row_index(prompt_id)
+        if index is None:
+            return False
+        self.table = self.table.drop(index).reset_index(drop=True)
+        self._versions.pop(prompt_id, None)
+        self.total = max(0, self.total - 1)
+        self.total_pages = max(1, -(-self.total // self.page_size))
+        return True
+
+    # ============ 后台校正 ============
+    def due(self, delay: float) -> bool:
+        """距最近一次修改已超过 delay 秒；每失败一次等待时间加倍"""
+        return (self.dirty_at is not None
+                and time.monotonic() - self.dirty_at >= delay * (2 ** self.reconcile_failures))
+
+    def reconcile(self, page: int, result: Dict[str, Any]) -> bool:
+        """用重新加载的当前页校正本地修改；本地表格与后端不一致时重建表格并返回 True"""
+        if 'error' in result or result.get('stale'):
+            self.reconcile_failures += 1
+            if self.reconcile_failures >= self.max_reconcile_attempts:
+                # 放弃校正，表格保留就地修改的结果，下一次翻页或搜索时重新加载
+                self.dirty_at = None
+            return False
+        self.reconciles += 1
+        data = result.get('data') or {}
+        fresh: List[Tuple[Any, str]] = [(r.id, r.updated_at) for r in prompt_records(data.get('items'))]
+        local = [(prompt_id, self._versions.get(prompt_id, '')) for prompt_id in
+                 (self.table['ID'].tolist() if not self.table.empty else [])]
+        if fresh == local and page == self.page and data.get('total', self.total) == self.total:
+            self.dirty_at = None
+            return False
+        self.drifts += 1
+        self.show(page, self.filters, result)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {'patches': self.patches, 'reconciles': self.reconciles, 'drifts': self.drifts}
@@ -0,0 +1,309 @@
+import asyncio
+import bisect
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# 标签之间的分隔符：英文逗号、中文逗号、顿号
+TAG_SEPARATORS = re.compile(r'[,，、]')
+WORD_BOUNDARY = re.compile(r'[\s\-_/]+')
+# 统计接口中可能表示使用次数的字段
+COUNT_FIELDS = ('count', 'usage_count', 'prompt_count', 'prompts_count')
+# 模糊匹配的最低相似度 (bigram Dice 系数)
+FUZZY_MIN_SCORE = 0.4
+
+
+def normalize_tag(name: str) -> str:
+    """NFKC 归一化 (全角转半角)，去掉首尾空白并把连续空白合并为一个空格"""
+    return ' '.join(unicodedata.normalize('NFKC', name or '').split())
+
+
+def tag_key(name: str) -> str:
+    """比较用的键：归一化后忽略大小写"""
+    return normalize_tag(name).casefold()
+
+
+def split_tag_names(text: str) -> List[str]:
+    return [t for t in (normalize_tag(part) for part in TAG_SEPARATORS.split(text or '')) if t]
+
+
+def current_fragment(text: str) -> str:
+    """最后一个分隔符之后正在输入的部分"""
+    return normalize_tag(TAG_SEPARATORS.split(text or '')[-1])
+
+
+def replace_fragment(text: str, name: str) -> str:
+    """把正在输入的部分替换为选中的标签，并补上分隔符方便继续输入"""
+    parts = TAG_SEPARATORS.split(text or '')
+    done = [t for t in (normalize_tag(p) for p in parts[:-1]) if t]
+    return ', '.join(done + [name]) + ', '
+
+
+def bigrams(key: str) -> Set[str]:
+    key = key.replace(' ', '')
+    return {key[i:i + 2] for i in range(len(key) - 1)} if len(key) > 1 else {key}
+
+
+def usage_counts(stats: Any) -> Dict[str, int]:
+    """从标签统计响应中取出 {标签键: 使用次数}；找出所有带 name 和计数字段的条目，结构未知时返回空"""
+    counts: Dict[str, int] = {}
+
+    def visit(value: Any):
+        if isinstance(value, list):
+            for v in value:
+                visit(v)
+        elif isinstance(value, dict):
+            count = next((value[f] for f in COUNT_FIELDS if isinstance(value.get(f), int)), None)
+            if isinstance(value.get('name'), str) and count is not None:
+                counts[tag_key(value['name'])] = max(count, counts.get(tag_key(value['name']), 0))
+            for v in value.values():
+                if isinstance(v, (list, dict)):
+                    visit(v)
+
+    visit(stats)
+    return counts
+
+
+class TagEntry:
+    __slots__ = ('id', 'name', 'key', 'count', 'grams')
+
+    def __init__(self, tag_id: Optional[int], name: str, count: int = 0):
+        self.id = tag_id
+        self.name = name
+        self.key = tag_key(name)
+        self.count = count
+        self.grams = bigrams(self.key)
+
+
+class TagValidation:
+    """标签校验结果：names 为规范化并去重后的标签；errors 非空时不应保存"""
+
+    __slots__ = ('names', 'new_tags', 'similar', 'errors')
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.new_tags: List[str] = []
+        self.similar: Dict[str, List[str]] = {}
+        self.errors: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def note(self) -> str:
+        """新标签与已有标签相近时的提示 (可能是拼写错误)"""
+        hints = [f"「{name}」(相近: {', '.join(similar)})" for name, similar in self.similar.items()]
+        return f" (新标签 {'；'.join(hints)})" if hints else ""
+
+
+class TagIndex:
+    """所有会话共享的标签内存索引，用于输入时的标签建议和保存前的标签校验
+
+    - 前缀匹配：标签中每个词的起始位置都作为一个键放入有序列表，用二分查找，
+      例如输入 "li" 可以匹配 "city lights"
+    - 模糊匹配：按 bigram 倒排索引取候选，用 Dice 系数打分，可容忍少量拼写错误
+    - 排序：前缀匹配优先，其次按使用次数 (来自 get_tag_stats)、名称长度
+
+    首次使用时从 get_all_tags / get_tag_stats 构建；超过 refresh_interval 秒后在后台重建，
+    期间继续使用旧索引。创建/删除标签和保存提示词时由调用方增量更新。
+    """
+
+    def __init__(self, refresh_interval: float = 300.0, max_length: int = 50):
+        self.refresh_interval = refresh_interval
+        self.max_length = max_length
+        self._entries: Dict[str, TagEntry] = {}
+        self._prefixes: List[Tuple[str, str]] = []
+        self._grams: Dict[str, Set[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+        # 后台重建期间的增量修改，重建完成后重放到新索引上
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.queries = 0
+
+    # ============ 构建与增量更新 ============
+    def _word_starts(self, key: str) -> List[str]:
+        starts = [key]
+        for match in WORD_BOUNDARY.finditer(key):
+            if match.end() < len(key):
+                starts.append(key[match.end():])
+        return starts
+
+    def _insert(self, entry: TagEntry):
+        self._entries[entry.key] = entry
+        for start in self._word_starts(entry.key):
+            bisect.insort(self._prefixes, (start, entry.key))
+        for gram in entry.grams:
+            self._grams.setdefault(gram, set()).add(entry.key)
+
+    def _delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for start in self._word_starts(key):
+            i = bisect.bisect_left(self._prefixes, (start, key))
+            if i < len(self._prefixes) and self._prefixes[i] == (start, key):
+                del self._prefixes[i]
+        for gram in entry.grams:
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def _apply(self, op: str, args: tuple):
+        if op == 'add':
+            tag_id, name, count_delta = args
+            entry = self._entries.get(tag_key(name))
+            if entry is None:
+                self._insert(TagEntry(tag_id, normalize_tag(name), max(0, count_delta)))
+            else:
+                entry.id = tag_id if tag_id is not None else entry.id
+                entry.count = max(0, entry.count + count_delta)
+        elif op == 'remove':
+            tag_id, name = args
+            key = tag_key(name) if name else next((e.key for e in self._entries.values() if e.id == tag_id), None)
+            if key is not None:
+                self._delete(key)
+
+    def _record(self, op: str, args: tuple):
+        self._apply(op, args)
+        if self._pending is not None:
+            self._pending.append((op, args))
+
+    def add(self, name: str, tag_id: Optional[int] = None, count_delta: int = 0):
+        """新增标签，已存在时更新ID并累加使用次数"""
+        if normalize_tag(name):
+            self._record('add', (tag_id, name, count_delta))
+
+    def remove(self, tag_id: Optional[int] = None, name: Optional[str] = None):
+        self._record('remove', (tag_id, name))
+
+    def record_usage(self, names: Iterable[str]):
+        """提示词保存成功后调用：新标签加入索引，已有标签的使用次数加一"""
+        for name in names:
+            self.add(name, count_delta=1)
+
+    def build(self, tags: List[Dict[str, Any]], counts: Dict[str, int]):
+        """用完整的标签列表重建索引"""
+        self._entries, self._prefixes, self._grams = {}, [], {}
+        entries = [TagEntry(t.get('id'), normalize_tag(t['name']),
+                            counts.get(tag_key(t['name']), usage_counts(t).get(tag_key(t['name']), 0)))
+                   for t in tags if isinstance(t, dict) and normalize_tag(t.get('name') or '')]
+        for entry in entries:
+            self._entries[entry.key] = entry
+            for gram in entry.grams:
+                self._grams.setdefault(gram, set()).add(entry.key)
+        self._prefixes = sorted((start, e.key) for e in self._entries.values() for start in self._word_starts(e.key))
+
+    async def refresh(self, client) -> bool:
+        self._pending = []
+        try:
+            tags, stats = await asyncio.gather(client.get_all_tags(), client.get_tag_stats())
+            if 'error' in tags:
+                self.last_error = tags['error']
+                return False
+            self.build(tags.get('data') or [], usage_counts(stats.get('data')) if 'error' not in stats else {})
+            for op, args in self._pending:
+                self._apply(op, args)
+            self.loaded_at = time.monotonic()
+            self.last_error = None
+            return True
+        finally:
+            self._pending = None
+
+    async def ensure_loaded(self, client):
+        """未加载时等待加载；超过 refresh_interval 时在后台重建，立即返回"""
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.refresh_interval:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.refresh(client))
+            self._task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        if self.loaded_at is None:
+            await asyncio.shield(self._task)
+
+    # ============ 查询 ============
+    def canonical(self, name: str) -> Optional[str]:
+        """已有标签的标准写法 (忽略大小写和全角/半角)，不存在时返回 None"""
+        entry = self._entries.get(tag_key(name))
+        return entry.name if entry else None
+
+    def _prefix_matches(self, key: str, cap: int) -> List[str]:
+        found: Dict[str, None] = {}
+        i = bisect.bisect_left(self._prefixes, (key, ''))
+        while i < len(self._prefixes) and len(found) < cap:
+            start, tag = self._prefixes[i]
+            if not start.startswith(key):
+                break
+            found[tag] = None
+            i += 1
+        return list(found)
+
+    def _fuzzy_matches(self, key: str, exclude: Set[str]) -> List[Tuple[float, str]]:
+        grams = bigrams(key)
+        hits = Counter()
+        for gram in grams:
+            hits.update(self._grams.get(gram, ()))
+        # Dice 系数不超过 2s/(g+s)，共享 bigram 数 s 小于 g*t/(2-t) 的候选不可能达到最低相似度 t
+        least = len(grams) * FUZZY_MIN_SCORE / (2 - FUZZY_MIN_SCORE)
+        scored = []
+        entries = self._entries
+        for tag, shared in hits.items():
+            if shared < least or tag in exclude:
+                continue
+            score = 2 * shared / (len(grams) + len(entries[tag].grams))
+            if key in tag:
+                score = max(score, 0.9)
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((score, tag))
+        return scored
+
+    def suggest(self, fragment: str, limit: int = 8, exclude: Iterable[str] = ()) -> List[str]:
+        """按前缀和模糊匹配给出建议的标签名，exclude 为已经输入过的标签"""
+        key = tag_key(fragment)
+        if not key:
+            return []
+        self.queries += 1
+        skip = {tag_key(name) for name in exclude}
+        rank = lambda tag: (-self._entries[tag].count, len(tag), tag)
+        prefix = sorted((t for t in self._prefix_matches(key, limit * 20) if t not in skip), key=rank)[:limit]
+        result = prefix
+        if len(result) < limit:
+            fuzzy = self._fuzzy_matches(key, skip | set(prefix))
+            fuzzy.sort(key=lambda st: (-st[0],) + rank(st[1]))
+            result = prefix + [tag for _, tag in fuzzy[:limit - len(prefix)]]
+        return [self._entries[tag].name for tag in result]
+
+    def similar(self, name: str, limit: int = 3) -> List[str]:
+        """与 name 相近的已有标签 (用于提示可能的拼写错误)"""
+        key = tag_key(name)
+        scored = sorted(self._fuzzy_matches(key, {key}), key=lambda st: (-st[0], -self._entries[st[1]].count))
+        return [self._entries[tag].name for score, tag in scored[:limit] if score >= 0.6]
+
+    def validate(self, text: Any) -> TagValidation:
+        """规范化并校验 tag_names (逗号分隔的文本或列表)：统一为已有标签的写法、去重、检查长度"""
+        result = TagValidation()
+        parts = split_tag_names(','.join(text) if isinstance(text, (list, tuple)) else text)
+        seen: Set[str] = set()
+        for name in parts:
+            key = tag_key(name)
+            if key in seen:
+                continue
+            seen.add(key)
+            if len(name) > self.max_length:
+                result.errors.append(f"标签「{name[:20]}…」超过 {self.max_length} 个字符")
+                continue
+            canonical = self.canonical(name)
+            if canonical is None:
+                result.new_tags.append(name)
+                similar = self.similar(name)
+                if similar:
+                    result.similar[name] = similar
+            result.names.append(canonical or name)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {'tags': len(self._entries), 'prefix_keys': len(self._prefixes), 'bigrams': len(self._grams),
+                'loaded': self.loaded_at is not None, 'queries': self.queries, 'last_error': self.last_error}
@@ -0,0 +1,64 @@
+"""测试共用的桩服务和客户端
+
+config 在导入时读取环境变量，所以桩服务在收集测试之前启动，
+API_BASE_URL 指向桩服务，CACHE_DIR 指向临时目录，各测试之间不共享本地数据库以外的状态。
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_backend  # noqa: E402
+
+STUB = stub_backend.start_stub_backend(config=stub_backend.StubConfig(prompts=20, analyze_latency=0.0))
+STUB_URL = f"http://127.0.0.1:{STUB.server_address[1]}"
+
+os.environ.update({
+    'API_BASE_URL': STUB_URL,
+    'CACHE_DIR': tempfile.mkdtemp(prefix='imggen-tests-'),
+    'METRICS_PORT': '0',
+    'REQUEST_RETRIES': '0',
+    'SHARED_CACHE_ENABLED': 'False',
+    'UPLOAD_DEDUP_ENABLED': 'False',
+})
+
+
+@pytest.fixture
+def stub_state():
+    """桩服务的内存数据 (prompts / tags)，修改时需要持有 state.lock"""
+    return STUB.RequestHandlerClass.state
+
+
+@pytest.fixture
+def run():
+    """在新的事件循环中运行协程，结束时关闭客户端连接"""
+    clients = []
+
+    def runner(coro_fn):
+        async def main():
+            try:
+                return await coro_fn()
+            finally:
+                for client in clients:
+                    await client.aclose()
+        return asyncio.run(main())
+
+    runner.clients = clients
+    return runner
+
+
+@pytest.fixture
+def async_client(tmp_path, run):
+    """使用独立降级数据库的异步客户端"""
+    from api_client import AsyncAPIClient
+    from offline_store import OfflineStore, WriteReplayer
+
+    client = AsyncAPIClient()
+    client.offline = OfflineStore(str(tmp_path / 'offline.sqlite3'))
+    client.replayer = WriteReplayer(client.offline, client, interval=0.05)
+    run.clients.append(client)
+    return client
@@ -0,0 +1,72 @@
+from offline_store import DROPPED, FAILED, PENDING
+
+
+def outbox_states(store):
+    with store._lock:
+        return [row[0] for row in store.conn.execute("SELECT state FROM outbox ORDER BY seq")]
+
+
+def prompts_with_text(state, text):
+    with state.lock:
+        return [p for p in state.prompts.values() if p.get('prompt_text') == text]
+
+
+def test_replay_submits_queued_create(async_client, run, stub_state):
+    store = async_client.offline
+    store.enqueue('POST', '/prompts/', {'prompt_text': 'queued while offline', 'model_name': 'sdxl'}, 'down')
+
+    assert run(async_client.replayer.replay) == 1
+    assert len(prompts_with_text(stub_state, 'queued while offline')) == 1
+    assert store.pending_count() == 0
+    assert outbox_states(store) == []
+
+
+def test_replay_drops_create_that_already_applied(async_client, run, stub_state):
+    store = async_client.offline
+    body = {'prompt_text': 'timed out but stored', 'model_name': 'sdxl'}
+    with stub_state.lock:
+        stub_state.add_prompt(body)
+    store.enqueue('POST', '/prompts/', body, 'ReadTimeout', maybe_applied=True)
+
+    assert run(async_client.replayer.replay) == 0
+    assert async_client.replayer.dropped == 1
+    assert len(prompts_with_text(stub_state, 'timed out but stored')) == 1
+    assert outbox_states(store) == [DROPPED]
+    assert store.stats()['dropped_writes'] == 1
+
+
+def test_replay_without_maybe_applied_does_not_dedup(async_client, run, stub_state):
+    # 连接失败的请求没有到达后端，相同文本的提示词是用户有意重复创建的
+    store = async_client.offline
+    body = {'prompt_text': 'intentional duplicate', 'model_name': 'sdxl'}
+    with stub_state.lock:
+        stub_state.add_prompt(body)
+    store.enqueue('POST', '/prompts/', body, 'ConnectError')
+
+    assert run(async_client.replayer.replay) == 1
+    assert len(prompts_with_text(stub_state, 'intentional duplicate')) == 2
+
+
+def test_replay_keeps_order_and_treats_missing_delete_as_applied(async_client, run, stub_state):
+    store = async_client.offline
+    with stub_state.lock:
+        prompt_id = stub_state.add_prompt({'prompt_text': 'to update', 'model_name': 'sdxl'})['id']
+    store.enqueue('DELETE', '/prompts/999999', None, 'down', maybe_applied=True)
+    store.enqueue('PUT', f'/prompts/{prompt_id}', {'prompt_text': 'updated offline'}, 'down')
+    store.enqueue('PUT', '/prompts/999998', {'prompt_text': 'gone'}, 'down')
+
+    assert run(async_client.replayer.replay) == 2
+    with stub_state.lock:
+        assert stub_state.prompts[prompt_id]['prompt_text'] == 'updated offline'
+    assert outbox_states(store) == [FAILED]
+
+
+def test_maybe_applied_survives_retry(tmp_path):
+    from offline_store import OfflineStore
+
+    store = OfflineStore(str(tmp_path / 'offline.sqlite3'))
+    seq = store.enqueue('POST', '/prompts/', {'prompt_text': 'x'}, 'ReadTimeout', maybe_applied=True)['queue_seq']
+    store.retry_later(seq, 'ConnectError', maybe_applied=False)
+
+    assert store.next_pending() == (seq, 'POST', '/prompts/', {'prompt_text': 'x'}, True)
+    assert outbox_states(store) == [PENDING]
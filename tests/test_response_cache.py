@@ -0,0 +1,81 @@
+from response_cache import ResponseCache
+
+
+def test_set_skips_response_started_before_invalidation():
+    cache = ResponseCache(max_entries=8, ttl=60)
+    key = cache.make_key('/prompts/1')
+    generation = cache.generation
+    cache.invalidate(['/prompts/1'])
+
+    cache.set(key, {'data': 'old'}, generation)
+    assert cache.get(key) is None
+
+    cache.set(key, {'data': 'new'}, cache.generation)
+    assert cache.get(key) == {'data': 'new'}
+
+
+def test_invalidation_of_other_endpoints_also_bumps_generation():
+    cache = ResponseCache(max_entries=8, ttl=60)
+    key = cache.make_key('/prompts/', {'page': 1})
+    generation = cache.generation
+    cache.invalidate(['/tags/'])
+
+    cache.set(key, {'data': []}, generation)
+    assert cache.get(key) is None
+
+
+def test_invalidate_by_pattern_and_copy_on_read():
+    cache = ResponseCache(max_entries=8, ttl=60)
+    detail, listing = cache.make_key('/prompts/7'), cache.make_key('/prompts/', {'page': 1})
+    cache.set(detail, {'data': {'id': 7}})
+    cache.set(listing, {'data': [7]})
+
+    cache.get(listing)['data'].append(8)
+    assert cache.get(listing) == {'data': [7]}
+
+    assert cache.invalidate(pattern=r'/prompts/\d+') == 1
+    assert cache.get(detail) is None
+    assert cache.get(listing) == {'data': [7]}
+
+
+def test_client_does_not_cache_read_that_raced_a_write(async_client, run, stub_state):
+    with stub_state.lock:
+        prompt_id = stub_state.add_prompt({'prompt_text': 'before', 'model_name': 'sdxl'})['id']
+    send = async_client._send
+    raced = []
+
+    async def send_then_write(method, url, **kwargs):
+        result = await send(method, url, **kwargs)
+        # 读请求已经拿到旧数据、尚未写入缓存时，另一个写请求完成并失效缓存
+        if method == 'GET' and url.endswith(f'/prompts/{prompt_id}') and not raced:
+            raced.append(True)
+            await async_client.update_prompt(prompt_id, {'prompt_text': 'after'})
+        return result
+
+    async_client._send = send_then_write
+
+    async def scenario():
+        first = await async_client.get_prompt(prompt_id)
+        second = await async_client.get_prompt(prompt_id)
+        return first, second
+
+    first, second = run(scenario)
+    assert first['data']['prompt_text'] == 'before'
+    assert second['data']['prompt_text'] == 'after'
+
+
+def test_client_write_invalidates_cached_detail(async_client, run, stub_state):
+    with stub_state.lock:
+        prompt_id = stub_state.add_prompt({'prompt_text': 'v1', 'model_name': 'sdxl'})['id']
+
+    async def scenario():
+        await async_client.get_prompt(prompt_id)
+        with stub_state.lock:
+            stub_state.prompts[prompt_id]['prompt_text'] = 'changed behind the cache'
+        cached = await async_client.get_prompt(prompt_id)
+        await async_client.update_prompt(prompt_id, {'prompt_text': 'v2'})
+        return cached, await async_client.get_prompt(prompt_id)
+
+    cached, fresh = run(scenario)
+    assert cached['data']['prompt_text'] == 'v1'
+    assert fresh['data']['prompt_text'] == 'v2'
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_sync_callers_get_independent_copies():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = {}
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        return {'data': {'tags': ['cat']}}
+
+    def call(name):
+        results[name] = flights.do('key', fetch)
+
+    leader = threading.Thread(target=call, args=('leader',))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call, args=(f'follower{i}',)) for i in range(3)]
+    for thread in followers:
+        thread.start()
+    while flights.coalesced < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert results['leader'][1] is False
+    assert all(results[f'follower{i}'][1] for i in range(3))
+    values = [value for value, _ in results.values()]
+    values[0]['data']['tags'].append('dog')
+    assert all(value == {'data': {'tags': ['cat']}} for value in values[1:])
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_sync_single_caller_gets_result_without_copy():
+    flights = SingleFlight()
+    result = {'data': 1}
+    assert flights.do('key', lambda: result) == (result, False)
+    assert flights.do('key', lambda: result)[0] is result
+
+
+def test_sync_error_reaches_every_caller():
+    flights = SingleFlight()
+    try:
+        flights.do('key', lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    else:
+        raise AssertionError("expected ZeroDivisionError")
+    assert flights.do('key', lambda: 'ok') == ('ok', False)
+
+
+def test_async_callers_get_independent_copies():
+    flights = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return {'data': {'tags': ['cat']}}
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do('key', fetch) for _ in range(4)))
+
+    results = asyncio.run(scenario())
+    assert [shared for _, shared in results] == [False, True, True, True]
+    values = [value for value, _ in results]
+    values[0]['data']['tags'].append('dog')
+    assert all(value == {'data': {'tags': ['cat']}} for value in values[1:])
+    assert flights.executed == 1 and flights.coalesced == 3
+
+
+def test_async_cancelled_caller_does_not_cancel_others():
+    flights = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.do('key', fetch))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flights.do('key', fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == ('done', True)
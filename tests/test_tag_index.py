@@ -0,0 +1,43 @@
+from tag_index import TagIndex
+
+
+def build_index(counts):
+    index = TagIndex()
+    index.build([{'id': i, 'name': name} for i, name in enumerate(counts, 1)], counts)
+    return index
+
+
+def test_prefix_matches_rank_by_usage_then_length():
+    index = build_index({'cat': 3, 'catalog': 10, 'cathedral': 3, 'cats': 3, 'bobcat': 50})
+
+    assert index.suggest('cat', limit=4) == ['catalog', 'cat', 'cats', 'cathedral']
+
+
+def test_prefix_matches_come_before_fuzzy_matches():
+    index = build_index({'cat': 1, 'bobcat': 50, 'dog': 99})
+
+    assert index.suggest('cat', limit=5) == ['cat', 'bobcat']
+
+
+def test_word_start_counts_as_prefix_and_exclude_skips_entered_tags():
+    index = build_index({'night sky': 2, 'sky': 1, 'skyline': 5})
+
+    assert index.suggest('sky', limit=5) == ['skyline', 'night sky', 'sky']
+    assert index.suggest('sky', limit=5, exclude=['Skyline']) == ['night sky', 'sky']
+
+
+def test_usage_recorded_after_build_changes_order():
+    index = build_index({'cat': 1, 'cats': 2})
+    index.record_usage(['cat', 'cat', 'cathedral'])
+
+    assert index.suggest('cat') == ['cat', 'cats', 'cathedral']
+    assert index.canonical('CAT') == 'cat'
+
+
+def test_validate_uses_canonical_spelling_and_reports_new_tags():
+    index = build_index({'Cyberpunk': 4})
+    result = index.validate('cyberpunk, 新标签, CYBERPUNK')
+
+    assert result.names == ['Cyberpunk', '新标签']
+    assert result.new_tags == ['新标签']
+    assert not result.errors
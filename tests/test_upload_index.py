@@ -0,0 +1,72 @@
+import socket
+
+from upload_index import UploadIndex, sha256_file
+
+from conftest import STUB_URL
+
+
+def write_file(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_fresh_entry_is_used_without_verification(tmp_path):
+    index = UploadIndex(str(tmp_path / 'uploads.sqlite3'), 'http://127.0.0.1:9', verify_after=3600)
+    index.add('abc', '/uploads/missing.jpg', 10)
+
+    assert index.lookup('abc') == '/uploads/missing.jpg'
+    assert index.stats()['stale_evictions'] == 0
+
+
+def test_stale_entry_removed_when_backend_file_is_gone(tmp_path):
+    index = UploadIndex(str(tmp_path / 'uploads.sqlite3'), STUB_URL, verify_after=0)
+    # 桩服务对 /uploads/ 以外的路径返回 404
+    index.add('gone', '/missing/file.jpg', 10)
+    index.add('live', '/uploads/stub_1.jpg', 10)
+
+    assert index.lookup('gone') is None
+    assert index.lookup('live') == '/uploads/stub_1.jpg'
+    stats = index.stats()
+    assert stats['stale_evictions'] == 1
+    assert stats['entries'] == 1
+
+
+def test_stale_entry_kept_when_backend_unreachable(tmp_path):
+    index = UploadIndex(str(tmp_path / 'uploads.sqlite3'), f'http://127.0.0.1:{unused_port()}', verify_after=0)
+    index.add('abc', '/uploads/x.jpg', 10)
+
+    assert index.lookup('abc') == '/uploads/x.jpg'
+    assert index.stats()['stale_evictions'] == 0
+
+
+def test_plan_uploads_unknown_and_repeated_files_once(tmp_path):
+    index = UploadIndex(str(tmp_path / 'uploads.sqlite3'), STUB_URL, verify_after=3600)
+    known = write_file(tmp_path, 'known.jpg', b'known')
+    new = write_file(tmp_path, 'new.jpg', b'new')
+    copy = write_file(tmp_path, 'copy.jpg', b'new')
+    index.add(sha256_file(known), '/uploads/known.jpg', 5)
+
+    plan = index.plan([('input_images', known), ('input_images', new), ('input_images', copy)])
+
+    assert not plan.all_known
+    assert plan.repeated == [3]
+    assert plan.reference_fields == {'input_image_urls': ['/uploads/known.jpg']}
+    assert plan.upload_files_paths == {'input_images': [new]}
+
+
+def test_plan_detects_backend_that_ignored_references(tmp_path):
+    index = UploadIndex(str(tmp_path / 'uploads.sqlite3'), STUB_URL, verify_after=3600)
+    known = write_file(tmp_path, 'known.jpg', b'known')
+    index.add(sha256_file(known), '/uploads/known.jpg', 5)
+    plan = index.plan([('input_images', known)])
+
+    assert plan.references_dropped({'success': True, 'data': {'id': 1, 'input_image_urls': []}})
+    assert not plan.references_dropped({'success': True, 'data': {'id': 1, 'input_image_urls': ['/uploads/known.jpg']}})
+    assert not plan.references_dropped({'error': 'bad request', 'status_code': 400})
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from lazy_imports import lazy_import
+
+httpx = lazy_import('httpx')
+
+# 最近这么多秒内返回过的缩略图不淘汰，Gradio 可能还没有读取该文件
+EVICT_GRACE = 30.0
+# 缩略图的 JPEG 质量；修改缩略图的尺寸或编码参数后，旧的缩略图不再命中
+JPEG_QUALITY = 85
+
+
+def absolute_upload_url(uploads_url: str, url: str) -> str:
+    """后端返回的 /uploads/a.jpg 拼接到 uploads_url 上，完整URL原样返回"""
+    if url.startswith(('http://', 'https://')):
+        return url
+    path = url.lstrip('/')
+    if path.startswith('uploads/'):
+        path = path[len('uploads/'):]
+    return f"{uploads_url}/{path}"
+
+
+def make_thumbnail(content: bytes, out_base: str, size: int) -> str:
+    """把原图缩放到 size x size 以内并保存，带透明通道的保存为 PNG，其余为 JPEG；返回文件路径"""
+    from io import BytesIO
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(content)) as img:
+        # JPEG 可以在解码时直接按比例缩小，大图只解码所需的分辨率
+        img.draft('RGB', (size, size))
+        work = ImageOps.exif_transpose(img)
+        work.thumbnail((size, size), Image.LANCZOS)
+        if work.mode in ('RGBA', 'LA') or (work.mode == 'P' and 'transparency' in work.info):
+            path = out_base + '.png'
+            work.save(path, format='PNG', optimize=True)
+        else:
+            path = out_base + '.jpg'
+            work.convert('RGB').save(path, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return path
+
+
+class ThumbnailCache:
+    """通过 HTTP 获取后端上传的图片并生成缩略图，缩略图保存在磁盘上并按总大小做 LRU 淘汰
+
+    缩略图超过 revalidate_after 秒后用 ETag / Last-Modified 发送条件请求，
+    后端返回 304 时沿用已有缩略图；后端不可用时返回旧缩略图。
+    索引键包含尺寸和编码参数 (variant)，修改 THUMBNAIL_SIZE 后按新尺寸重新生成，旧尺寸的缩略图随 LRU 淘汰。
+    淘汰跳过最近返回过的缩略图，总大小可能暂时超过 max_bytes。
+    """
+
+    def __init__(self, directory: str, uploads_url: str, size: int = 256, max_bytes: int = 100 * 1024 * 1024,
+                 revalidate_after: float = 300.0, concurrency: int = 4, timeout: float = 30.0):
+        self.directory = os.path.abspath(directory)
+        self.uploads_url = uploads_url.rstrip('/')
+        self.size = size
+        self.variant = f"{size}px-q{JPEG_QUALITY}"
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.hits = 0
+        self.not_modified = 0
+        self.downloads = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS thumbnails (
+                    url TEXT PRIMARY KEY,  -- 图片URL#尺寸和编码参数
+                    path TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER NOT NULL,
+                    validated_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_thumbnails_last_access ON thumbnails (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout,
+                                             limits=httpx.Limits(max_connections=self.concurrency))
+        return self._client
+
+    def absolute_url(self, url: str) -> str:
+        return absolute_upload_url(self.uploads_url, url)
+
+    def _key(self, url: str) -> str:
+        return f"{url}#{self.variant}"
+
+    def _entry(self, key: str) -> Optional[Tuple[str, Optional[str], Optional[str], float]]:
+        with self._lock:
+            row = self.conn.execute("SELECT path, etag, last_modified, validated_at FROM thumbnails WHERE url = ?",
+                                    (key,)).fetchone()
+        if row is not None and not os.path.exists(row[0]):
+            return None
+        return row
+
+    def _touch(self, key: str, validated: bool):
+        now = time.time()
+        with self._lock:
+            if validated:
+                self.conn.execute("UPDATE thumbnails SET last_access = ?, validated_at = ? WHERE url = ?",
+                                  (now, now, key))
+            else:
+                self.conn.execute("UPDATE thumbnails SET last_access = ? WHERE url = ?", (now, key))
+            self.conn.commit()
+
+    def _store(self, key: str, content: bytes, etag: Optional[str], last_modified: Optional[str]) -> str:
+        """生成缩略图并写入索引，随后按总大小淘汰最久未访问的缩略图；在线程中执行"""
+        base = os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        path = make_thumbnail(content, base, self.size)
+        now = time.time()
+        with self._lock:
+            old = self.conn.execute("SELECT path FROM thumbnails WHERE url = ?", (key,)).fetchone()
+            if old is not None and old[0] != path and os.path.exists(old[0]):
+                os.remove(old[0])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (url, path, etag, last_modified, size, validated_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, path, etag, last_modified, os.path.getsize(path), now, now))
+            self._evict(keep=key)
+            self.conn.commit()
+        return path
+
+    def _evict(self, keep: str):
+        """总大小超过上限时删除最久未访问的缩略图；刚写入的 keep 和 EVICT_GRACE 秒内返回过的缩略图除外"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, path, size in self.conn.execute(
+                "SELECT url, path, size FROM thumbnails WHERE url != ? AND last_access < ? ORDER BY last_access ASC",
+                (keep, time.time() - EVICT_GRACE)).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM thumbnails WHERE url = ?", (url,))
+            if os.path.exists(path):
+                os.remove(path)
+            total -= size
+            self.evictions += 1
+
+    async def get(self, url: str) -> Optional[str]:
+        """返回 url 对应图片的本地缩略图路径；无法获取时返回 None"""
+        if not url:
+            return None
+        loop = asyncio.get_running_loop()
+        key = self._key(url)
+        entry = await loop.run_in_executor(None, self._entry, key)
+        if entry is not None and time.time() - entry[3] < self.revalidate_after:
+            self.hits += 1
+            await loop.run_in_executor(None, self._touch, key, False)
+            return entry[0]
+
+        headers = {}
+        if entry is not None:
+            if entry[1]:
+                headers['If-None-Match'] = entry[1]
+            if entry[2]:
+                headers['If-Modified-Since'] = entry[2]
+        try:
+            response = await self.client.get(self.absolute_url(url), headers=headers)
+            if response.status_code == 304 and entry is not None:
+                self.not_modified += 1
+                await loop.run_in_executor(None, self._touch, key, True)
+                return entry[0]
+            response.raise_for_status()
+            self.downloads += 1
+            self.bytes_downloaded += len(response.content)
+            return await loop.run_in_executor(None, self._store, key, response.content,
+                                              response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        except Exception:
+            # 网络错误、非图片内容等：有旧缩略图时继续使用
+            self.errors += 1
+            return entry[0] if entry is not None else None
+
+    async def get_many(self, urls: List[str]) -> List[Optional[str]]:
+        """并发获取多张图片的缩略图，结果顺序与 urls 一致"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(url: str):
+            async with semaphore:
+                return await self.get(url)
+
+        return list(await asyncio.gather(*(fetch(u) for u in urls)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM thumbnails").fetchone()
+        return {'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                'not_modified': self.not_modified, 'downloads': self.downloads,
+                'bytes_downloaded': self.bytes_downloaded, 'evictions': self.evictions, 'errors': self.errors}
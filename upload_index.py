@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from lazy_imports import lazy_import
+
+requests = lazy_import('requests')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """分块计算文件的 SHA-256，内存占用与文件大小无关"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadIndex:
+    """持久化的 内容哈希 -> 后端上传URL 索引，重复的图片直接引用已上传的URL
+
+    条目超过 verify_after 秒未校验时，用 HEAD 请求确认后端文件仍然存在，
+    不存在 (404/410) 则删除该条目并重新上传；后端无法访问时保留条目。
+    """
+
+    def __init__(self, db_path: str, files_base_url: str, verify_after: float = 3600.0):
+        self.db_path = db_path
+        self.files_base_url = files_base_url.rstrip('/')
+        self.verify_after = verify_after
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._session: Optional[requests.Session] = None
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_avoided = 0
+        self.stale_evictions = 0
+        # 后端创建响应中没有保存引用的URL时置为 True，本进程之后的上传不再按URL引用
+        self.references_ignored = False
+        self.fallbacks = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS uploads (
+                    hash TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    verified_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )""")
+            self._conn.commit()
+        return self._conn
+
+    def _is_stale(self, url: str) -> bool:
+        if self._session is None:
+            self._session = requests.Session()
+        try:
+            response = self._session.head(f"{self.files_base_url}{url}", timeout=5)
+        except requests.exceptions.RequestException:
+            return False
+        return response.status_code in (404, 410)
+
+    def lookup(self, content_hash: str) -> Optional[str]:
+        """返回已上传的URL；条目需要校验时发送 HEAD 请求，过期条目会被删除"""
+        with self._lock:
+            self.lookups += 1
+            row = self.conn.execute("SELECT url, verified_at FROM uploads WHERE hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            return None
+        url, verified_at = row
+        now = time.time()
+        if now - verified_at > self.verify_after:
+            if self._is_stale(url):
+                with self._lock:
+                    self.conn.execute("DELETE FROM uploads WHERE hash = ?", (content_hash,))
+                    self.conn.commit()
+                    self.stale_evictions += 1
+                return None
+            with self._lock:
+                self.conn.execute("UPDATE uploads SET verified_at = ? WHERE hash = ?", (now, content_hash))
+                self.conn.commit()
+        return url
+
+    def record_hit(self, content_hash: str, size: int):
+        with self._lock:
+            self.hits += 1
+            self.bytes_avoided += size
+            self.conn.execute("UPDATE uploads SET hits = hits + 1 WHERE hash = ?", (content_hash,))
+            self.conn.commit()
+
+    def add(self, content_hash: str, url: str, size: int):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploads (hash, url, size, created_at, verified_at, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (content_hash, url, size, now, now))
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_hits = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM uploads").fetchone()
+            return {'entries': entries, 'lookups': self.lookups, 'hits': self.hits,
+                    'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                    'bytes_avoided': self.bytes_avoided, 'stale_evictions': self.stale_evictions,
+                    'lifetime_hits': total_hits, 'fallbacks': self.fallbacks,
+                    'references_ignored': self.references_ignored}
+
+    def plan(self, upload_fields: List[Tuple[str, str]]) -> 'UploadPlan':
+        """计算每个待上传文件 (表单字段, 路径) 的哈希，拆分为需要上传的文件和可直接引用的URL
+
+        同一个请求中内容相同的参考图只保留第一张，不会在 multipart 请求体中重复发送。
+        """
+        items, repeated, seen = [], [], set()
+        for field, path in upload_fields:
+            content_hash = sha256_file(path)
+            size = os.path.getsize(path)
+            if field == 'input_images':
+                if content_hash in seen:
+                    repeated.append(size)
+                    continue
+                seen.add(content_hash)
+            items.append((field, path, content_hash, size, self.lookup(content_hash)))
+        return UploadPlan(self, items, repeated)
+
+
+class UploadPlan:
+    """一次上传的去重计划：known 的文件以URL引用，其余文件正常上传"""
+
+    def __init__(self, index: UploadIndex, items: List[Tuple[str, str, str, int, Optional[str]]],
+                 repeated: Optional[List[int]] = None):
+        # items: (表单字段, 文件路径, 内容哈希, 文件大小, 已知URL或None)；repeated: 请求内重复参考图的大小
+        self.index = index
+        self.items = items
+        self.repeated = repeated or []
+
+    @property
+    def all_known(self) -> bool:
+        return all(url for *_, url in self.items)
+
+    @property
+    def upload_files_paths(self) -> Dict:
+        """仍需上传的文件，格式与 upload_and_create_prompt_multi 的 files_paths 相同"""
+        files_paths: Dict[str, Any] = {'input_images': []}
+        for field, path, _, _, url in self.items:
+            if url:
+                continue
+            if field == 'input_images':
+                files_paths['input_images'].append(path)
+            else:
+                files_paths[field] = path
+        return files_paths
+
+    @property
+    def reference_fields(self) -> Dict[str, Any]:
+        """已上传文件的URL字段，随创建请求一起发送给后端"""
+        fields: Dict[str, Any] = {}
+        input_urls = [url for field, *_, url in self.items if field == 'input_images' and url]
+        if input_urls:
+            fields['input_image_urls'] = input_urls
+        for field, *_, url in self.items:
+            if field == 'output_image' and url:
+                fields['output_image_url'] = url
+        return fields
+
+    def references_dropped(self, result: Dict[str, Any]) -> bool:
+        """创建成功但响应中缺少引用的URL，说明后端没有保存 input_image_urls / output_image_url"""
+        if 'error' in result or not isinstance(result.get('data'), dict):
+            return False
+        data = result['data']
+        saved_inputs = set(data.get('input_image_urls') or [])
+        for field, *_, url in self.items:
+            if not url:
+                continue
+            if field == 'output_image' and data.get('output_image_url') != url:
+                return True
+            if field == 'input_images' and url not in saved_inputs:
+                return True
+        return False
+
+    def record(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """上传成功后把新文件的URL写入索引，并在响应中附带去重统计 (键 'dedup')"""
+        if 'error' in result:
+            return result
+        data = result.get('data') if isinstance(result.get('data'), dict) else {}
+        known_urls = {url for *_, url in self.items if url}
+        output_url = data.get('output_image_url')
+        new_input_urls = [u for u in (data.get('input_image_urls') or []) if u and u not in known_urls]
+        new_inputs = [(h, size) for field, _, h, size, url in self.items if field == 'input_images' and not url]
+        for field, _, content_hash, size, url in self.items:
+            if url:
+                self.index.record_hit(content_hash, size)
+            elif field == 'output_image' and output_url:
+                self.index.add(content_hash, output_url, size)
+        # 后端返回的新参考图URL与上传顺序一一对应时才记录，避免错配
+        if len(new_input_urls) == len(new_inputs):
+            for (content_hash, size), url in zip(new_inputs, new_input_urls):
+                self.index.add(content_hash, url, size)
+        reused_sizes = [size for *_, size, url in self.items if url]
+        result['dedup'] = {'reused_files': len(reused_sizes), 'uploaded_files': len(self.items) - len(reused_sizes),
+                           'repeated_files': len(self.repeated),
+                           'bytes_avoided': sum(reused_sizes) + sum(self.repeated)}
+        return result